@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional
+
+import create_topor
+import kicad_parse
+
+
+@dataclass
+class BatchResult:
+    filename: str
+    output: str
+    duration: float
+    error: Optional[str] = None
+    log: str = ''
+
+
+def find_boards(patterns: List[str]) -> List[str]:
+    """
+    expands files, directories and glob patterns to kicad pcb files, largest files go first
+    :param patterns: file names, directory names or glob patterns
+    :return: list of unique file names
+    """
+    found: List[str] = list()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in ('*.kicad_pcb', '*.kicad_pcb.gz', '*.kicad_pcb.xz'):
+                found.extend(glob.glob(os.path.join(pattern, '**', extension), recursive=True))
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+            if not matches:
+                print('No boards found for %s' % pattern)
+            found.extend(match for match in matches if os.path.isfile(match))
+    boards = list(dict.fromkeys(os.path.normpath(filename) for filename in found))
+    return sorted(boards, key=lambda filename: (-os.path.getsize(filename), filename))
+
+
+def get_outputs(boards: List[str], output_dir: Optional[str]) -> List[str]:
+    """
+    gets fst file names, boards with equal names in output directory get number suffixes
+    :param boards: kicad pcb file names
+    :param output_dir: directory for fst files, files are written next to boards if not set
+    :return: fst file names in order of boards
+    """
+    if not output_dir:
+        return [kicad_parse.get_output_name(board) for board in boards]
+    outputs: List[str] = list()
+    used = set()
+    for board in boards:
+        name = os.path.splitext(os.path.basename(kicad_parse.get_output_name(board)))[0]
+        output = os.path.join(output_dir, name + '.fst')
+        count = 2
+        while output in used:
+            output = os.path.join(output_dir, '%s-%i.fst' % (name, count))
+            count += 1
+        used.add(output)
+        outputs.append(output)
+    return outputs
+
+
+def convert(filename: str, output: str, config: str, engine: str, writer: str,
+            cache_dir: Optional[str] = None) -> BatchResult:
+    """
+    converts one board catching its errors and output, runs in worker process
+    :param filename: kicad pcb file name
+    :param output: fst file name
+    :param config: config file name
+    :param engine: s-expression parser
+    :param writer: xml output engine
+    :param cache_dir: directory for cache of parsed boards
+    :return: result with time, error and printed messages
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    error = None
+    with contextlib.redirect_stdout(log):
+        try:
+            kicad_parse.main(filename, engine, writer, output, config, dump=None, cache_dir=cache_dir)
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+    return BatchResult(filename=filename, output=output, duration=time.perf_counter() - start, error=error,
+                       log=log.getvalue())
+
+
+def run_batch(patterns: List[str], output_dir: Optional[str] = None, config: str = 'config,ini', workers: int = 0,
+              engine: str = 'sexpr', writer: str = 'stream', verbose: bool = False,
+              cache_dir: Optional[str] = None) -> List[BatchResult]:
+    """
+    converts boards in process pool, largest boards are scheduled first, failed boards do not stop the batch
+    :param patterns: file names, directory names or glob patterns
+    :param output_dir: directory for fst files, files are written next to boards if not set
+    :param config: config file name
+    :param workers: number of worker processes, number of cpus if not set
+    :param engine: s-expression parser
+    :param writer: xml output engine
+    :param verbose: print messages of converter for every board
+    :param cache_dir: directory for cache of parsed boards, boards are not cached if not set
+    :return: results in order of completion, boards of killed workers are recorded as failed
+    """
+    boards = find_boards(patterns)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    config = os.path.abspath(config)
+    results: List[BatchResult] = list()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        futures = {executor.submit(convert, board, output, config, engine, writer, cache_dir): (board, output)
+                   for board, output in zip(boards, get_outputs(boards, output_dir))}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # worker process died, BrokenProcessPool fails this board and boards not finished yet
+                board, output = futures[future]
+                result = BatchResult(filename=board, output=output, duration=time.perf_counter() - start,
+                                     error='%s: %s' % (type(e).__name__, e))
+            results.append(result)
+            status = 'FAILED %s' % result.error if result.error else 'ok'
+            print('%8.2f s  %s -> %s  %s' % (result.duration, result.filename, result.output, status))
+            if verbose and result.log:
+                print(result.log, end='')
+    failed = [result for result in results if result.error]
+    print('Converted %i of %i boards in %.2f s' % (len(results) - len(failed), len(results),
+                                                   time.perf_counter() - start))
+    for result in failed:
+        print('Failed %s: %s' % (result.filename, result.error))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts many KiCad pcb files to TopoR fst files in parallel')
+    parser.add_argument('boards', nargs='+', help='KiCad pcb files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir', help='directory for fst files, files are written next to boards '
+                                                   'by default')
+    parser.add_argument('-j', '--workers', type=int, default=0, help='number of worker processes, cpu count '
+                                                                     'by default')
+    parser.add_argument('--config', default='config,ini', help='config filename')
+    parser.add_argument('--engine', choices=kicad_parse.engines, default='sexpr', help='s-expression parser')
+    parser.add_argument('--writer', choices=create_topor.writers, default='stream', help='xml output engine')
+    parser.add_argument('--cache-dir', help='directory to cache parsed boards')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print converter messages for every board')
+    args = parser.parse_args()
+    batch_results = run_batch(args.boards, args.output_dir, args.config, args.workers, args.engine, args.writer,
+                              args.verbose, args.cache_dir)
+    sys.exit(1 if any(result.error for result in batch_results) else 0)
@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import warnings
+from dataclasses import asdict
+from typing import Callable, Tuple, Any, Dict
+
+from pyparsing import OneOrMore, nestedExpr
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import board_generator
+import create_topor
+import kicad_parse
+import pcb_compact
+import profiler
+import sexpr
+
+
+def measure(func: Callable[[], Any]) -> Tuple[float, int, Any]:
+    """
+    runs function measuring time and then peak memory, as tracing slows the run down
+    :param func: function to run
+    :return: time in seconds, peak memory in bytes and function result
+    """
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak, result
+
+
+def compare_parsers(modules: int):
+    """
+    compares pyparsing and sexpr parsers on synthetic board
+    :param modules: number of modules in synthetic board
+    :return:
+    """
+    text = board_generator.synthetic_board(modules)
+    with warnings.catch_warnings():
+        # camel case names of pyparsing are deprecated in its new versions
+        warnings.simplefilter('ignore', DeprecationWarning)
+        pp_time, pp_peak, pp_result = measure(lambda: OneOrMore(nestedExpr()).parseString(text).asList())
+    s_time, s_peak, s_result = measure(lambda: sexpr.parse(io.StringIO(text)))
+    if pp_result != s_result:
+        print('Parsers results differ for %i modules' % modules)
+    print('%7i modules %7.1f MB: pyparsing %7.2f s %8.1f MB, sexpr %7.2f s %8.1f MB, speedup %.1f'
+          % (modules, len(text) / 1e6, pp_time, pp_peak / 1e6, s_time, s_peak / 1e6, pp_time / s_time))
+
+
+def retained_memory(func: Callable[[], Any]) -> Tuple[int, Any]:
+    """
+    runs function and measures memory kept by its result
+    :param func: function to run
+    :return: size in bytes and function result
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def compare_models(modules: int):
+    """
+    compares memory of pcb_structure dataclasses and pcb_compact model on synthetic board
+    :param modules: number of modules in synthetic board
+    :return:
+    """
+    text = board_generator.synthetic_board(modules)
+
+    def create_pcb():
+        return kicad_parse.create_pcb(kicad_parse.list_to_dict(sexpr.parse(io.StringIO(text))[0]))
+
+    pcb_size, pcb = retained_memory(lambda: create_pcb().view())
+    del pcb
+    compact_size, compact = retained_memory(create_pcb)
+    print('%7i modules: dataclasses %8.1f MB, compact %8.1f MB, reduction %.1f'
+          % (modules, pcb_size / 1e6, compact_size / 1e6, pcb_size / compact_size))
+
+
+def get_peak_memory() -> int:
+    """
+    gets peak resident memory of this process
+    :return: size in bytes, 0 if not known
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def writer_run(pcb: pcb_compact.CompactPCB, writer: str, results: multiprocessing.Queue):
+    """
+    writes pcb in fresh process measuring time and growth of peak resident memory
+    :param pcb: pcb to write
+    :param writer: tree or stream
+    :param results: queue to put time and memory growth, growth is 0 where resource module is missing
+    :return:
+    """
+    gc.collect()
+    before = get_peak_memory()
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        create_topor.create_topor(os.path.join(folder, 'board'), pcb, {}, writer)
+        duration = time.perf_counter() - start
+    results.put((duration, get_peak_memory() - before))
+
+
+def compare_writers(modules: int):
+    """
+    compares tree and stream xml writers on synthetic board
+    :param modules: number of modules in synthetic board
+    :return:
+    """
+    data = sexpr.parse(io.StringIO(board_generator.synthetic_board(modules)))
+    pcb = kicad_parse.create_pcb(kicad_parse.list_to_dict(data[0]))
+    context = multiprocessing.get_context('spawn')
+    line = '%7i modules:' % modules
+    for writer in create_topor.writers:
+        results = context.Queue()
+        process = context.Process(target=writer_run, args=(pcb, writer, results))
+        process.start()
+        duration, memory = results.get()
+        process.join()
+        line += ' %s %6.2f s %8.1f MB' % (writer, duration, memory / 1e6)
+    print(line)
+
+
+def compare_projection(spec: board_generator.BoardSpec):
+    """
+    compares parsing of synthetic board with and without unused subtrees
+    :param spec: board scale, zones and fabrication lines make the difference
+    :return:
+    """
+    text = board_generator.generate_board(spec)
+
+    def parse(skip_unused: bool):
+        if skip_unused:
+            data = sexpr.parse(io.StringIO(text), skip_tags=kicad_parse.unused_tags,
+                                skip_checks=kicad_parse.unused_checks)
+        else:
+            data = sexpr.parse(io.StringIO(text))
+        return kicad_parse.list_to_dict(data[0])
+
+    full_time, full_peak, _ = measure(lambda: parse(False))
+    skip_time, skip_peak, _ = measure(lambda: parse(True))
+    print('%7i modules %7.1f MB: full %7.2f s %8.1f MB, skip unused %7.2f s %8.1f MB, speedup %.1f, memory %.1f'
+          % (spec.modules, len(text) / 1e6, full_time, full_peak / 1e6, skip_time, skip_peak / 1e6,
+             full_time / skip_time, full_peak / skip_peak))
+
+
+def run_stages(text: str, writer: str, memory: bool) -> profiler.Profiler:
+    """
+    converts board text recording every stage
+    :param text: text of pcb file
+    :param writer: xml output engine
+    :param memory: trace memory, tracing slows stages down
+    :return: profiler with stages
+    """
+    stages = profiler.Profiler(memory)
+    try:
+        with stages.stage('tokenize') as counts:
+            counts['tokens'] = sum(1 for _ in sexpr.tokenize(io.StringIO(text)))
+        with stages.stage('parse'):
+            data = sexpr.parse(io.StringIO(text))
+        with stages.stage('list_to_dict'):
+            data = kicad_parse.list_to_dict(data[0])
+        with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as folder:
+            pcb = kicad_parse.create_pcb(data, stages)
+            del data
+            create_topor.create_topor(os.path.join(folder, 'board'), pcb, {}, writer, profiler=stages)
+    finally:
+        stages.close()
+    return stages
+
+
+def profile_stages(spec: board_generator.BoardSpec, writer: str = 'stream') -> Dict[str, Any]:
+    """
+    times every stage of conversion of synthetic board and then measures their memory in second run
+    :param spec: board scale
+    :param writer: xml output engine
+    :return: machine readable results with board scale and stages
+    """
+    text = board_generator.generate_board(spec)
+    timed = run_stages(text, writer, memory=False)
+    traced = run_stages(text, writer, memory=True)
+    stages = timed.to_json()
+    for stage, traced_stage in zip(stages, traced.stages):
+        stage['peak'] = traced_stage.peak
+        stage['allocated'] = traced_stage.allocated
+    return {'board': asdict(spec), 'writer': writer, 'file_size': len(text.encode()),
+            'python': platform.python_version(), 'time': time.time(), 'stages': stages}
+
+
+def print_stages(result: Dict[str, Any]):
+    """
+    prints stages results as table
+    :param result: results of profile_stages
+    :return:
+    """
+    print('%i modules, %.1f MB, %s writer' % (result['board']['modules'], result['file_size'] / 1e6, result['writer']))
+    for stage in result['stages']:
+        counts = ' '.join('%s=%i' % item for item in stage['counts'].items())
+        print('  %-40s %8.3f s %8.3f s cpu %8.1f MB peak  %s' % ('  ' * stage['depth'] + stage['name'], stage['wall'],
+                                                                stage['cpu'], stage['peak'] / 1e6, counts))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks converter on synthetic boards')
+    parser.add_argument('sizes', nargs='*', type=int, default=[100, 500], help='numbers of modules')
+    parser.add_argument('--models', action='store_true', help='compare memory of pcb models instead of parsers')
+    parser.add_argument('--writers', action='store_true', help='compare xml writers instead of parsers')
+    parser.add_argument('--stages', action='store_true', help='profile conversion stages instead of parsers')
+    parser.add_argument('--skip-unused', action='store_true',
+                        help='compare parsing with and without unused subtrees instead of parsers')
+    parser.add_argument('--writer', choices=create_topor.writers, default='stream', help='xml writer for stages')
+    parser.add_argument('--json', help='file to write stages results, list of results for every size')
+    board_generator.add_spec_arguments(parser)
+    args = parser.parse_args()
+    results = list()
+    for size in args.sizes:
+        if args.stages:
+            results.append(profile_stages(board_generator.get_spec(args, size), args.writer))
+            print_stages(results[-1])
+        elif args.skip_unused:
+            compare_projection(board_generator.get_spec(args, size))
+        elif args.models:
+            compare_models(size)
+        elif args.writers:
+            compare_writers(size)
+        else:
+            compare_parsers(size)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
@@ -0,0 +1,198 @@
+import argparse
+import math
+from dataclasses import dataclass, fields
+from typing import List, Optional
+
+
+@dataclass
+class BoardSpec:
+    modules: int = 100
+    pads: int = 8
+    nets: Optional[int] = None
+    segments: int = 10
+    vias: int = 1
+    arcs: int = 0
+    polys: int = 0
+    poly_points: int = 8
+    zones: int = 0
+    zone_points: int = 64
+    fab: int = 0
+
+    @property
+    def net_count(self) -> int:
+        return self.modules if self.nets is None else self.nets
+
+
+def get_pad_net(spec: BoardSpec, module: int, pad: int) -> int:
+    """
+    gets net of pad, first pads of modules get first nets, other pads get nets left after them
+    :param spec: board scale
+    :param module: number of module from 1
+    :param pad: number of pad from 1
+    :return: number of net from 1 or 0 for unconnected pad
+    """
+    net = (pad - 1) * spec.modules + module
+    if net <= spec.net_count:
+        return net
+    if pad == 1 and spec.net_count:
+        return (module - 1) % spec.net_count + 1
+    return 0
+
+
+def get_net_name(spec: BoardSpec, net: int) -> str:
+    """
+    gets name of net after the pad it was made for
+    :param spec: board scale
+    :param net: number of net from 1
+    :return: net name
+    """
+    return 'Net-(U%i-Pad%i)' % ((net - 1) % spec.modules + 1, (net - 1) // spec.modules + 1)
+
+
+def get_circle_points(x: float, y: float, radius: float, count: int) -> str:
+    """
+    gets kicad pts of polygon approximating circle
+    :param x: center x
+    :param y: center y
+    :param radius: radius
+    :param count: number of points
+    :return: pts expression
+    """
+    points = ' '.join('(xy %.4f %.4f)' % (x + radius * math.cos(2 * math.pi * i / count),
+                                          y + radius * math.sin(2 * math.pi * i / count)) for i in range(count))
+    return '(pts %s)' % points
+
+
+def generate_board(spec: BoardSpec) -> str:
+    """
+    creates text of kicad pcb file with given number of elements
+    :param spec: board scale
+    :return: text of pcb file
+    """
+    lines: List[str] = ['(kicad_pcb (version 20171130) (host pcbnew 5.1.4)',
+                        '  (layers', '    (0 F.Cu signal)', '    (31 B.Cu signal)', '    (37 F.SilkS user)',
+                        '    (44 Edge.Cuts user)', '  )',
+                        '  (net 0 "")']
+    nets = spec.net_count
+    for i in range(1, nets + 1):
+        lines.append('  (net %i "%s")' % (i, get_net_name(spec, i)))
+    lines.append('  (net_class Default "This is the default net class."')
+    lines.append('    (clearance 0.2) (trace_width 0.25) (via_dia 0.8) (via_drill 0.4)')
+    lines.extend('    (add_net "%s")' % get_net_name(spec, i) for i in range(1, nets + 1))
+    lines.append('  )')
+    for i in range(1, spec.modules + 1):
+        x, y = 10 + (i % 50) * 5, 10 + (i // 50) * 5
+        lines.append('  (module Package_SO:SOIC-8 (layer F.Cu) (tedit 5A02F2D3) (tstamp 5D3AE0%02X)' % (i % 256))
+        lines.append('    (at %i %i)' % (x, y))
+        lines.append('    (fp_text reference U%i (at 0 -3.4) (layer F.SilkS)' % i)
+        lines.append('      (effects (font (size 1 1) (thickness 0.15)))')
+        lines.append('    )')
+        lines.append('    (fp_text value "Chip \\"%i\\"" (at 0 3.4) (layer F.Fab)' % i)
+        lines.append('      (effects (font (size 1 1) (thickness 0.15)))')
+        lines.append('    )')
+        lines.append('    (fp_line (start -1.95 -2.5) (end 1.95 -2.5) (layer F.SilkS) (width 0.12))')
+        if spec.fab:
+            lines.append('    (fp_text user %%R (at 0 0) (layer F.Fab)')
+            lines.append('      (effects (font (size 0.5 0.5) (thickness 0.08)))')
+            lines.append('    )')
+        for j in range(spec.fab):
+            lines.append('    (fp_line (start -2 %.2f) (end 2 %.2f) (layer %s) (width 0.1))'
+                         % (j * 0.1, j * 0.1, 'F.CrtYd' if j % 2 else 'F.Fab'))
+        for j in range(spec.arcs):
+            lines.append('    (fp_arc (start 0 0) (end %.4f %.4f) (angle 45) (layer F.SilkS) (width 0.12))'
+                         % (math.cos(j), math.sin(j)))
+        for j in range(spec.polys):
+            lines.append('    (fp_poly %s (layer F.SilkS) (width 0.1))'
+                         % get_circle_points(0, 0, 0.5 + 0.1 * j, spec.poly_points))
+        for j in range(1, spec.pads + 1):
+            net_id = get_pad_net(spec, i, j)
+            net = ' (net %i "%s")' % (net_id, get_net_name(spec, net_id)) if net_id else ''
+            lines.append('    (pad %i smd rect (at %.3f %.3f) (size 1.5 0.6) (layers F.Cu F.Paste F.Mask)%s)'
+                         % (j, -2.5 if j <= spec.pads // 2 else 2.5,
+                            -1.9 + 1.27 * ((j - 1) % (spec.pads // 2 or 1)), net))
+        lines.append('  )')
+    lines.append('  (gr_line (start 0 0) (end 300 0) (layer Edge.Cuts) (width 0.05))')
+    lines.append('  (gr_line (start 300 0) (end 300 300) (layer Edge.Cuts) (width 0.05))')
+    lines.append('  (gr_line (start 300 300) (end 0 300) (layer Edge.Cuts) (width 0.05))')
+    lines.append('  (gr_line (start 0 300) (end 0 0) (layer Edge.Cuts) (width 0.05))')
+    for i in range(1, nets + 1):
+        for j in range(spec.segments):
+            lines.append('  (segment (start %.3f %i) (end %.3f %i) (width 0.25) (layer F.Cu) (net %i))'
+                         % (10 + j * 0.5, i, 10.5 + j * 0.5, i, i))
+        for j in range(spec.vias):
+            lines.append('  (via (at %.3f %i) (size 0.8) (drill 0.4) (layers F.Cu B.Cu) (net %i))'
+                         % (10.5 + spec.segments * 0.5 + j, i, i))
+    for i in range(spec.zones):
+        net = i % nets + 1 if nets else 0
+        points = get_circle_points(150, 150, 10 + i, spec.zone_points)
+        lines.append('  (zone (net %i) (net_name "%s") (layer F.Cu) (tstamp 5D3AF%03X) (hatch edge 0.508)'
+                     % (net, get_net_name(spec, net) if net else '', i % 4096))
+        lines.append('    (connect_pads (clearance 0.508))')
+        lines.append('    (min_thickness 0.254)')
+        lines.append('    (fill yes (arc_segments 32) (thermal_gap 0.508) (thermal_bridge_width 0.508))')
+        lines.append('    (polygon %s)' % points)
+        lines.append('    (filled_polygon %s)' % points)
+        lines.append('  )')
+    lines.append(')')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_board(modules: int, pads: int = 8, segments: int = 10) -> str:
+    """
+    creates text of kicad pcb file with given number of elements
+    :param modules: number of modules
+    :param pads: number of pads per module
+    :param segments: number of segments per module net
+    :return: text of pcb file
+    """
+    return generate_board(BoardSpec(modules=modules, pads=pads, segments=segments))
+
+
+def write_board(filename: str, spec: BoardSpec):
+    """
+    writes synthetic kicad pcb file
+    :param filename: name of file
+    :param spec: board scale
+    :return:
+    """
+    with open(filename, 'w') as file:
+        file.write(generate_board(spec))
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    """
+    adds board scale options to command line parser, number of modules is left for caller
+    :param parser: command line parser
+    :return:
+    """
+    parser.add_argument('--pads', type=int, default=8, help='pads per module')
+    parser.add_argument('--nets', type=int, help='number of nets, one net per module by default')
+    parser.add_argument('--segments', type=int, default=10, help='segments per net')
+    parser.add_argument('--vias', type=int, default=1, help='vias per net')
+    parser.add_argument('--arcs', type=int, default=0, help='silkscreen arcs per module')
+    parser.add_argument('--polys', type=int, default=0, help='silkscreen polygons per module')
+    parser.add_argument('--poly-points', type=int, default=8, help='points per polygon')
+    parser.add_argument('--zones', type=int, default=0, help='number of copper zones')
+    parser.add_argument('--zone-points', type=int, default=64, help='points per zone outline')
+    parser.add_argument('--fab', type=int, default=0, help='fabrication and courtyard lines per module')
+
+
+def get_spec(args: argparse.Namespace, modules: int) -> BoardSpec:
+    """
+    creates board scale from parsed command line options
+    :param args: parsed options
+    :param modules: number of modules
+    :return: board scale
+    """
+    values = {spec_field.name: getattr(args, spec_field.name) for spec_field in fields(BoardSpec)
+              if spec_field.name != 'modules'}
+    return BoardSpec(modules=modules, **values)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes synthetic KiCad pcb file')
+    parser.add_argument('filename', help='KiCad pcb filename')
+    parser.add_argument('--modules', type=int, default=100, help='number of modules')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    write_board(args.filename, get_spec(args, args.modules))
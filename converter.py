@@ -0,0 +1,90 @@
+import argparse
+import io
+import sys
+from typing import Any, BinaryIO, Dict, Optional, TextIO, Union
+
+from lxml import etree
+
+import create_topor
+import kicad_parse
+import sexpr
+import simplify
+from pcb_compact import CompactPCB
+
+Source = Union[bytes, bytearray, memoryview, BinaryIO, TextIO]
+
+
+class Converter:
+    """
+    converts boards kept in memory or read from streams to fst documents, all options are given to constructor
+    and every call builds its own data, so converter never reads or writes files by name, keeps nothing between
+    calls and can be shared by threads, modules and parts are built in calling thread
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, skip_unused: bool = False,
+                 simplify_tolerance: Optional[float] = None, copper_tolerance: Optional[float] = None):
+        """
+        :param settings: config settings, defaults of create_topor are used for missing keys
+        :param skip_unused: skip zones, time stamps and fabrication and courtyard figures while parsing
+        :param simplify_tolerance: tolerance in mm to simplify silkscreen and other non copper polygons,
+        they are kept exact if not set
+        :param copper_tolerance: tolerance in mm to simplify copper polygons and custom pads, they are kept exact
+        if not set
+        """
+        self.settings: Dict[str, Any] = dict(settings or {})
+        self.skip_unused = skip_unused
+        self.tolerances = {'copper': copper_tolerance, 'silk': simplify_tolerance, 'other': simplify_tolerance}
+
+    def load(self, source: Source) -> CompactPCB:
+        """
+        parses board
+        :param source: content of kicad pcb file, plain, gzip or xz, or text or binary stream of plain file
+        :return: compact pcb, its view gives pcb structure
+        """
+        stream = sexpr.open_bytes(bytes(source)) if isinstance(source, (bytes, bytearray, memoryview)) else source
+        if self.skip_unused:
+            data = sexpr.parse(stream, skip_tags=kicad_parse.unused_tags, skip_checks=kicad_parse.unused_checks)
+        else:
+            data = sexpr.parse(stream)
+        pcb = kicad_parse.create_pcb(kicad_parse.list_to_dict(data[0]))
+        if any(tolerance is not None for tolerance in self.tolerances.values()):
+            simplify.simplify_pcb(pcb, self.tolerances)
+        return pcb
+
+    def convert_to(self, source: Source, target: BinaryIO, name: str = 'board.kicad_pcb'):
+        """
+        converts board writing document sections to stream as they are built
+        :param source: content of kicad pcb file or stream, see load
+        :param target: binary stream for fst document
+        :param name: board name written to document header as original file
+        :return:
+        """
+        pcb = self.load(source)
+        with etree.xmlfile(target, encoding="UTF-8") as xml_file:
+            xml_file.write_declaration()
+            create_topor.emit_topor(create_topor.StreamWriter(xml_file), name, pcb, self.settings)
+
+    def convert(self, source: Source, name: str = 'board.kicad_pcb') -> bytes:
+        """
+        converts board in memory
+        :param source: content of kicad pcb file or stream, see load
+        :param name: board name written to document header as original file
+        :return: fst document
+        """
+        target = io.BytesIO()
+        self.convert_to(source, target, name)
+        return target.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts KiCad pcb read from stdin to TopoR fst written to stdout')
+    parser.add_argument('--config', help='config filename, defaults are used if not set')
+    parser.add_argument('--name', default='board.kicad_pcb', help='board name for document header')
+    parser.add_argument('--skip-unused', action='store_true',
+                        help='skip zones, time stamps and fabrication and courtyard figures while parsing')
+    args = parser.parse_args()
+    converter = Converter(kicad_parse.get_settings(args.config) if args.config else None, args.skip_unused)
+    content = sys.stdin.buffer.read()
+    # messages of converter go to stderr to keep document on stdout
+    sys.stdout, output = sys.stderr, sys.stdout
+    converter.convert_to(content, output.buffer, args.name)
@@ -1,6 +1,48 @@
+import contextlib
+import concurrent.futures
+import gzip
+import http.client
+import dataclasses
+import io
+import json
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
 import unittest
-import test
-from pyparsing import OneOrMore, nestedExpr, Dict
+import unittest.mock
+from array import array
+import batch
+import benchmark
+import board_generator
+import converter
+import create_topor
+import kicad_parse
+import pcb_cache
+import pcb_compact
+import profiler
+import server
+import sexpr
+import simplify
+import watch
+from pcb_structure import NetIndex, FpArc, FpLine, FpPoly, Layer, TextType
+from lxml import etree
+from pyparsing import OneOrMore, nestedExpr
+
+
+def parse_compact(text):
+    return kicad_parse.create_pcb(kicad_parse.list_to_dict(sexpr.parse(io.StringIO(text))[0]))
+
+
+def parse_pcb(text):
+    return parse_compact(text).view()
+
+
+def synthetic_pcb(modules):
+    return parse_pcb(board_generator.synthetic_board(modules))
 
 
 class ListToDict(unittest.TestCase):
@@ -9,11 +51,957 @@ class ListToDict(unittest.TestCase):
         input = "(last_trace_width 0.15)"
         data = OneOrMore(nestedExpr()).parseString(input)
         data = data.asList()
-        self.assertEqual(test.list_to_dict(data[0]), {'last_trace_width': "0.15"})
+        self.assertEqual(kicad_parse.list_to_dict(data[0]), {'last_trace_width': 0.15})
 
     def testOneLevel(self):
         input = "(other_layers_text_dims (size 1 1) (thickness 0.15) keep_upright)"
         data = OneOrMore(nestedExpr()).parseString(input)
         data = data.asList()
-        self.assertEqual(test.list_to_dict(data[0]), {'other_layers_text_dims':
-                                                          [{'size': ['1', '1']}, {'thickness': '0.15'}, 'keep_upright']})
+        self.assertEqual(kicad_parse.list_to_dict(data[0]), {'other_layers_text_dims':
+                                                          [{'size': ['1', '1']}, {'thickness': 0.15}, 'keep_upright']})
+
+    def testEqualChildren(self):
+        data = sexpr.parse(io.StringIO("(pts (xy 1 2) (xy 1 2) (xy 3 4))"))
+        result = kicad_parse.list_to_dict(data[0])
+        self.assertEqual(result, {'pts': [{'xy': ['1', '2']}, {'xy': ['1', '2']}, {'xy': ['3', '4']}]})
+        self.assertEqual(len(kicad_parse.get_all_dicts_by_key(result['pts'], 'xy')), 3)
+
+    def testIndexedLookup(self):
+        data = sexpr.parse(io.StringIO("(pad 1 smd rect (at 1 2) (size 1 1) (net 3 GND) (at 5 6))"))
+        pad = kicad_parse.list_to_dict(data[0])['pad']
+        self.assertIsInstance(pad, kicad_parse.Node)
+        self.assertEqual(kicad_parse.get_dict_by_key(pad, 'at'), {'at': ['1', '2']})
+        self.assertEqual(kicad_parse.get_dict_by_key(pad, 'drill'), {})
+        self.assertEqual(kicad_parse.get_all_dicts_by_key(pad, 'at'), [{'at': ['1', '2']}, {'at': ['5', '6']}])
+        self.assertEqual(kicad_parse.get_dict_by_key(list(pad), 'net'), {'net': ['3', 'GND']})
+
+
+class SexprParse(unittest.TestCase):
+
+    def testSameAsPyparsing(self):
+        input = '(a "b c" d"e f"g (x "q\\"w" ) "" () (t "x)y" z)\n (it\'s "x""y" \'s q\') (n\t"\\\\"\r\n))'
+        expected = OneOrMore(nestedExpr()).parseString(input).asList()
+        for chunk_size in (1, 2, 5, 1000):
+            self.assertEqual(sexpr.parse(io.StringIO(input), chunk_size), expected)
+
+    def testUnbalanced(self):
+        self.assertRaises(ValueError, sexpr.parse, io.StringIO("(a (b)"))
+        self.assertRaises(ValueError, sexpr.parse, io.StringIO("(a))"))
+
+
+class NetIndexScaling(unittest.TestCase):
+
+    @staticmethod
+    def board(size):
+        data = ['kicad_pcb']
+        data.extend(['net', str(i), 'N%i' % i] for i in range(size))
+        data.extend(['segment', ['start', '0', str(i)], ['end', '1', str(i)], ['width', '0.25'], ['layer', 'F.Cu'],
+                     ['net', str(i)]] for i in range(size))
+        data.extend(['via', ['at', '0', str(i)], ['size', '0.8'], ['layers', 'F.Cu', 'B.Cu'], ['net', str(i)]]
+                    for i in range(size))
+        return kicad_parse.list_to_dict(data)['kicad_pcb']
+
+    class ScannedNets(list):
+        scans = 0
+
+        def __iter__(self):
+            self.scans += 1
+            return super().__iter__()
+
+    def assign(self, data):
+        nets = NetIndex(self.ScannedNets(kicad_parse.get_nets(data)))
+        kicad_parse.update_nets_with_segments(data, nets)
+        kicad_parse.update_nets_with_vias(data, nets)
+        return nets
+
+    def testAssignment(self):
+        nets = self.assign(self.board(10))
+        self.assertEqual([len(net.segment_widths) for net in nets.nets], [1] * 10)
+        self.assertEqual([len(net.via_sizes) for net in nets.nets], [1] * 10)
+        self.assertIs(nets.get_by_id('3.0'), nets.get_by_name('N3'))
+
+    def testDuplicateIdFirstWins(self):
+        data = kicad_parse.list_to_dict(['kicad_pcb', ['net', '1', 'A'], ['net', '1', 'B'],
+                                         ['segment', ['start', '0', '0'], ['end', '1', '0'], ['width', '0.25'],
+                                          ['layer', 'F.Cu'], ['net', '1']]])['kicad_pcb']
+        nets = NetIndex(kicad_parse.get_nets(data))
+        kicad_parse.update_nets_with_segments(data, nets)
+        self.assertEqual(nets.get_by_id(1).net_name, 'A')
+        self.assertEqual([len(net.segment_widths) for net in nets.nets], [1, 0])
+
+    def testLinearScaling(self):
+        # nets are scanned once to build the index, scan of all nets per segment or via would make it quadratic
+        self.assertEqual(self.assign(self.board(250)).nets.scans, 1)
+        self.assertEqual(self.assign(self.board(2000)).nets.scans, 1)
+
+
+class ArcEndPoint(unittest.TestCase):
+
+    @staticmethod
+    def stepped_end_point(arc):
+        # previous implementation stepping by 0.1 degree, the result lags behind the exact end up to 0.1 degree
+        x, y, x_c, y_c = (value / pcb_compact.NM_PER_MM for value in arc.points)
+        ang = arc.angle
+        r = math.hypot(x - x_c, y - y_c)
+        a = math.degrees(math.atan2(y - y_c, x - x_c))
+        stop = a + ang
+        da = 0.1 if ang > 0 else -0.1
+        while (a < stop) if ang > 0 else (a > stop):
+            x, y = x_c + r * math.cos(math.radians(a)), y_c + r * math.sin(math.radians(a))
+            a += da
+        return x, y
+
+    def arcs(self):
+        layer = Layer('F.SilkS', 'user')
+        return [pcb_compact.CompactFigure(FpArc, layer, 100000, array('q', [3000000, -1000000, 1000000, -1000000]),
+                                          angle)
+                for angle in (90.0, -90.0, 270.0, -270.0, 45.5, 180.0, 359.0, 0.0)]
+
+    def testExact(self):
+        ends = [kicad_parse.get_end_point(arc) for arc in self.arcs()[:4]]
+        self.assertEqual(ends, [(1000000, 1000000), (1000000, -3000000), (1000000, -3000000), (1000000, 1000000)])
+
+    def testMatchesStepping(self):
+        arcs = self.arcs()
+        radius = 2
+        # 0.1 degree step of previous implementation gives up to radius * pi / 1800 error
+        tolerance = radius * math.pi / 1800
+        for arc, end in zip(arcs, kicad_parse.get_end_points(arcs)):
+            x, y = self.stepped_end_point(arc)
+            self.assertLessEqual(math.hypot(end[0] / pcb_compact.NM_PER_MM - x, end[1] / pcb_compact.NM_PER_MM - y),
+                                 tolerance)
+
+    def testBatch(self):
+        arcs = self.arcs()
+        for single, batch in zip([kicad_parse.get_end_point(arc) for arc in arcs], kicad_parse.get_end_points(arcs)):
+            self.assertEqual(single, batch)
+
+
+class EdgeChaining(unittest.TestCase):
+
+    @staticmethod
+    def polygon(points):
+        layer = Layer('Edge.Cuts', 'user')
+        return [pcb_compact.CompactFigure(FpLine, layer, 50000, array('q', map(pcb_compact.to_nm, (x1, y1, x2, y2))))
+                for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1])]
+
+    def testContours(self):
+        cutout = self.polygon([(2, 2), (3, 2), (3, 3), (2, 3)])
+        outline = self.polygon([(0, 0), (10, 0), (10, 10), (0, 10)])
+        kicad_parse.reverse_edge(outline[1])
+        contours = kicad_parse.chain_edges(cutout[2:] + outline + cutout[:2])
+        self.assertEqual([len(contour) for contour in contours], [4, 4])
+        self.assertEqual(contours[1], outline)
+        for contour in contours:
+            for edge, next_edge in zip(contour, contour[1:] + contour[:1]):
+                self.assertEqual(edge.points[2:], next_edge.points[:2])
+
+    def testGap(self):
+        edges = self.polygon([(0, 0), (10, 0), (10, 10), (0, 10)])[:3]
+        contours = kicad_parse.chain_edges(edges)
+        self.assertEqual([len(contour) for contour in contours], [3])
+
+    def testManySegments(self):
+        points = [(round(100 * math.cos(a * math.pi / 10000), 4), round(100 * math.sin(a * math.pi / 10000), 4))
+                  for a in range(20000)]
+        edges = self.polygon(points)
+        distances = list()
+
+        def distance(value):
+            distances.append(value)
+            return abs(value)
+
+        # chain_edges measures distances with abs, near cells of spatial hash give about 50 candidates per step
+        # on this dense outline, search of all free ends would measure thousands of distances per step
+        with unittest.mock.patch.object(kicad_parse, 'abs', distance, create=True):
+            contours = kicad_parse.chain_edges(edges[::2] + edges[1::2])
+        self.assertEqual([len(contour) for contour in contours], [20000])
+        self.assertLess(len(distances), 1000 * len(edges))
+
+
+class CompactModel(unittest.TestCase):
+
+    def testView(self):
+        compact = parse_compact(board_generator.synthetic_board(3))
+        view = compact.view()
+        nm = pcb_compact.NM_PER_MM
+        self.assertEqual(len(view.modules), len(compact.modules))
+        for module, module_view in zip(compact.modules, view.modules):
+            self.assertEqual(module_view.coords[:2], [module.x / nm, module.y / nm])
+            self.assertEqual([pad.pad_id for pad in module_view.pads], [pad.pad_id for pad in module.pads])
+            self.assertEqual([pad.center.pos for pad in module_view.pads],
+                             [[x / nm, y / nm] for x, y in zip(module.pad_coords[::4], module.pad_coords[1::4])])
+            self.assertEqual([pad.layers for pad in module_view.pads], [list(pad.layers) for pad in module.pads])
+        for net, net_view in zip(compact.nets, view.nets):
+            self.assertEqual(net_view.contacts, net.contacts)
+            self.assertEqual([value * nm for segment in net_view.segments for value in segment.start + segment.end],
+                             list(net.segment_coords))
+        self.assertEqual(view.edge[1].start, [value / nm for value in compact.outline[1].points[:2]])
+        self.assertIs(view.modules[0].layer, view.modules[1].layer)
+        lazy = compact.view(lazy=True)
+        self.assertEqual(list(lazy.modules), view.modules)
+        self.assertEqual(lazy.nets[1:], view.nets[1:])
+        self.assertIs(lazy.net_index.get_by_name(view.nets[1].net_name), compact.nets[1])
+
+    def testNanometres(self):
+        self.assertEqual(pcb_compact.to_nm('-12.7'), -12700000)
+        self.assertEqual(pcb_compact.from_nm(-12700000), '-12.7')
+        self.assertEqual(kicad_parse.get_point(['1.5', '2']), (1500000, -2000000))
+        self.assertEqual([pcb_compact.from_nm(value) for value in (2000000, -500000, 1, 0)],
+                         ['2', '-0.5', '0.000001', '0'])
+
+
+class StreamWriter(unittest.TestCase):
+
+    def testSameAsTree(self):
+        pcb = synthetic_pcb(5)
+        results = list()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as folder:
+            try:
+                for writer in create_topor.writers:
+                    os.mkdir(os.path.join(folder, writer))
+                    os.chdir(os.path.join(folder, writer))
+                    create_topor.create_topor('board', pcb, {}, writer)
+                    parser = etree.XMLParser(remove_blank_text=True)
+                    results.append(etree.tostring(etree.parse('board.fst', parser)))
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(len(results), len(create_topor.writers))
+        for result in results[1:]:
+            self.assertEqual(results[0], result)
+
+
+class PadstackDedup(unittest.TestCase):
+
+    def testShared(self):
+        pcb = synthetic_pcb(20)
+        plan = create_topor.plan_padstacks(pcb, create_topor.describe_modules(pcb, {}))
+        self.assertEqual(plan.pads, 160)
+        self.assertEqual([name for name, _ in plan.padstacks], ['U1 1'])
+        self.assertEqual(plan.pad_refs[5], ['U1 1'] * 8)
+
+    def testGeometryKey(self):
+        pad = synthetic_pcb(1).modules[0].pads[0]
+        key = create_topor.get_padstack_key(pad)
+        self.assertEqual(key, create_topor.get_padstack_key(dataclasses.replace(pad, pad_id='2', net_id=5)))
+        self.assertNotEqual(key, create_topor.get_padstack_key(dataclasses.replace(pad, size=['1.5', '0.7'])))
+        tht = dataclasses.replace(pad, smd=False, drill='0.8')
+        self.assertIn('Plane', create_topor.get_pad_layer_types(tht))
+        self.assertNotIn('Plane', [layer.layer_type for layer in tht.layers])
+
+    def testCountedInStage(self):
+        pcb = synthetic_pcb(20)
+        stages = profiler.Profiler()
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            create_topor.emit_topor(create_topor.TreeWriter(), 'board', pcb, {}, stages)
+        stages.close()
+        self.assertNotIn('Padstacks', log.getvalue())
+        plan_stage = next(stage for stage in stages.stages if stage.name == 'plan_padstacks')
+        self.assertEqual(plan_stage.counts, {'pads': 160, 'padstacks': 1})
+
+
+class FootprintDedup(unittest.TestCase):
+
+    def testShared(self):
+        pcb = synthetic_pcb(20)
+        descriptors = create_topor.describe_modules(pcb, {})
+        plan = create_topor.plan_footprints(pcb, descriptors, create_topor.plan_padstacks(pcb, descriptors))
+        self.assertEqual(len(plan.parts), 2)
+        self.assertEqual(plan.part_refs[:20], ['U1'] * 20)
+        self.assertEqual(plan.part_refs[20], 'ExtraSilks')
+
+    def testDifferentFigures(self):
+        pcb = synthetic_pcb(2)
+        line = pcb.modules[1].figures[0]
+        pcb.modules[1].figures[0] = dataclasses.replace(line, end=[line.end[0], '1'])
+        descriptors = create_topor.describe_modules(pcb, {})
+        plan = create_topor.plan_footprints(pcb, descriptors, create_topor.plan_padstacks(pcb, descriptors))
+        self.assertEqual(plan.part_refs[:2], ['U1', 'U2'])
+
+    def testCountedInStage(self):
+        pcb = synthetic_pcb(20)
+        stages = profiler.Profiler()
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            create_topor.emit_topor(create_topor.TreeWriter(), 'board', pcb, {}, stages)
+        stages.close()
+        self.assertEqual(log.getvalue(), '')
+        plan_stage = next(stage for stage in stages.stages if stage.name == 'plan_footprints')
+        self.assertEqual(plan_stage.counts, {'modules': 21, 'footprints': 2})
+
+
+class ModuleDescriptors(unittest.TestCase):
+
+    def testUniqueNames(self):
+        used = create_topor.UsedNames()
+        names = [create_topor.uniquify_name(name, used) for name in ['C', 'C ', 'C', 'C', 'R', 'C ']]
+        self.assertEqual(names, ['C', 'C ', 'C  ', 'C   ', 'R', 'C    '])
+
+    def testStableIds(self):
+        ids = [create_topor.stable_id(name, create_topor.UsedNames()) for name in ['U1', 'U1', 'U2']]
+        self.assertEqual(ids[0], ids[1])
+        self.assertNotEqual(ids[0], ids[2])
+        used = create_topor.UsedNames()
+        ids = [create_topor.stable_id('U1', used) for _ in range(100)]
+        self.assertEqual(len(set(ids)), 100)
+        self.assertTrue(all(len(unique_id) == 7 and unique_id.isalpha() for unique_id in ids))
+
+    def testDescriptor(self):
+        pcb = synthetic_pcb(3)
+        descriptors = create_topor.describe_modules(pcb, {'invisible_names': ['U2']})
+        self.assertEqual([descriptor.ref for descriptor in descriptors[:3]], ['U1', 'U2', 'U3'])
+        self.assertEqual(descriptors[0].pad_numbers, [str(i) for i in range(1, 9)])
+        self.assertEqual(descriptors[0].side, 'Top')
+        self.assertEqual([descriptor.part_name.visible for descriptor in descriptors[:3]], ['on', 'off', 'on'])
+
+    class ProbedNames(set):
+        probes = 0
+
+        def __contains__(self, name):
+            self.probes += 1
+            return super().__contains__(name)
+
+    def testManyEqualValues(self):
+        module = synthetic_pcb(1).modules[0]
+        used = create_topor.UsedNames(names=self.ProbedNames(), ids=self.ProbedNames())
+        descriptors = [create_topor.describe_module(module, {}, used) for _ in range(4000)]
+        self.assertEqual(len({descriptor.name for descriptor in descriptors}), 4000)
+        # search of free name and id continues from the last one, search from the start would probe n * n / 2 times
+        self.assertEqual((used.names.probes, used.ids.probes), (4000, 4000))
+
+
+class BatchConversion(unittest.TestCase):
+
+    def testBatch(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name, modules in (('small', 2), ('large', 20), ('middle', 8)):
+                with open(os.path.join(folder, name + '.kicad_pcb'), 'w') as file:
+                    file.write(board_generator.synthetic_board(modules))
+            with open(os.path.join(folder, 'broken.kicad_pcb'), 'w') as file:
+                file.write('(kicad_pcb (version 20171130)\n')
+            config = os.path.join(folder, 'config,ini')
+            with open(config, 'w') as file:
+                file.write('font_size: 1\n')
+            boards = batch.find_boards([folder, os.path.join(folder, 'small.kicad_pcb')])
+            self.assertEqual([os.path.basename(board) for board in boards],
+                             ['large.kicad_pcb', 'middle.kicad_pcb', 'small.kicad_pcb', 'broken.kicad_pcb'])
+            output_dir = os.path.join(folder, 'out')
+            results = batch.run_batch([os.path.join(folder, '*.kicad_pcb')], output_dir, config, workers=2)
+            self.assertEqual(len(results), 4)
+            failed = [os.path.basename(result.filename) for result in results if result.error]
+            self.assertEqual(failed, ['broken.kicad_pcb'])
+            self.assertEqual(sorted(os.listdir(output_dir)),
+                             ['large.kicad_pcb.fst', 'middle.kicad_pcb.fst', 'small.kicad_pcb.fst'])
+
+    real_convert = staticmethod(batch.convert)
+
+    @staticmethod
+    def crash_convert(filename, *args):
+        if 'crash' in filename:
+            os._exit(1)
+        return BatchConversion.real_convert(filename, *args)
+
+    def testKilledWorker(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ('crash', 'small'):
+                with open(os.path.join(folder, name + '.kicad_pcb'), 'w') as file:
+                    file.write(board_generator.synthetic_board(2))
+            config = os.path.join(folder, 'config,ini')
+            with open(config, 'w') as file:
+                file.write('font_size: 1\n')
+            with unittest.mock.patch.object(batch, 'convert', self.crash_convert), \
+                    contextlib.redirect_stdout(io.StringIO()) as log:
+                results = batch.run_batch([folder], os.path.join(folder, 'out'), config, workers=1)
+            self.assertEqual(sorted(os.path.basename(result.filename) for result in results),
+                             ['crash.kicad_pcb', 'small.kicad_pcb'])
+            crashed = [result for result in results if 'crash' in result.filename][0]
+            self.assertTrue(crashed.error.startswith('BrokenProcessPool'))
+            self.assertIn('Failed %s' % crashed.filename, log.getvalue())
+
+    def testOutputNames(self):
+        outputs = batch.get_outputs(['a/board.kicad_pcb', 'b/board.kicad_pcb'], 'out')
+        self.assertEqual(outputs, [os.path.join('out', 'board.kicad_pcb.fst'),
+                                   os.path.join('out', 'board.kicad_pcb-2.fst')])
+        self.assertEqual(batch.get_outputs(['a/board.kicad_pcb'], None), ['a/board.kicad_pcb.fst'])
+
+
+class ParsedBoardCache(unittest.TestCase):
+
+    def testHit(self):
+        with tempfile.TemporaryDirectory() as folder:
+            board = os.path.join(folder, 'board.kicad_pcb')
+            with open(board, 'w') as file:
+                # whole sizes are written without fraction by kicad and have to stay so in views of cached boards
+                file.write(board_generator.synthetic_board(5).replace('(size 1.5 0.6)', '(size 2 1)'))
+            cache = pcb_cache.PcbCache(os.path.join(folder, 'cache'))
+            parsed = kicad_parse.load_pcb(board, cache=cache)
+            key = pcb_cache.file_key(board, kicad_parse.parser_version)
+            self.assertIsNotNone(cache.get(key))
+            self.assertNotEqual(key, pcb_cache.file_key(board, kicad_parse.parser_version + '.1'))
+            cached = kicad_parse.load_pcb(board, cache=cache)
+            self.assertEqual(cached.view().modules[0].pads[0].size, ['2', '1'])
+            outputs = list()
+            for name, pcb in (('parsed', parsed), ('cached', cached)):
+                outputs.append(os.path.join(folder, name + '.fst'))
+                create_topor.create_topor(board, pcb, {}, 'stream', outputs[-1])
+            with open(outputs[0], 'rb') as expected, open(outputs[1], 'rb') as result:
+                self.assertEqual(result.read(), expected.read())
+            with open(board, 'a') as file:
+                file.write('\n')
+            self.assertIsNone(cache.get(pcb_cache.file_key(board, kicad_parse.parser_version)))
+
+    def testDamaged(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = pcb_cache.PcbCache(folder)
+            with open(cache.path('key'), 'wb') as file:
+                file.write(b'not a pickle')
+            self.assertIsNone(cache.get('key'))
+            self.assertFalse(os.path.exists(cache.path('key')))
+
+    def testEviction(self):
+        compact = parse_compact(board_generator.synthetic_board(5))
+        with tempfile.TemporaryDirectory() as folder:
+            cache = pcb_cache.PcbCache(folder, max_size=1 << 30)
+            cache.put('first', compact)
+            size = os.path.getsize(cache.path('first'))
+            cache.max_size = 2 * size
+            cache.put('second', compact)
+            os.utime(cache.path('first'), (time.time() - 10, time.time() - 10))
+            os.utime(cache.path('second'), (time.time() - 5, time.time() - 5))
+            self.assertIsNotNone(cache.get('first'))
+            cache.put('third', compact)
+            self.assertEqual(sorted(os.listdir(folder)), ['first.pcb', 'third.pcb'])
+
+
+class IncrementalWriter(unittest.TestCase):
+
+    def convert(self, pcb, output, writer='incremental'):
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            create_topor.create_topor('board', pcb, {}, writer, output)
+        with open(output, 'rb') as file:
+            return file.read(), log.getvalue()
+
+    def testReuse(self):
+        text = board_generator.synthetic_board(10)
+        pcb = parse_pcb(text)
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'board.fst')
+            stream, _ = self.convert(pcb, os.path.join(folder, 'stream.fst'), 'stream')
+            first, log = self.convert(pcb, output)
+            self.assertEqual(first, stream)
+            self.assertIn(' 0 parts reused', log)
+            second, log = self.convert(pcb, output)
+            self.assertEqual(second, stream)
+            self.assertIn(' 0 parts built', log)
+
+            moved = text.replace('(at 20 10)', '(at 21 11)')
+            pcb = parse_pcb(moved)
+            changed, log = self.convert(pcb, output)
+            self.assertEqual(changed, self.convert(pcb, os.path.join(folder, 'stream.fst'), 'stream')[0])
+            self.assertIn(' 1 parts built', log)
+
+            with open(output, 'ab') as file:
+                file.write(b'\n')
+            _, log = self.convert(pcb, output)
+            self.assertIn(' 0 parts reused', log)
+
+
+class BoardGenerator(unittest.TestCase):
+
+    def testScale(self):
+        spec = board_generator.BoardSpec(modules=6, pads=4, nets=15, segments=3, vias=2, arcs=2, polys=1, zones=2)
+        data = kicad_parse.list_to_dict(sexpr.parse(io.StringIO(board_generator.generate_board(spec)))[0])
+        self.assertEqual(len(kicad_parse.get_all_dicts_by_key(data['kicad_pcb'], 'zone')), 2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            pcb = kicad_parse.create_pcb(data)
+        self.assertEqual(len(pcb.modules), 7)
+        self.assertEqual(pcb.modules[-1].footprint, 'ExtraSilks')
+        self.assertEqual(len(pcb.nets), 16)
+        self.assertEqual(sum(len(net.contacts) for net in pcb.nets), 15)
+        self.assertEqual(sum(len(net.segment_widths) for net in pcb.nets), 45)
+        self.assertEqual(sum(len(net.via_sizes) for net in pcb.nets), 30)
+        self.assertEqual([figure.kind.__name__ for figure in pcb.modules[0].figures],
+                         ['FpLine', 'FpPoly', 'FpArc', 'FpArc'])
+
+    def testFewNets(self):
+        spec = board_generator.BoardSpec(modules=5, pads=2, nets=2)
+        self.assertEqual([board_generator.get_pad_net(spec, i, 1) for i in range(1, 6)], [1, 2, 1, 2, 1])
+        self.assertEqual(board_generator.get_pad_net(spec, 1, 2), 0)
+
+
+class StageProfiler(unittest.TestCase):
+
+    def testNestedPeak(self):
+        stages = profiler.Profiler()
+        try:
+            with stages.stage('outer'):
+                with stages.stage('inner') as counts:
+                    data = bytearray(1 << 20)
+                    counts['items'] = 1
+                del data
+                with stages.stage('after'):
+                    pass
+        finally:
+            stages.close()
+        outer, inner, after = stages.stages
+        self.assertEqual((outer.depth, inner.depth, inner.counts), (0, 1, {'items': 1}))
+        self.assertGreater(inner.peak - after.peak, 1 << 19)
+        self.assertGreaterEqual(outer.peak, inner.peak)
+        self.assertEqual(len(stages.to_chrome_trace()['traceEvents']), 3)
+
+    def testConversionStages(self):
+        result = benchmark.profile_stages(board_generator.BoardSpec(modules=5), 'tree')
+        json.dumps(result)
+        names = [stage['name'] for stage in result['stages']]
+        for name in ['tokenize', 'list_to_dict', 'get_edges', 'create_module', 'update_nets_with_segments',
+                     'update_nets_with_vias', 'LocalLibrary/Padstacks', 'Connectivity/Wires', 'write']:
+            self.assertIn(name, names)
+        counts = result['stages'][names.index('create_module')]['counts']
+        self.assertEqual(counts['pads'], 40)
+
+
+class ConversionProfile(unittest.TestCase):
+
+    def testDump(self):
+        data = kicad_parse.list_to_dict(sexpr.parse(io.StringIO(
+            '(module R (layer F.Cu) (at 1 2) (fp_text reference R1 (at 0 1)))'))[0])
+        dump = io.StringIO()
+        kicad_parse.write_dump(data, dump)
+        self.assertEqual(dump.getvalue(), 'module\n  R\n  layer: F.Cu\n  at: 1 2\n  fp_text\n    reference\n'
+                                          '    R1\n    at: 0 1\n')
+
+    def testProfile(self):
+        with tempfile.TemporaryDirectory() as folder:
+            board = os.path.join(folder, 'board.kicad_pcb')
+            with open(board, 'w') as file:
+                file.write(board_generator.synthetic_board(5))
+            config = os.path.join(folder, 'config,ini')
+            with open(config, 'w') as file:
+                file.write('font_size: 1\n')
+            for trace_format in profiler.profile_formats:
+                profile = os.path.join(folder, 'profile.' + trace_format)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    kicad_parse.main(board, config=config, profile=profile, profile_format=trace_format)
+                with open(profile) as file:
+                    result = json.load(file)
+                stages = result['stages'] if trace_format == 'json' else result['traceEvents']
+                names = [stage['name'] for stage in stages]
+                for name in ['read_board', 'list_to_dict', 'create_module', 'LocalLibrary/Footprints', 'NetList']:
+                    self.assertIn(name, names)
+                self.assertNotIn('dump', names)
+            self.assertEqual(sorted(os.listdir(folder)),
+                             ['board.kicad_pcb', 'board.kicad_pcb.fst', 'config,ini', 'profile.chrome', 'profile.json'])
+
+
+class ParallelModules(unittest.TestCase):
+
+    def testSameAsSerial(self):
+        spec = board_generator.BoardSpec(modules=30, arcs=2, polys=1)
+        data = kicad_parse.list_to_dict(sexpr.parse(io.StringIO(board_generator.generate_board(spec)))[0])
+        module_dicts = kicad_parse.get_all_dicts_by_key(data['kicad_pcb'], 'module')
+        serial = kicad_parse.build_modules(module_dicts)
+        parallel = kicad_parse.build_modules(module_dicts, workers=2, chunk_size=4)
+        self.assertEqual([(module.view(), contacts) for module, contacts in parallel],
+                         [(module.view(), contacts) for module, contacts in serial])
+        self.assertEqual(kicad_parse.shared_modules, [])
+        self.assertIs(serial[0][0].figures[-1].kind, FpArc)
+
+    def testPure(self):
+        data = kicad_parse.list_to_dict(sexpr.parse(io.StringIO(board_generator.synthetic_board(3)))[0])
+        nets = NetIndex(kicad_parse.get_nets(data['kicad_pcb']))
+        module_dict = kicad_parse.get_all_dicts_by_key(data['kicad_pcb'], 'module')[1]
+        module, contacts = kicad_parse.build_module(module_dict)
+        self.assertEqual(contacts, [('2', 'U2', '1')])
+        self.assertEqual(sum(len(net.contacts) for net in nets.nets), 0)
+        kicad_parse.add_contacts(contacts + [('99', 'U2', '2')], nets)
+        self.assertEqual(nets.get_by_id(2.0).contacts, [('U2', '1')])
+
+
+class ParallelWriter(unittest.TestCase):
+
+    def testSameAsStream(self):
+        spec = board_generator.BoardSpec(modules=12, arcs=1, polys=1)
+        pcb = parse_pcb(board_generator.generate_board(spec))
+        with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+            stream = os.path.join(folder, 'stream.fst')
+            create_topor.create_topor('board', pcb, {}, 'stream', stream)
+            for workers in (1, 2):
+                parallel = os.path.join(folder, 'parallel%i.fst' % workers)
+                create_topor.create_topor_parallel('board', pcb, {}, parallel, workers, chunk_size=3)
+                with open(stream, 'rb') as expected, open(parallel, 'rb') as result:
+                    self.assertEqual(result.read(), expected.read())
+        self.assertEqual(create_topor.shared_tasks, [])
+
+    def testChunks(self):
+        writer = create_topor.ParallelWriter(chunk_size=2)
+        with writer.element('Document'):
+            for i in range(5):
+                writer.write(create_topor.create_header, str(i))
+            with writer.element('Section'):
+                writer.write(create_topor.create_header, 'x')
+        self.assertEqual(writer.get_bounds(), [(0, 2), (2, 4), (4, 5), (5, 6)])
+
+
+class SkipUnused(unittest.TestCase):
+
+    def testSkipTags(self):
+        text = '(a (zone (x (y "(z"))) (b 1) (tstamp 5) (c (path /1/2) 2))'
+        self.assertEqual(sexpr.parse(io.StringIO(text), skip_tags={'zone', 'tstamp', 'path'}),
+                         [['a', ['b', '1'], ['c', '2']]])
+        self.assertEqual(sexpr.parse(io.StringIO(text), skip_checks={'b': lambda expr: expr[1] == '1'}),
+                         sexpr.parse(io.StringIO(text.replace('(b 1) ', ''))))
+        self.assertEqual(list(sexpr.tokenize(io.StringIO(text), 7, {'zone', 'tstamp', 'path'})),
+                         list(sexpr.tokenize(io.StringIO('(a (b 1) (c 2))'))))
+        with self.assertRaises(ValueError):
+            sexpr.parse(io.StringIO('(a (zone (b))'), skip_tags={'zone'})
+
+    def testKeepsLabels(self):
+        self.assertFalse(kicad_parse.is_unused(['fp_text', 'value', '"1k"', ['layer', 'F.Fab']]))
+        self.assertFalse(kicad_parse.is_unused(['fp_text', 'reference', 'R1', ['layer', 'F.CrtYd']]))
+        self.assertTrue(kicad_parse.is_unused(['fp_text', 'user', '%R', ['layer', '"F.Fab"']]))
+        self.assertFalse(kicad_parse.is_unused(['fp_line', ['layer', 'F.SilkS']]))
+        self.assertFalse(kicad_parse.is_unused(['gr_line', ['layer', 'F.Fab']]))
+
+    def testSameOutput(self):
+        spec = board_generator.BoardSpec(modules=6, arcs=1, zones=2, fab=3)
+        results = list()
+        with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+            board = os.path.join(folder, 'board.kicad_pcb')
+            board_generator.write_board(board, spec)
+            for skip_unused in (False, True):
+                output = os.path.join(folder, '%s.fst' % skip_unused)
+                pcb = kicad_parse.load_pcb(board, skip_unused=skip_unused)
+                create_topor.create_topor(board, pcb, {}, 'stream', output)
+                with open(output, 'rb') as file:
+                    results.append((pcb, file.read()))
+            data = kicad_parse.read_board(board, skip_unused=True)
+        (full, full_fst), (skipped, skipped_fst) = results
+        self.assertEqual(skipped_fst, full_fst)
+        self.assertEqual(len(full.modules[0].figures), 5)
+        self.assertEqual(len(skipped.modules[0].figures), 2)
+        self.assertEqual([text.text_type for text in skipped.modules[0].texts], [TextType.reference, TextType.value])
+        self.assertNotIn('zone', [expr[0] for expr in data[0][1:]])
+
+
+class PolygonSimplify(unittest.TestCase):
+
+    @staticmethod
+    def getCircle(count: int):
+        return [[str(10 * math.cos(2 * math.pi * i / count)), str(10 * math.sin(2 * math.pi * i / count))]
+                for i in range(count)]
+
+    def testTolerance(self):
+        points = self.getCircle(2000)
+        result = simplify.simplify_points(points, 0.01)
+        self.assertLess(len(result), 200)
+        self.assertGreater(len(result), 10)
+        self.assertIs(result[0], points[0])
+        # circle points between kept ones are within tolerance of chords
+        kept = [points.index(point) for point in result] + [len(points)]
+        for start, end in zip(kept, kept[1:]):
+            chord = 10 * math.cos(math.pi * (end - start) / len(points))
+            self.assertLessEqual(10 - chord, 0.01)
+        numpy = simplify.np
+        simplify.np = None
+        try:
+            self.assertEqual(simplify.simplify_points(points, 0.01), result)
+        finally:
+            simplify.np = numpy
+
+    def testCollinear(self):
+        square = [['0', '0'], ['1', '0'], ['2', '0'], ['2', '1'], ['2', '2'], ['0', '2'], ['0', '1']]
+        self.assertEqual(simplify.simplify_points(square, 0), [['0', '0'], ['2', '0'], ['2', '2'], ['0', '2']])
+        self.assertEqual(simplify.simplify_points(square[:4], 5), square[:4])
+
+    def testCopperExact(self):
+        spec = board_generator.BoardSpec(modules=2, polys=1, poly_points=500)
+        pcb = parse_compact(board_generator.generate_board(spec))
+        points = array('q', (pcb_compact.to_nm(value) for point in self.getCircle(500) for value in point))
+        copper = pcb_compact.CompactFigure(FpPoly, Layer('F.Cu', 'signal'), 0, points)
+        pcb.modules[0].figures.append(copper)
+        report = simplify.simplify_pcb(pcb, {'silk': 0.01, 'copper': None})
+        self.assertEqual(report.polygons, {'silk': 2})
+        self.assertEqual(report.before, {'silk': 1000})
+        self.assertLess(report.after['silk'], 200)
+        self.assertEqual(len(copper.points) // 2, 500)
+        self.assertEqual(simplify.simplify_pcb(pcb, {'copper': 0.01}).polygons, {'copper': 1})
+        self.assertLess(len(copper.points) // 2, 200)
+        self.assertIn('silk 2 polygons 1000 ->', report.report())
+
+
+class CompressedInput(unittest.TestCase):
+
+    def testSameAsPlain(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=3, zones=1))
+        with tempfile.TemporaryDirectory() as folder:
+            plain = os.path.join(folder, 'board.kicad_pcb')
+            with open(plain, 'w') as file:
+                file.write(text)
+            expected = sexpr.parse_file(plain)
+            self.assertEqual(sexpr.parse_file(plain, memory_map=True), expected)
+            for extension, opener in sexpr.compressed_openers.items():
+                with opener(plain + extension, 'wt') as file:
+                    file.write(text)
+                self.assertEqual(kicad_parse.read_board(plain + extension), expected)
+                self.assertEqual(kicad_parse.read_board(plain + extension, 'mmap'), expected)
+                self.assertEqual(kicad_parse.get_output_name(plain + extension), plain + '.fst')
+            self.assertEqual(sorted(batch.find_boards([folder])), [plain, plain + '.gz', plain + '.xz'])
+            self.assertEqual(batch.get_outputs([plain + '.xz'], folder), [plain + '.fst'])
+
+    def testBytesTokens(self):
+        text = '(a "текст (\\"x\\")" слово (zone (b ")")) 1.5)\n'
+        expected = list(sexpr.tokenize(io.StringIO(text), 8, {'zone'}))
+        self.assertEqual(list(sexpr.tokenize(io.BytesIO(text.encode()), 8, {'zone'})), expected)
+        self.assertEqual(list(sexpr.tokenize(sexpr.BufferStream(text.encode()), skip_tags={'zone'})), expected)
+        self.assertEqual(expected[3], 'слово')
+        with self.assertRaises(ValueError):
+            sexpr.parse(io.BytesIO(b'(a (b "c")\n'))
+
+
+class WatchMode(unittest.TestCase):
+
+    def testReconvert(self):
+        text = board_generator.synthetic_board(10)
+        with tempfile.TemporaryDirectory() as folder:
+            board = os.path.join(folder, 'board.kicad_pcb')
+            config = os.path.join(folder, 'config,ini')
+            with open(board, 'w') as file:
+                file.write(text)
+            with open(config, 'w') as file:
+                file.write('font_default: Arial\n')
+            watcher = watch.Watcher([folder], config=config, debounce=0)
+            self.assertEqual(watcher.poll(), [board])
+            result = watcher.convert(board)
+            self.assertIsNone(result.error)
+            self.assertEqual(result.output, os.path.join(folder, 'board.kicad_pcb.fst'))
+            self.assertGreaterEqual(result.latency, result.duration)
+            self.assertEqual(watcher.poll(), [])
+
+            with open(board, 'w') as file:
+                file.write(text.replace('(at 20 10)', '(at 21 11)'))
+            os.utime(board, ns=(time.time_ns() + 10 ** 9,) * 2)
+            self.assertEqual(watch.Watcher([folder], config=config, debounce=60).poll(), [])
+            self.assertEqual(watcher.poll(), [board])
+            result = watcher.convert(board)
+            self.assertIn(' 1 parts built', result.log)
+            self.assertRegex(result.log, r'Expressions: \d+ reused, 1 parsed')
+            with open(result.output, 'rb') as file:
+                document = file.read()
+            with contextlib.redirect_stdout(io.StringIO()):
+                kicad_parse.main(board, output=os.path.join(folder, 'stream.fst'), config=config)
+            with open(os.path.join(folder, 'stream.fst'), 'rb') as file:
+                self.assertEqual(document, file.read())
+
+            os.utime(board, ns=(time.time_ns() + 2 * 10 ** 9,) * 2)
+            self.assertEqual(watcher.poll(), [board])
+            self.assertIsNone(watcher.convert(board))
+            self.assertIn('Converted', watcher.report())
+
+            with open(config, 'w') as file:
+                file.write('font_default: Courier\n')
+            os.utime(config, ns=(time.time_ns() + 3 * 10 ** 9,) * 2)
+            self.assertEqual(watcher.poll(), [board])
+            result = watcher.convert(board)
+            self.assertIsNone(result.error)
+            with open(result.output, 'rb') as file:
+                self.assertIn(b'Courier', file.read())
+
+    def testEqualNames(self):
+        with tempfile.TemporaryDirectory() as folder:
+            boards = [os.path.join(folder, name, 'board.kicad_pcb') for name in ('a', 'b')]
+            for board in boards:
+                os.mkdir(os.path.dirname(board))
+                with open(board, 'w') as file:
+                    file.write(board_generator.synthetic_board(1))
+            output_dir = os.path.join(folder, 'out')
+            os.mkdir(output_dir)
+            config = os.path.join(output_dir, 'config,ini')
+            with open(config, 'w') as file:
+                file.write('font_default: Arial\n')
+            watcher = watch.Watcher([folder], output_dir, config, debounce=0)
+            self.assertEqual(sorted(watcher.poll()), boards)
+            results = [watcher.convert(board) for board in boards]
+            self.assertEqual([result.error for result in results], [None, None])
+            self.assertEqual([result.output for result in results], [os.path.join(output_dir, 'board.kicad_pcb.fst'),
+                                       os.path.join(output_dir, 'board.kicad_pcb-2.fst')])
+            self.assertEqual(sorted(name for name in os.listdir(output_dir) if name.endswith('.fst')),
+                             ['board.kicad_pcb-2.fst', 'board.kicad_pcb.fst'])
+
+    def testReuseExpressions(self):
+        spec = board_generator.BoardSpec(modules=4, arcs=2, polys=1, zones=1, fab=2)
+        with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()) as log:
+            board = os.path.join(folder, 'board.kicad_pcb')
+            board_generator.write_board(board, spec)
+            for skip_unused in (False, True):
+                expected = kicad_parse.load_pcb(board, skip_unused=skip_unused)
+                pcb, cache = kicad_parse.load_pcb_reusing(board, {}, skip_unused)
+                self.assertEqual(pcb.view(), expected.view())
+                again, cache = kicad_parse.load_pcb_reusing(board, cache, skip_unused)
+                self.assertEqual(again.view(), expected.view())
+                self.assertIs(again.modules[0], pcb.modules[0])
+        self.assertEqual(log.getvalue().splitlines()[:2], ['Expressions: 0 reused, 62 parsed',
+                                                           'Expressions: 62 reused, 0 parsed'])
+        self.assertEqual(sexpr.split_children('(a b (c ")") (d (e)))'), [(5, 12), (13, 20)])
+
+
+class InMemoryConverter(unittest.TestCase):
+
+    def testSameAsFile(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=5, arcs=1, polys=1))
+        settings = {'font_default': 'Arial'}
+        files = sorted(os.listdir('.'))
+        with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+            board = os.path.join(folder, 'board.kicad_pcb')
+            with open(board, 'w') as file:
+                file.write(text)
+            create_topor.create_topor(board, kicad_parse.load_pcb(board), dict(settings), 'stream')
+            with open(board + '.fst', 'rb') as file:
+                expected = file.read()
+            fst = converter.Converter(settings)
+            self.assertEqual(fst.convert(text.encode(), board), expected)
+            self.assertEqual(fst.convert(gzip.compress(text.encode()), board), expected)
+            self.assertEqual(fst.convert(io.StringIO(text), board), expected)
+            target = io.BytesIO()
+            fst.convert_to(io.BytesIO(text.encode()), target, board)
+            self.assertEqual(target.getvalue(), expected)
+        self.assertEqual(settings, {'font_default': 'Arial'})
+        self.assertEqual(sorted(os.listdir('.')), files)
+        self.assertFalse(hasattr(create_topor, 'used_fp'))
+
+    def testThreads(self):
+        texts = [board_generator.generate_board(board_generator.BoardSpec(modules=modules, zones=1))
+                 for modules in (3, 4)]
+        fst = converter.Converter(kicad_parse.parse_settings(['font_size: 2\n', 'no value\n']), skip_unused=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = [fst.convert(text.encode()) for text in texts]
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda i: fst.convert(texts[i % 2].encode()), range(16)))
+        self.assertNotEqual(expected[0], expected[1])
+        self.assertEqual(results, expected * 8)
+        self.assertIn(b'height="2"', expected[0])
+
+
+class ConversionService(unittest.TestCase):
+
+    def post(self, address, body: bytes):
+        connection = http.client.HTTPConnection(*address, timeout=60)
+        connection.request('POST', '/convert?name=board.kicad_pcb', body)
+        response = connection.getresponse()
+        result = response.status, response.read()
+        connection.close()
+        return result
+
+    def testServer(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=4)).encode()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = converter.Converter().convert(text)
+        pool = server.WorkerPool(2)
+        http_server = server.ConversionServer(('127.0.0.1', 0), pool, max_body=1024 * 1024)
+        thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            address = http_server.server_address[:2]
+            self.assertEqual(self.post(address, text), (200, expected))
+            self.assertEqual(self.post(address, gzip.compress(text)), (200, expected))
+            self.assertEqual(self.post(address, b'(kicad_pcb (layers')[0], 422)
+            connection = http.client.HTTPConnection(*address, timeout=60)
+            connection.putrequest('POST', '/convert')
+            connection.putheader('Content-Length', str(1024 * 1024 + 1))
+            connection.endheaders()
+            self.assertEqual(connection.getresponse().status, 413)
+            connection.close()
+            connection = http.client.HTTPConnection(*address, timeout=60)
+            connection.request('GET', '/metrics')
+            metrics = json.loads(connection.getresponse().read())
+            connection.close()
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            pool.close()
+        self.assertEqual(metrics['requests'], 4)
+        self.assertEqual(metrics['statuses'], {'200': 2, '413': 1, '422': 1})
+        self.assertGreater(metrics['bytes_out'], len(expected) * 2)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(sorted(metrics['latency']), ['p50', 'p90', 'p99'])
+
+    def testLimits(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=2)).encode()
+        pool = server.WorkerPool(1, timeout=0.001, max_queue=0, queue_timeout=0.1)
+        try:
+            pid = pool.idle.queue[0].process.pid
+            with self.assertRaises(server.ConversionTimeout):
+                pool.convert(board_generator.synthetic_board(300).encode())
+            self.assertNotEqual(pool.idle.queue[0].process.pid, pid)
+            worker = pool.idle.get()
+            with self.assertRaises(server.ServiceBusy):
+                pool.convert(text)
+            pool.idle.put(worker)
+            pool.timeout = 60
+            pool.memory_limit = 1024
+            pid = pool.idle.queue[0].process.pid
+            self.assertTrue(pool.convert(text).startswith(b"<?xml"))
+            self.assertNotEqual(pool.idle.queue[0].process.pid, pid)
+            self.assertEqual(pool.get_metrics()['timeouts'], 1)
+            self.assertEqual(pool.get_metrics()['recycled'], 2)
+        finally:
+            pool.close()
+
+
+class SharedLayers(unittest.TestCase):
+
+    def testWildcards(self):
+        layers = kicad_parse.convert_to_layers(['*.Cu', 'F.Mask', '"*.Paste"'])
+        self.assertEqual([layer.name for layer in layers], ['F.Mask', 'B.Cu', 'B.Paste', 'F.Cu', 'F.Paste'])
+        self.assertEqual(layers[1].layer_type, 'signal')
+        again = kicad_parse.convert_to_layers(['*.Cu', 'F.Mask', '"*.Paste"'])
+        self.assertIs(again, layers)
+        self.assertIs(kicad_parse.convert_to_layers('F.Cu')[0], kicad_parse.known_layers['F.Cu'])
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            layers[0].name = 'B.Mask'
+
+    def testUnknownCountedOnce(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=3))
+        text = text.replace('(layers F.Cu B.Cu)', '(layers F.Cu B.Cu Eco1.User)')
+        text = text.replace('(layers F.Cu F.Paste F.Mask)', '(layers F.Cu F.Paste F.Mask Eco2.User)')
+        data = kicad_parse.list_to_dict(sexpr.parse(io.StringIO(text))[0])
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            pcb = kicad_parse.create_pcb(data)
+        self.assertEqual(log.getvalue(), 'Unknown layers: Eco1.User (3 elements), Eco2.User (24 elements)\n')
+        self.assertEqual([layer.name for layer in pcb.modules[0].pads[0].layers], ['F.Cu', 'F.Paste', 'F.Mask'])
+        self.assertEqual(len({id(pad.layers[0]) for module in pcb.modules for pad in module.pads}), 1)
+        self.assertEqual(pcb.modules[-1].footprint, 'ExtraSilks')
+        self.assertIs(pcb.modules[-1].layer, kicad_parse.known_layers['F.SilkS'])
+        unknown_layers = {'Eco1.User': 1}
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            modules = kicad_parse.build_modules(kicad_parse.get_all_dicts_by_key(data['kicad_pcb'], 'module'),
+                                                workers=2, chunk_size=1, unknown_layers=unknown_layers)
+        self.assertEqual(len(modules), 3)
+        self.assertEqual(unknown_layers, {'Eco1.User': 1, 'Eco2.User': 24})
+        self.assertEqual(log.getvalue(), '')
+
+
+class CoordFormatting(unittest.TestCase):
+
+    def testTrimmed(self):
+        values = ['12.7', -1 * float('12.7'), 0.1 + 0.2, '3', '-0.0000001', 100, '0.000']
+        self.assertEqual(create_topor.format_coords(values), ['12.7', '-12.7', '0.3', '3', '0', '100', '0'])
+        self.assertEqual(create_topor.format_coords(values, 2), ['12.7', '-12.7', '0.3', '3', '0', '100', '0'])
+        self.assertEqual(create_topor.format_coords(['-10.4', '-0.4', '2.5', '0.6'], 0), ['-10', '0', '2', '1'])
+        self.assertEqual(create_topor.format_coords([]), [])
+
+    def testFormatter(self):
+        formatter = create_topor.CoordFormatter(3)
+        self.assertEqual(formatter.points([('1.0004', '-2'), (0.5, '1.0004', 0)]), [('1', '-2'), ('0.5', '1')])
+        self.assertEqual(formatter.cache, {'1.0004': '1', '-2': '-2', 0.5: '0.5'})
+        copy = pickle.loads(pickle.dumps(formatter))
+        self.assertEqual((copy.precision, copy.cache), (3, {}))
+        self.assertEqual(pickle.dumps(copy), pickle.dumps(formatter))
+
+    def testPrecisionSetting(self):
+        text = board_generator.generate_board(board_generator.BoardSpec(modules=3))
+        exact = converter.Converter().convert(text.encode())
+        rounded = converter.Converter({'precision': '1'}).convert(text.encode())
+        self.assertLess(len(rounded), len(exact))
+        coords = [float(value) for value in re.findall(rb' [xy]="([^"]+)"', rounded)]
+        self.assertTrue(coords)
+        self.assertTrue(all(round(value, 1) == value for value in coords))
@@ -1,14 +1,29 @@
 from lxml import etree
 from pcb_structure import *
-import random
+from pcb_compact import CompactPCB
+from profiler import Profiler, stage
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
 import string
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, Set, Tuple, Iterator, Sequence
 
 FstTag = etree._Element
+# parts are keyed by pickles of their data, fixed protocol keeps keys the same between python versions
+PICKLE_PROTOCOL = 4
+PART_CHUNK = 256
+# digits after point of coordinates in mm, kicad keeps nanometers
+DEFAULT_PRECISION = 6
 
 version = '1.2.1'
 program = 'TopoR Lite 7.0.18707'
 
+writers = ['stream', 'tree', 'incremental', 'parallel']
 layers = [{'name': 'Paste Top', 'type': "Paste", 'thickness': "0"},
           {'name': 'Mask Top', 'type': "Mask", 'thickness': "0"},
           {'name': 'F.Cu_outline', 'type': "Assy", 'compsOutline': "on"},
@@ -17,16 +32,86 @@ layers = [{'name': 'Paste Top', 'type': "Paste", 'thickness': "0"},
           {'name': 'B.Cu_outline', 'type': "Assy", 'compsOutline': "on"},
           {'name': 'Paste Bottom', 'type': "Paste", 'thickness': "0"},
           {'name': 'Mask Bottom', 'type': "Mask", 'thickness': "0"}]
+# through hole pads get plane layer in padstacks
+plane_layer = Layer(name='Plane', layer_type='Plane')
 
-used_fp = []
-exclude_names = ['Logo', 'RP', 'TEST', 'HOLE', "CONN", "BUTTON", "EEPROM", "ANT", "REF", "LED", "HOLDER", "SWITCH"]
 
+def format_coords(values: Sequence[Union[str, float]], precision: int = DEFAULT_PRECISION) -> List[str]:
+    """
+    formats numbers to fixed precision at once, the whole batch is formatted with one format operation,
+    trailing zeros and point without fraction are trimmed
+    :param values: numbers or their strings
+    :param precision: digits after point
+    :return: formatted numbers in the same order
+    """
+    if not values:
+        return list()
+    text = ('%%.%if ' % precision * len(values)) % tuple(map(float, values))
+    # negative zeros left by rounding are the only tokens starting with minus and zero fraction
+    zero = '%.*f ' % (precision, 0)
+    tokens = text.replace('-' + zero, zero)[:-1].split(' ')
+    if precision > 0:
+        return [token.rstrip('0').rstrip('.') for token in tokens]
+    return tokens
+
+
+class CoordFormatter:
+    """
+    formats coordinates of document to fixed precision in batches, values formatted before are taken from cache,
+    as boards repeat the same coordinates, and the rest of batch is formatted at once,
+    formatter is pickled without cache, so parts keyed by pickles of their arguments keep their keys
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        self.cache: Dict[Union[str, float], str] = dict()
+
+    def __reduce__(self):
+        return CoordFormatter, (self.precision,)
 
-def create_detail(details: FstTag, figure: FpFigure):
+    def format(self, values: Sequence[Union[str, float]]) -> List[str]:
+        """
+        formats numbers
+        :param values: numbers or their strings
+        :return: formatted numbers in the same order
+        """
+        cache = self.cache
+        try:
+            return [cache[value] for value in values]
+        except KeyError:
+            missing = list(dict.fromkeys(value for value in values if value not in cache))
+            cache.update(zip(missing, format_coords(missing, self.precision)))
+            return [cache[value] for value in values]
+
+    def points(self, points: Sequence[Sequence[Union[str, float]]]) -> List[Tuple[str, str]]:
+        """
+        formats x and y of points
+        :param points: points, values after y are ignored
+        :return: formatted x and y of every point
+        """
+        values = self.format([value for point in points for value in (point[0], point[1])])
+        return list(zip(values[0::2], values[1::2]))
+
+
+def get_figure_points(figure: FpFigure) -> List[Coords]:
+    """
+    gets points of figure written to detail
+    :param figure: figure data
+    :return: points in order of detail tags
+    """
+    if isinstance(figure, FpPoly):
+        return figure.points
+    if isinstance(figure, FpCircle):
+        return [figure.center]
+    return [figure.start, figure.end]
+
+
+def create_detail(details: FstTag, figure: FpFigure, points: List[Tuple[str, str]]):
     """
     creates tag structure for detail
     :param details: parent tag
     :param figure: figure for detail
+    :param points: formatted points of figure made with get_figure_points
     :return:
     """
     detail = etree.SubElement(details, 'Detail', lineWidth=str(figure.width))
@@ -34,21 +119,21 @@ def create_detail(details: FstTag, figure: FpFigure):
     _ = etree.SubElement(detail, 'LayerRef', name=layer_name)
     if isinstance(figure, FpLine):
         tag_line = etree.SubElement(detail, 'Line')
-        _ = etree.SubElement(tag_line, 'Dot', x=figure.start[0], y=figure.start[1])
-        _ = etree.SubElement(tag_line, 'Dot', x=figure.end[0], y=figure.end[1])
+        for x, y in points:
+            _ = etree.SubElement(tag_line, 'Dot', x=x, y=y)
     elif isinstance(figure, FpCircle):
         diameter = round(2 * ((float(figure.end[0]) - float(figure.center[0])) ** 2 +
                               (float(figure.end[1]) - float(figure.center[1])) ** 2) ** 0.5, 2)
         tag_circle = etree.SubElement(detail, "Circle", diameter=str(diameter))
-        _ = etree.SubElement(tag_circle, "Center", x=str(figure.center[0]), y=str(figure.center[1]))
+        _ = etree.SubElement(tag_circle, "Center", x=points[0][0], y=points[0][1])
     elif isinstance(figure, FpPoly):
         poly_tag = etree.SubElement(detail, "Polygon")
-        for point in figure.points:
-            _ = etree.SubElement(poly_tag, "Dot", x=point[0], y=point[1])
+        for x, y in points:
+            _ = etree.SubElement(poly_tag, "Dot", x=x, y=y)
     elif isinstance(figure, FpArc):
-        arc = etree.SubElement(detail, "ArcByAngle", angle=figure.angle)
-        _ = etree.SubElement(arc, "Start", x=figure.start[0], y=figure.start[1])
-        _ = etree.SubElement(arc, "End", x=figure.end[0], y=figure.end[1])
+        arc = etree.SubElement(detail, "ArcByAngle", angle=str(figure.angle))
+        _ = etree.SubElement(arc, "Start", x=points[0][0], y=points[0][1])
+        _ = etree.SubElement(arc, "End", x=points[1][0], y=points[1][1])
 
 
 def get_label_angle(module: Module, label_type: TextType) -> float:
@@ -69,6 +154,27 @@ def get_label_angle(module: Module, label_type: TextType) -> float:
     return label_angle
 
 
+def create_shape(parent: FstTag, contour: Contour, formatter: 'CoordFormatter'):
+    """
+    creates shape of board outline contour
+    :param parent: parent tag
+    :param contour: chained lines and arcs
+    :param formatter: formatter of coordinates of document
+    :return:
+    """
+    shape = etree.SubElement(parent, 'Shape')
+    polyline = etree.SubElement(shape, 'Polyline')
+    points = formatter.points([contour[0].start] + [edge.end for edge in contour])
+    _ = etree.SubElement(polyline, "Start", x=points[0][0], y=points[0][1])
+    for edge, (x, y) in zip(contour, points[1:]):
+        if isinstance(edge, FpLine):
+            line = etree.SubElement(polyline, "SegmentLine")
+            _ = etree.SubElement(line, 'End', x=x, y=y)
+        if isinstance(edge, FpArc):
+            arc = etree.SubElement(polyline, "SegmentArcByAngle", angle=str(edge.angle))
+            _ = etree.SubElement(arc, 'End',  x=x, y=y)
+
+
 def create_header(topor: FstTag, filename: str):
     """
     creates header
@@ -113,114 +219,338 @@ def create_textstyles(topor: FstTag, settings: Dict[str, Any]):
     :return:
     """
     textstyles = etree.SubElement(topor, "TextStyles", version="1.0")
-    _ = etree.SubElement(textstyles, "TextStyle", name="Default", fontName=settings.setdefault("font_default", ""),
-                         height=settings.setdefault("font_size", "1"))
-    _ = etree.SubElement(textstyles, "TextStyle", name="Logo", fontName=settings.setdefault("font_logo", ""),
-                         height=settings.setdefault("logo_size", "3"))
+    _ = etree.SubElement(textstyles, "TextStyle", name="Default", fontName=settings.get("font_default", ""),
+                         height=settings.get("font_size", "1"))
+    _ = etree.SubElement(textstyles, "TextStyle", name="Logo", fontName=settings.get("font_logo", ""),
+                         height=settings.get("logo_size", "3"))
+
+
+@dataclass
+class Label:
+    angle: str
+    coords: Coords
+    visible: str
+
+
+@dataclass
+class ModuleDescriptor:
+    ref: str
+    name: str
+    side: str
+    angle: str
+    mirror: str
+    outline: str
+    pad_numbers: List[str]
+    ref_des: Label
+    part_name: Label
+    unique_id: str
+
+
+@dataclass
+class UsedNames:
+    names: Set[str] = field(default_factory=set)
+    spaces: Dict[str, int] = field(default_factory=dict)
+    ids: Set[str] = field(default_factory=set)
+    salts: Dict[str, int] = field(default_factory=dict)
+
+
+def uniquify_name(name: str, used: UsedNames) -> str:
+    """
+    makes name unique adding spaces, search starts from the number of spaces added to the same name last time
+    :param name: name to make unique
+    :param used: already used names
+    :return: unique name
+    """
+    count = used.spaces.get(name, 0)
+    unique = name + ' ' * count
+    while unique in used.names:
+        count += 1
+        unique = name + ' ' * count
+    used.names.add(unique)
+    used.spaces[name] = count + 1
+    return unique
+
+
+def stable_id(name: str, used: UsedNames, length: int = 7) -> str:
+    """
+    gets id of letters from hash of name, so ids are the same in every run
+    :param name: name to make id for
+    :param used: already used ids
+    :param length: number of letters
+    :return: unique id
+    """
+    salt = used.salts.get(name, 0)
+    while True:
+        digest = hashlib.sha256(('%s\0%i' % (name, salt)).encode()).digest()
+        unique_id = ''.join(string.ascii_letters[byte % len(string.ascii_letters)] for byte in digest[:length])
+        salt += 1
+        if unique_id not in used.ids:
+            used.ids.add(unique_id)
+            used.salts[name] = salt
+            return unique_id
+
+
+def describe_module(module: Module, settings: Dict[str, Any], used: UsedNames) -> ModuleDescriptor:
+    """
+    collects module names, placement, pad numbering and labels used by several sections
+    :param module: module with data
+    :param settings: data with config settings
+    :param used: already used component names and instance ids
+    :return: module descriptor
+    """
+    texts = {TextType.reference: None, TextType.value: None}
+    for text in module.texts:
+        if text.text_type in texts and texts[text.text_type] is None:
+            texts[text.text_type] = text
+    ref = texts[TextType.reference].text
+    name = uniquify_name(texts[TextType.value].text, used)
+    invisible_names = settings.get("invisible_names", "")
+    ref_des = Label(angle=str(get_label_angle(module, TextType.value)), coords=texts[TextType.value].coords,
+                    visible='off' if any([text in name for text in invisible_names]) else 'on')
+    part_name = Label(angle=str(get_label_angle(module, TextType.reference)), coords=texts[TextType.reference].coords,
+                      visible='off' if any([text in ref for text in invisible_names]) else 'on')
+    return ModuleDescriptor(ref=ref, name=name, side='Top' if 'F.' in module.layer.name else 'Bottom',
+                            angle=str(module.coords[2]) if len(module.coords) > 2 else '0',
+                            mirror='on' if 'B.Cu' in module.layer.name else 'off',
+                            outline='F.Cu_outline' if 'F.' in module.layer.name else 'B.Cu_outline',
+                            pad_numbers=[str(i) for i in range(1, len(module.pads) + 1)],
+                            ref_des=ref_des, part_name=part_name, unique_id=stable_id(ref, used))
+
+
+def describe_modules(pcb: PCB, settings: Dict[str, Any]) -> List[ModuleDescriptor]:
+    """
+    creates descriptors of all board modules
+    :param pcb: pcb data
+    :param settings: data with config settings
+    :return: descriptors in order of modules
+    """
+    used = UsedNames()
+    return [describe_module(module, settings, used) for module in pcb.modules]
+
+
+def get_pad_layer_types(pad: FpPad) -> List[str]:
+    """
+    gets padstack layer types for pad, through hole pads get plane layer
+    :param pad: pad data
+    :return: list of layer types
+    """
+    layers = pad.layers if pad.smd else pad.layers + [plane_layer]
+    used_layers = list()
+    for layer in layers:
+        if layer.layer_type not in used_layers:
+            used_layers.append(layer.layer_type.title().replace("User", "Mask"))
+    return used_layers
+
+
+def get_padstack_key(pad: FpPad) -> Tuple:
+    """
+    gets canonical geometry of pad padstack, pads with equal keys share padstack
+    :param pad: pad data
+    :return: shape, size, drill, layer types and polygon points
+    """
+    return (pad.smd, None if pad.smd else str(pad.drill), pad.pad_type, tuple(float(size) for size in pad.size),
+            tuple(get_pad_layer_types(pad)),
+            tuple((float(point[0]), float(point[1])) for point in pad.extra_points)
+            if pad.pad_type == PadType.custom else None)
 
 
-def create_extra_pads(padstacks: FstTag, module: Module, ref: str, used_extra_pads: List[str]):
+@dataclass
+class PadstackPlan:
+    padstacks: List[Tuple[str, Union[FpPad, FpPoly]]]
+    pad_refs: List[List[str]]
+    extra_refs: List[List[str]]
+    pads: int = 0
+
+
+def plan_padstacks(pcb: PCB, descriptors: List[ModuleDescriptor]) -> PadstackPlan:
+    """
+    finds unique padstacks of board pads and copper polygons, padstack is named after its first pad
+    :param pcb: pcb data
+    :param descriptors: descriptors of modules
+    :return: unique padstacks and padstack names for pads and extra pads of every module
+    """
+    plan = PadstackPlan(padstacks=list(), pad_refs=list(), extra_refs=list())
+    names: Dict[Tuple, str] = dict()
+    used_extra_pads = set()
+    for module, descriptor in zip(pcb.modules, descriptors):
+        ref = descriptor.ref
+        pad_refs = list()
+        for pad in module.pads:
+            key = ('pad',) + get_padstack_key(pad)
+            if key not in names:
+                names[key] = ref + ' ' + pad.pad_id
+                plan.padstacks.append((names[key], pad))
+            pad_refs.append(names[key])
+        extra_refs = list()
+        for figure in module.figures:
+            if "Cu" in figure.layer.name and isinstance(figure, FpPoly):
+                key = ('poly', tuple((float(point[0]), float(point[1])) for point in figure.points))
+                if key not in names:
+                    name: str = ref
+                    if name in used_extra_pads:
+                        count = 2
+                        while name + str(count) in used_extra_pads:
+                            count += 1
+                        name = name + str(count)
+                    used_extra_pads.add(name)
+                    names[key] = name
+                    plan.padstacks.append((name, figure))
+                extra_refs.append(names[key])
+        plan.pad_refs.append(pad_refs)
+        plan.extra_refs.append(extra_refs)
+        plan.pads += len(pad_refs) + len(extra_refs)
+    return plan
+
+
+def get_figure_key(figure: FpFigure) -> Tuple:
+    """
+    gets canonical geometry of module figure
+    :param figure: figure data
+    :return: type, layer, width and points of figure
+    """
+    if isinstance(figure, FpPoly):
+        points = figure.points
+    elif isinstance(figure, FpCircle):
+        points = [figure.center, figure.end]
+    else:
+        points = [figure.start, figure.end]
+    return (type(figure).__name__, figure.layer.name, float(figure.width),
+            float(figure.angle) if isinstance(figure, FpArc) else None,
+            tuple((float(point[0]), float(point[1])) for point in points))
+
+
+def get_footprint_key(module: Module, pad_refs: List[str], extra_refs: List[str]) -> Tuple:
+    """
+    gets canonical content of module footprint in local coordinates, modules with equal keys share
+    footprint, component and package
+    :param module: module data
+    :param pad_refs: padstack names for module pads
+    :param extra_refs: padstack names for module copper polygons
+    :return: footprint name, pads, extra pads and silkscreen figures
     """
-    creates extra pads from .Cu
-    :param used_extra_pads: list of also used names for extra pads
-    :param ref: name of module
-    :param module: module with pad data
+    pads = tuple((pad.pad_id, pad_refs[i], float(pad.center.pos[0]), float(pad.center.pos[1]),
+                  float(pad.center.rot) if pad.pad_type != PadType.custom else None)
+                 for i, pad in enumerate(module.pads))
+    figures = tuple(get_figure_key(figure) for figure in module.figures if 'SilkS' in figure.layer.name)
+    return module.footprint, pads, tuple(extra_refs), figures
+
+
+@dataclass
+class FootprintPlan:
+    parts: List[int]
+    part_refs: List[str]
+
+
+def plan_footprints(pcb: PCB, descriptors: List[ModuleDescriptor], padstack_plan: PadstackPlan) -> FootprintPlan:
+    """
+    finds unique footprints of board modules, footprint, component and package are named after first module
+    :param pcb: pcb data
+    :param descriptors: descriptors of modules
+    :param padstack_plan: padstacks of module pads
+    :return: indexes of modules to create library parts and part names for every module
+    """
+    plan = FootprintPlan(parts=list(), part_refs=list())
+    names: Dict[Tuple, str] = dict()
+    for i, module in enumerate(pcb.modules):
+        key = get_footprint_key(module, padstack_plan.pad_refs[i], padstack_plan.extra_refs[i])
+        if key not in names:
+            names[key] = descriptors[i].ref
+            plan.parts.append(i)
+        plan.part_refs.append(names[key])
+    return plan
+
+
+def create_extra_pad(padstacks: FstTag, name: str, figure: FpPoly, formatter: 'CoordFormatter'):
+    """
+    creates extra pad from .Cu polygon
     :param padstacks: tag to add info
+    :param name: name of padstack
+    :param figure: copper polygon
+    :param formatter: formatter of coordinates of document
     :return:
     """
-    for figure in module.figures:
-        if "Cu" in figure.layer.name:
-            if isinstance(figure, FpPoly):
-                name: str = ref
-                if name in used_extra_pads:
-                    count = 2
-                    while name + str(count) in used_extra_pads:
-                        count += 1
-                    name = name + str(count)
-                padstack = etree.SubElement(padstacks, "Padstack", name=name, type="SMD", metallized="on")
-                _ = etree.SubElement(padstack, "Thermal", spokeNum='4', minSpokeNum='4', angle='45',
-                                     spokeWidth='0.381', backoff='0.381')
-                pads_tag = etree.SubElement(padstack, "Pads")
-                pad_tag = etree.SubElement(pads_tag, "PadPoly")
-                _ = etree.SubElement(pad_tag, "LayerTypeRef", type="Signal")
-                for point in figure.points:
-                    _ = etree.SubElement(pad_tag, "Dot", x=point[0], y=point[1])
-                module.extrapads.append(name)
-                used_extra_pads.append(name)
-
-
-def create_pads(library: FstTag, pcb: PCB):
-    """
-    creates padsstack tags
-    :param library: tag to add padstacks
-    :param pcb: pcb data
+    padstack = etree.SubElement(padstacks, "Padstack", name=name, type="SMD", metallized="on")
+    _ = etree.SubElement(padstack, "Thermal", spokeNum='4', minSpokeNum='4', angle='45',
+                         spokeWidth='0.381', backoff='0.381')
+    pads_tag = etree.SubElement(padstack, "Pads")
+    pad_tag = etree.SubElement(pads_tag, "PadPoly")
+    _ = etree.SubElement(pad_tag, "LayerTypeRef", type="Signal")
+    for x, y in formatter.points(figure.points):
+        _ = etree.SubElement(pad_tag, "Dot", x=x, y=y)
+
+
+def create_pad(padstacks: FstTag, name: str, pad: FpPad, formatter: 'CoordFormatter'):
+    """
+    creates padstack tag for pad
+    :param padstacks: tag to add padstacks
+    :param name: name of padstack
+    :param pad: pad data
+    :param formatter: formatter of coordinates of document
     :return:
     """
-    padstacks = etree.SubElement(library, "Padstacks")
-    used_extra_pads = list()
-    for module in pcb.modules:
-        ref = [text.text for text in module.texts if text.text_type == TextType.reference][0]
-        print(ref)
-        for pad in module.pads:
-            if pad.smd:
-                padstack = etree.SubElement(padstacks, "Padstack", name=ref + ' ' + pad.pad_id, type="SMD",
-                                            metallized="on")
-            else:
-                padstack = etree.SubElement(padstacks, "Padstack", name=ref + ' ' + pad.pad_id,
-                                            holeDiameter=str(pad.drill), metallized="on")
-                pad.layers.append(Layer(name='Plane', layer_type='Plane'))
-            _ = etree.SubElement(padstack, "Thermal", spokeNum='4', minSpokeNum='4', angle='45', spokeWidth='0.381',
-                                 backoff='0.381')
-            pads_tag = etree.SubElement(padstack, "Pads")
-            used_layers = list()
-            for layer in pad.layers:
-                if layer.layer_type not in used_layers:
-                    layer_type = layer.layer_type.title().replace("User", "Mask")
-                    if pad.pad_type == PadType.circle:
-                        pad_tag = etree.SubElement(pads_tag, "PadCircle", diameter=pad.size[0])
-                        _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
-                    if pad.pad_type == PadType.oval:
-                        diameter = min(float(pad.size[0]), float(pad.size[1]))
-                        x = str(diameter - float(pad.size[0]))
-                        y = str(diameter - float(pad.size[1]))
-                        pad_tag = etree.SubElement(pads_tag, "PadOval", diameter=str(diameter))
-                        _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
-                        _ = etree.SubElement(pad_tag, "Stretch", x=x, y=y)
-                    if pad.pad_type == PadType.rect:
-                        width = pad.size[0]
-                        height = pad.size[1]
-                        pad_tag = etree.SubElement(pads_tag, "PadRect", width=width, height=height)
-                        _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
-                    if pad.pad_type == PadType.custom:
-                        print(pad.extra_points)
-                        pad_tag = etree.SubElement(pads_tag, "PadPoly")
-                        _ = etree.SubElement(pad_tag, "LayerTypeRef", type="Signal")
-                        for point in pad.extra_points:
-                            _ = etree.SubElement(pad_tag, "Dot", x=point[0], y=point[1])
-
-                    used_layers.append(layer_type)
-        create_extra_pads(padstacks, module, ref, used_extra_pads)
-
-
-def create_nets(parent: FstTag, nets: List[Net]):
-    """
-    creates list of nets
-    :param parent: parent topor tag
-    :param nets: lost of pcb nets
+    if pad.smd:
+        padstack = etree.SubElement(padstacks, "Padstack", name=name, type="SMD", metallized="on")
+    else:
+        padstack = etree.SubElement(padstacks, "Padstack", name=name, holeDiameter=str(pad.drill), metallized="on")
+    _ = etree.SubElement(padstack, "Thermal", spokeNum='4', minSpokeNum='4', angle='45', spokeWidth='0.381',
+                         backoff='0.381')
+    pads_tag = etree.SubElement(padstack, "Pads")
+    for layer_type in get_pad_layer_types(pad):
+        if pad.pad_type == PadType.circle:
+            pad_tag = etree.SubElement(pads_tag, "PadCircle", diameter=pad.size[0])
+            _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
+        if pad.pad_type == PadType.oval:
+            diameter = min(float(pad.size[0]), float(pad.size[1]))
+            x = str(diameter - float(pad.size[0]))
+            y = str(diameter - float(pad.size[1]))
+            pad_tag = etree.SubElement(pads_tag, "PadOval", diameter=str(diameter))
+            _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
+            _ = etree.SubElement(pad_tag, "Stretch", x=x, y=y)
+        if pad.pad_type == PadType.rect:
+            width = pad.size[0]
+            height = pad.size[1]
+            pad_tag = etree.SubElement(pads_tag, "PadRect", width=width, height=height)
+            _ = etree.SubElement(pad_tag, "LayerTypeRef", type=layer_type)
+        if pad.pad_type == PadType.custom:
+            pad_tag = etree.SubElement(pads_tag, "PadPoly")
+            _ = etree.SubElement(pad_tag, "LayerTypeRef", type="Signal")
+            for x, y in formatter.points(pad.extra_points):
+                _ = etree.SubElement(pad_tag, "Dot", x=x, y=y)
+
+
+def create_padstack(padstacks: FstTag, name: str, source: Union[FpPad, FpPoly],
+                    formatter: 'CoordFormatter'):
+    """
+    creates padstack for pad or copper polygon
+    :param padstacks: tag to add padstacks
+    :param name: name of padstack
+    :param source: pad or polygon
+    :param formatter: formatter of coordinates of document
     :return:
     """
-    netlist = etree.SubElement(parent, "NetList", version='2.0')
-    for net in nets:
-        if net.net_name:
-            net_tag = etree.SubElement(netlist, "Net", name=net.net_name)
-            for pad in net.contacts:
-                _ = etree.SubElement(net_tag, "PinRef", compName=pad[0], pinName=pad[1])
+    if isinstance(source, FpPoly):
+        create_extra_pad(padstacks, name, source, formatter)
+    else:
+        create_pad(padstacks, name, source, formatter)
 
 
-def create_groups(parent: FstTag, net_groups: List[NetGroup], nets: List[Net]):
+def create_net(netlist: FstTag, net: Net):
+    """
+    creates net with its pins
+    :param netlist: parent netlist tag
+    :param net: pcb net
+    :return:
+    """
+    if net.net_name:
+        net_tag = etree.SubElement(netlist, "Net", name=net.net_name)
+        for pad in net.contacts:
+            _ = etree.SubElement(net_tag, "PinRef", compName=pad[0], pinName=pad[1])
+
+
+def create_groups(parent: FstTag, net_groups: List[NetGroup], group_nets: Dict[str, List[str]]):
     """
     create
-    :param nets: list of nets to get groups
+    :param group_nets: names of nets of every group
     :param parent: parent Tag
     :param net_groups: list of net groups
     :return:
@@ -229,9 +559,8 @@ def create_groups(parent: FstTag, net_groups: List[NetGroup], nets: List[Net]):
     net_groups_tag = etree.SubElement(groups_tag, "NetGroups")
     for group in net_groups:
         net_group_tag = etree.SubElement(net_groups_tag, "NetGroup", name=group.name)
-        net_list = [net for net in nets if net.group == group.name]
-        for net in net_list:
-            _ = etree.SubElement(net_group_tag, "NetRef", name=net.net_name)
+        for net_name in group_nets.get(group.name, []):
+            _ = etree.SubElement(net_group_tag, "NetRef", name=net_name)
 
 
 def create_viastacks(parent: FstTag, net_groups: List[NetGroup]):
@@ -296,152 +625,584 @@ def generate_rules(parent, net_groups: List[NetGroup]):
     _ = etree.SubElement(viastacks, "AllViastacks")
 
 
-def create_connectivity(parent: FstTag, nets: List[Net]):
+def create_vias(vias: FstTag, net: Net, formatter: 'CoordFormatter'):
     """
-    creates segments of wires
-    :param parent: parent tag
-    :param nets: list of nets
+    creates vias of net
+    :param vias: parent vias tag
+    :param net: pcb net
+    :param formatter: formatter of coordinates of document
     :return:
     """
-    conn = etree.SubElement(parent, "Connectivity", version="1.3")
-    vias = etree.SubElement(conn, "Vias")
-    for net in nets:
-        for via in net.vias:
-            via_tag = etree.SubElement(vias, "Via")
-            _ = etree.SubElement(via_tag, "ViastackRef", name="Via %s" % net.group)
-            _ = etree.SubElement(via_tag, "NetRef", name=net.net_name)
-            _ = etree.SubElement(via_tag, "Org", x=str(via.center[0]), y=str(via.center[1]))
-
-    wires = etree.SubElement(conn, "Wires")
-    for net in nets:
-        for segment in net.segments:
-            for layer in segment.layers:
-                wire = etree.SubElement(wires, "Wire")
-                _ = etree.SubElement(wire, "LayerRef", name=layer.name)
-                _ = etree.SubElement(wire, "NetRef", name=net.net_name)
-                subwire = etree.SubElement(wire, "Subwire", fixed='on', width=str(segment.width))
-                _ = etree.SubElement(subwire, "Start", x=str(segment.start[0]), y=str(segment.start[1]))
-                track = etree.SubElement(subwire, "TrackLine")
-                _ = etree.SubElement(track, "End", x=str(segment.end[0]), y=str(segment.end[1]))
-
-
-def create_topor(filename: str, pcb: PCB, settings: Dict[str, Any]):
+    for x, y in formatter.points([via.center for via in net.vias]):
+        via_tag = etree.SubElement(vias, "Via")
+        _ = etree.SubElement(via_tag, "ViastackRef", name="Via %s" % net.group)
+        _ = etree.SubElement(via_tag, "NetRef", name=net.net_name)
+        _ = etree.SubElement(via_tag, "Org", x=x, y=y)
+
+
+def create_wires(wires: FstTag, net: Net, formatter: 'CoordFormatter'):
     """
-    creates pcb topor file
-    :param filename: name of file
-    :param settings: data with config settings
-    :param pcb: structure with data
+    creates wires of net segments
+    :param wires: parent wires tag
+    :param net: pcb net
+    :param formatter: formatter of coordinates of document
     :return:
     """
-    topor = etree.Element('TopoR_PCB_File')
-    create_header(topor, filename)
-    create_layers(topor)
-    create_textstyles(topor, settings)
-    library = etree.SubElement(topor, 'LocalLibrary', version="1.1")
-    create_pads(library, pcb)
-    create_viastacks(library, pcb.net_groups)
-    footprints = etree.SubElement(library, "Footprints")
-    for module in pcb.modules:
-        ref = [text.text for text in module.texts if text.text_type == TextType.reference][0]
-        footprint = etree.SubElement(footprints, 'Footprint', name=module.footprint + ' ' + ref)
-        pads = etree.SubElement(footprint, "Pads")
-        for pad in module.pads:
-            angle = str(pad.center.rot) if (pad.pad_type != PadType.custom and int(pad.center.rot) % 90 == 0) else '0'
-            pad_tag = etree.SubElement(pads, "Pad", padNum=str(module.pads.index(pad)+1), name=pad.pad_id, angle=angle)
-            _ = etree.SubElement(pad_tag, "PadstackRef", name=ref+' ' + pad.pad_id)
-            _ = etree.SubElement(pad_tag, "Org", x=str(pad.center.pos[0]), y=str(pad.center.pos[1]))
-        for pad in module.extrapads:
-            pad_tag = etree.SubElement(pads, "Pad", padNum=str(module.extrapads.index(pad)+len(module.pads)+1),
-                                       name=str(module.extrapads.index(pad)+len(module.pads)))
-            _ = etree.SubElement(pad_tag, "PadstackRef", name=pad)
-            _ = etree.SubElement(pad_tag, "Org", x='0', y='0')
-
-        details = etree.SubElement(footprint, "Details")
-        for figure in module.figures:
-            if 'SilkS' in figure.layer.name:
-                create_detail(details, figure)
-        used_fp.append(module.footprint)
-
-    components = etree.SubElement(library, "Components")
-    for module in pcb.modules:
-        ref = [text.text for text in module.texts if text.text_type == TextType.reference][0]
-        component = etree.SubElement(components, 'Component', name=ref)
-        pins = etree.SubElement(component, 'Pins')
-        for pad in module.pads:
-            _ = etree.SubElement(pins, "Pin", pinNum=str(module.pads.index(pad)+1), name=pad.pad_id,
-                                 pinSymName=pad.pad_id, pinEqual="0", gate="-1", gateEqual="0")
-
-    packages = etree.SubElement(library, "Packages")
-    for module in pcb.modules:
-        ref = [text.text for text in module.texts if text.text_type == TextType.reference][0]
-        package = etree.SubElement(packages, 'Package')
-        _ = etree.SubElement(package, 'ComponentRef', name=ref)
-        _ = etree.SubElement(package, 'FootprintRef', name=module.footprint + ' ' + ref)
-        for i in range(1, len(module.pads)+1):
-            _ = etree.SubElement(package, 'Pinpack', pinNum="%i" % i, padNum="%i" % i)
+    points = formatter.points([point for segment in net.segments for point in (segment.start, segment.end)])
+    for i, segment in enumerate(net.segments):
+        (start_x, start_y), (end_x, end_y) = points[2 * i], points[2 * i + 1]
+        for layer in segment.layers:
+            wire = etree.SubElement(wires, "Wire")
+            _ = etree.SubElement(wire, "LayerRef", name=layer.name)
+            _ = etree.SubElement(wire, "NetRef", name=net.net_name)
+            subwire = etree.SubElement(wire, "Subwire", fixed='on', width=str(segment.width))
+            _ = etree.SubElement(subwire, "Start", x=start_x, y=start_y)
+            track = etree.SubElement(subwire, "TrackLine")
+            _ = etree.SubElement(track, "End", x=end_x, y=end_y)
+
+
+def create_footprint(footprints: FstTag, module: Module, descriptor: ModuleDescriptor, ref: str, pad_refs: List[str],
+                     extra_refs: List[str], formatter: 'CoordFormatter'):
+    """
+    creates footprint of module
+    :param footprints: parent footprints tag
+    :param module: module with data
+    :param descriptor: module descriptor
+    :param ref: name of footprint part
+    :param pad_refs: padstack names for module pads
+    :param extra_refs: padstack names for module copper polygons
+    :param formatter: formatter of coordinates of document
+    :return:
+    """
+    footprint = etree.SubElement(footprints, 'Footprint', name=module.footprint + ' ' + ref)
+    pads = etree.SubElement(footprint, "Pads")
+    figures = [figure for figure in module.figures if 'SilkS' in figure.layer.name]
+    figure_points = [get_figure_points(figure) for figure in figures]
+    # pad origins and figure points of footprint are formatted at once
+    origins = formatter.points([pad.center.pos for pad in module.pads] +
+                            [point for points in figure_points for point in points])
+    for i, pad in enumerate(module.pads):
+        angle = str(pad.center.rot) if (pad.pad_type != PadType.custom and int(pad.center.rot) % 90 == 0) else '0'
+        pad_tag = etree.SubElement(pads, "Pad", padNum=descriptor.pad_numbers[i], name=pad.pad_id, angle=angle)
+        _ = etree.SubElement(pad_tag, "PadstackRef", name=pad_refs[i])
+        _ = etree.SubElement(pad_tag, "Org", x=origins[i][0], y=origins[i][1])
+    for i, padstack in enumerate(extra_refs):
+        pad_tag = etree.SubElement(pads, "Pad", padNum=str(i + len(module.pads) + 1), name=str(i + len(module.pads)))
+        _ = etree.SubElement(pad_tag, "PadstackRef", name=padstack)
+        _ = etree.SubElement(pad_tag, "Org", x='0', y='0')
+
+    details = etree.SubElement(footprint, "Details")
+    start = len(module.pads)
+    for figure, points in zip(figures, figure_points):
+        create_detail(details, figure, origins[start:start + len(points)])
+        start += len(points)
+
+
+def create_component(components: FstTag, module: Module, descriptor: ModuleDescriptor, ref: str):
+    """
+    creates component with module pins
+    :param components: parent components tag
+    :param module: module with data
+    :param descriptor: module descriptor
+    :param ref: name of component part
+    :return:
+    """
+    component = etree.SubElement(components, 'Component', name=ref)
+    pins = etree.SubElement(component, 'Pins')
+    for pad, pin_num in zip(module.pads, descriptor.pad_numbers):
+        _ = etree.SubElement(pins, "Pin", pinNum=pin_num, name=pad.pad_id,
+                             pinSymName=pad.pad_id, pinEqual="0", gate="-1", gateEqual="0")
+
+
+def create_package(packages: FstTag, module: Module, descriptor: ModuleDescriptor, ref: str):
+    """
+    creates package linking component and footprint
+    :param packages: parent packages tag
+    :param module: module with data
+    :param descriptor: module descriptor
+    :param ref: name of package part
+    :return:
+    """
+    package = etree.SubElement(packages, 'Package')
+    _ = etree.SubElement(package, 'ComponentRef', name=ref)
+    _ = etree.SubElement(package, 'FootprintRef', name=module.footprint + ' ' + ref)
+    for pin_num in descriptor.pad_numbers:
+        _ = etree.SubElement(package, 'Pinpack', pinNum=pin_num, padNum=pin_num)
 
+
+def create_constructive(topor: FstTag, edge: Contour, cutouts: List[Contour], texts: List[FpText],
+                        formatter: 'CoordFormatter'):
+    """
+    creates board outline and texts
+    :param topor: tag to add constructive
+    :param edge: board outline
+    :param cutouts: board cutouts
+    :param texts: board texts
+    :param formatter: formatter of coordinates of document
+    :return:
+    """
     constr = etree.SubElement(topor, "Constructive", version='1.2')
     board = etree.SubElement(constr, 'BoardOutline')
-    contour = etree.SubElement(board, 'Contour')
-    shape = etree.SubElement(contour, 'Shape')
-    polyline = etree.SubElement(shape, 'Polyline')
-    _ = etree.SubElement(polyline, "Start", x=str(pcb.edge[0].start[0]), y=str(pcb.edge[0].start[1]))
-    for edge in pcb.edge:
-        if isinstance(edge, FpLine):
-            line = etree.SubElement(polyline, "SegmentLine")
-            _ = etree.SubElement(line, 'End', x=edge.end[0], y=edge.end[1])
-        if isinstance(edge, FpArc):
-            arc = etree.SubElement(polyline, "SegmentArcByAngle", angle=str(edge.angle))
-            _ = etree.SubElement(arc, 'End',  x=str(edge.end[0]), y=str(edge.end[1]))
-    texts = etree.SubElement(constr, "Texts")
-    for text in pcb.texts:
-        text_tag = etree.SubElement(texts, "Text", text=text.text, angle=text.angle)
+    if edge:
+        contour = etree.SubElement(board, 'Contour')
+        create_shape(contour, edge, formatter)
+    if cutouts:
+        voids = etree.SubElement(board, 'Voids')
+        for cutout in cutouts:
+            create_shape(voids, cutout, formatter)
+    texts_tag = etree.SubElement(constr, "Texts")
+    for text, (x, y) in zip(texts, formatter.points([text.coords for text in texts])):
+        text_tag = etree.SubElement(texts_tag, "Text", text=text.text, angle=text.angle)
         _ = etree.SubElement(text_tag, 'LayerRef', name='F.Cu_outline' if 'F.' in text.layer.name else 'B.Cu_outline')
         name = "Logo" if 'Ostranna' in text.text else "Default"
         _ = etree.SubElement(text_tag, "TextStyleRef", name=name)
-        _ = etree.SubElement(text_tag, 'Org', x=text.coords[0], y=text.coords[1])
-
-    components_on_board = etree.SubElement(topor, 'ComponentsOnBoard', version='1.3')
-    components = etree.SubElement(components_on_board, "Components")
-    used_names = list()
-    for module in pcb.modules:
-        name = [text.text for text in module.texts if text.text_type == TextType.value][0]
-        ref = [text.text for text in module.texts if text.text_type == TextType.reference][0]
-        while name in used_names:
-            name += " "
-        used_names.append(name)
-        comp_inst = etree.SubElement(components, 'CompInstance', name=ref,
-                                     uniqueId=''.join(random.choice(string.ascii_letters) for x in range(7)),
-                                     side='Top' if 'F.' in module.layer.name else 'Bottom',
-                                     angle=str(module.coords[2]) if len(module.coords) > 2 else '0',
-                                     )
-        _ = etree.SubElement(comp_inst, "ComponentRef", name=ref)
-        _ = etree.SubElement(comp_inst, 'FootprintRef', name=module.footprint + ' ' + ref)
-        _ = etree.SubElement(comp_inst, 'Org', x=str(module.coords[0]), y=str(module.coords[1]))
-
-        attributes = etree.SubElement(comp_inst, 'Attributes')
-
-        attribute = etree.SubElement(attributes, 'Attribute', type="RefDes")
-        visible = 'off' if any([text in name for text in settings.setdefault("invisible_names", "")])else 'on'
-        label = etree.SubElement(attribute, "Label", mirror='on' if'B.Cu' in module.layer.name else 'off',
-                                 visible=visible, angle=str(get_label_angle(module, TextType.value)))
-        ref_coords = [text.coords for text in module.texts if text.text_type == TextType.value][0]
-        _ = etree.SubElement(label, "LayerRef", name='F.Cu_outline' if 'F.' in module.layer.name else 'B.Cu_outline')
-        _ = etree.SubElement(label, "TextStyleRef", name="Default")
-        _ = etree.SubElement(label, 'Org', x=str(ref_coords[0]), y=str(ref_coords[1]))
-
-        attribute = etree.SubElement(attributes, 'Attribute', type="PartName")
-        visible = 'off' if any([text in ref for text in settings.setdefault("invisible_names", "")]) else 'on'
-        label = etree.SubElement(attribute, "Label", mirror='on' if 'B.Cu' in module.layer.name else 'off',
-                                 visible=visible, angle=str(get_label_angle(module, TextType.reference)))
-        ref_coords = [text.coords for text in module.texts if text.text_type == TextType.reference][0]
-        _ = etree.SubElement(label, "LayerRef", name='F.Cu_outline' if 'F.' in module.layer.name else 'B.Cu_outline')
-        _ = etree.SubElement(label, "TextStyleRef", name="Default")
-        _ = etree.SubElement(label, 'Org', x=str(ref_coords[0]), y=str(ref_coords[1]))
-
-    create_nets(topor, pcb.nets)
-    create_groups(topor, pcb.net_groups, pcb.nets)
-    generate_rules(topor, pcb.net_groups)
-    create_connectivity(topor, pcb.nets)
-    xml_tree = etree.ElementTree(topor)
-    xml_tree.write(filename + '.fst', xml_declaration=True, encoding="UTF-8", pretty_print=True)
+        _ = etree.SubElement(text_tag, 'Org', x=x, y=y)
+
+
+def create_label(attributes: FstTag, attribute_type: str, descriptor: ModuleDescriptor, label: Label,
+                 origin: Tuple[str, str]):
+    """
+    creates attribute with label of placed component
+    :param attributes: parent attributes tag
+    :param attribute_type: RefDes or PartName
+    :param descriptor: module descriptor
+    :param label: label data
+    :param origin: formatted label coordinates
+    :return:
+    """
+    attribute = etree.SubElement(attributes, 'Attribute', type=attribute_type)
+    label_tag = etree.SubElement(attribute, "Label", mirror=descriptor.mirror, visible=label.visible, angle=label.angle)
+    _ = etree.SubElement(label_tag, "LayerRef", name=descriptor.outline)
+    _ = etree.SubElement(label_tag, "TextStyleRef", name="Default")
+    _ = etree.SubElement(label_tag, 'Org', x=origin[0], y=origin[1])
+
+
+def create_comp_instance(components: FstTag, module: Module, descriptor: ModuleDescriptor, part_ref: str,
+                         formatter: 'CoordFormatter'):
+    """
+    creates placed component
+    :param components: parent components on board tag
+    :param module: module with data
+    :param descriptor: module descriptor
+    :param part_ref: name of component and footprint used by module
+    :param formatter: formatter of coordinates of document
+    :return:
+    """
+    origin, ref_des, part_name = formatter.points([module.coords, descriptor.ref_des.coords,
+                                                descriptor.part_name.coords])
+    comp_inst = etree.SubElement(components, 'CompInstance', name=descriptor.ref,
+                                 uniqueId=descriptor.unique_id,
+                                 side=descriptor.side, angle=descriptor.angle)
+    _ = etree.SubElement(comp_inst, "ComponentRef", name=part_ref)
+    _ = etree.SubElement(comp_inst, 'FootprintRef', name=module.footprint + ' ' + part_ref)
+    _ = etree.SubElement(comp_inst, 'Org', x=origin[0], y=origin[1])
+
+    attributes = etree.SubElement(comp_inst, 'Attributes')
+    create_label(attributes, "RefDes", descriptor, descriptor.ref_des, ref_des)
+    create_label(attributes, "PartName", descriptor, descriptor.part_name, part_name)
+
+
+class TreeWriter:
+    """
+    builds the whole document in memory
+    """
+
+    def __init__(self):
+        self.root: FstTag = etree.Element('Document')
+        self.current: FstTag = self.root
+
+    @contextmanager
+    def element(self, tag: str, **attrib: str):
+        parent = self.current
+        self.current = etree.SubElement(parent, tag, **attrib)
+        yield
+        self.current = parent
+
+    def write(self, build: Callable[..., None], *args: Any):
+        build(self.current, *args)
+
+
+class StreamWriter:
+    """
+    writes document with incremental serialization, every built part is written out and dropped
+    """
+
+    def __init__(self, xml_file: Any):
+        self.xml_file = xml_file
+        self.depth = 0
+
+    @contextmanager
+    def element(self, tag: str, **attrib: str):
+        with self.xml_file.element(tag, attrib):
+            self.xml_file.write('\n')
+            self.depth += 1
+            yield
+            self.depth -= 1
+        if self.depth:
+            self.xml_file.write('\n')
+        self.xml_file.flush()
+
+    def write(self, build: Callable[..., None], *args: Any):
+        parent = etree.Element('Part')
+        build(parent, *args)
+        for child in parent:
+            self.xml_file.write(child, pretty_print=True)
+
+
+class ProfilingWriter:
+    """
+    writer wrapper recording document sections as profiler stages, parts written to root get own stages,
+    other parts are counted by their sections
+    """
+
+    def __init__(self, writer: Union[TreeWriter, StreamWriter], profiler: Profiler, depth: int = 3):
+        self.writer = writer
+        self.profiler = profiler
+        self.depth = depth
+        self.path: List[str] = list()
+        self.sections: List[Dict[str, int]] = list()
+
+    @contextmanager
+    def element(self, tag: str, **attrib: str):
+        self.path.append(tag)
+        if len(self.path) > self.depth:
+            with self.writer.element(tag, **attrib):
+                yield
+        else:
+            name = '/'.join(self.path[1:]) or tag
+            with self.profiler.stage(name, parts=0) as counts, self.writer.element(tag, **attrib):
+                self.sections.append(counts)
+                yield
+                self.sections.pop()
+        self.path.pop()
+
+    def write(self, build: Callable[..., None], *args: Any):
+        if len(self.path) == 1:
+            with self.profiler.stage(build.__name__):
+                self.writer.write(build, *args)
+        else:
+            self.sections[-1]['parts'] += 1
+            self.writer.write(build, *args)
+
+
+def code_hash() -> str:
+    """
+    gets hash of converter source, parts kept by previous version of converter are never reused
+    :return: hex sha256 digest
+    """
+    digest = hashlib.sha256(version.encode())
+    with open(__file__, 'rb') as file:
+        digest.update(file.read())
+    return digest.hexdigest()
+
+
+class IncrementalWriter(StreamWriter):
+    """
+    writes document as stream writer, parts with the same content hash as in previous document are copied from it
+    instead of building, offsets of written parts are kept to use them in next run
+    """
+
+    def __init__(self, xml_file: Any, file: Any, previous: bytes, previous_parts: Dict[str, List[int]]):
+        super().__init__(xml_file)
+        self.file = file
+        self.previous = previous
+        self.previous_parts = previous_parts
+        self.parts: Dict[str, List[int]] = dict()
+        self.reused = 0
+        self.built = 0
+
+    def write(self, build: Callable[..., None], *args: Any):
+        key = hashlib.sha256(pickle.dumps((build.__name__, args), PICKLE_PROTOCOL)).hexdigest()
+        if key in self.previous_parts:
+            offset, length = self.previous_parts[key]
+            data = self.previous[offset: offset + length]
+            self.reused += 1
+        else:
+            parent = etree.Element('Part')
+            build(parent, *args)
+            data = b''.join(etree.tostring(child, pretty_print=True) for child in parent)
+            self.built += 1
+        self.xml_file.flush()
+        self.parts[key] = [self.file.tell(), len(data)]
+        self.file.write(data)
+
+
+def read_parts(output: str, code: str) -> Tuple[bytes, Dict[str, List[int]]]:
+    """
+    reads previous document and offsets of its parts, nothing is reused if document was changed after writing
+    or was written by other converter version
+    :param output: name of fst file
+    :param code: hash of converter source
+    :return: previous document and offsets with lengths of parts by their content hashes
+    """
+    try:
+        with open(output + '.hashes') as file:
+            hashes = json.load(file)
+        with open(output, 'rb') as file:
+            previous = file.read()
+    except (OSError, ValueError):
+        return b'', dict()
+    if hashes.get('code') != code or hashes.get('fst') != hashlib.sha256(previous).hexdigest():
+        return b'', dict()
+    return previous, hashes.get('parts', dict())
+
+
+def profiled(writer: Union[TreeWriter, StreamWriter],
+             profiler: Optional[Profiler]) -> Union[TreeWriter, StreamWriter, ProfilingWriter]:
+    """
+    wraps writer to record sections if profiler is set
+    :param writer: writer
+    :param profiler: profiler or None
+    :return: writer to emit document
+    """
+    return ProfilingWriter(writer, profiler) if profiler else writer
+
+
+def create_topor_incremental(filename: str, pcb: Union[PCB, CompactPCB], settings: Dict[str, Any], output: str,
+                             profiler: Optional[Profiler] = None,
+                             previous_document: Optional[Tuple[bytes, Dict[str, List[int]]]] = None
+                             ) -> Tuple[bytes, Dict[str, List[int]]]:
+    """
+    creates pcb topor file reusing unchanged parts of previous file, content hashes of parts are kept in
+    .hashes file next to fst file
+    :param filename: name of file
+    :param pcb: structure with data or compact pcb
+    :param settings: data with config settings
+    :param output: name of fst file
+    :param profiler: profiler to record stages
+    :param previous_document: previous document with offsets of its parts kept in memory, read from files if not set
+    :return: written document and offsets with lengths of its parts by content hashes
+    """
+    code = code_hash()
+    previous, previous_parts = previous_document or read_parts(output, code)
+    temp_path = output + '.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            with etree.xmlfile(file, encoding="UTF-8") as xml_file:
+                xml_file.write_declaration()
+                writer = IncrementalWriter(xml_file, file, previous, previous_parts)
+                emit_topor(profiled(writer, profiler), filename, pcb, settings, profiler)
+        with open(temp_path, 'rb') as file:
+            document = file.read()
+        digest = hashlib.sha256(document).hexdigest()
+        os.replace(temp_path, output)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    with open(output + '.hashes', 'w') as file:
+        json.dump({'code': code, 'fst': digest, 'parts': writer.parts}, file)
+    print('Incremental: %i parts reused, %i parts built' % (writer.reused, writer.built))
+    return document, writer.parts
+
+
+Task = Tuple[Callable[..., None], Tuple[Any, ...]]
+
+
+class ParallelWriter:
+    """
+    records document structure and parts to build parts later in process pool, consecutive parts of section
+    are split to chunks, so large sections as connectivity are built by groups of nets
+    """
+
+    def __init__(self, chunk_size: int = PART_CHUNK):
+        self.chunk_size = chunk_size
+        self.tasks: List[Task] = list()
+        self.events: List[Tuple[str, Any]] = list()
+
+    @contextmanager
+    def element(self, tag: str, **attrib: str):
+        self.events.append(('start', (tag, attrib)))
+        yield
+        self.events.append(('end', None))
+
+    def write(self, build: Callable[..., None], *args: Any):
+        last = self.events[-1] if self.events else None
+        if last and last[0] == 'parts' and last[1][1] - last[1][0] < self.chunk_size:
+            last[1][1] += 1
+        else:
+            self.events.append(('parts', [len(self.tasks), len(self.tasks) + 1]))
+        self.tasks.append((build, args))
+
+    def get_bounds(self) -> List[Tuple[int, int]]:
+        return [(value[0], value[1]) for kind, value in self.events if kind == 'parts']
+
+
+def build_parts(tasks: List[Task]) -> bytes:
+    """
+    builds chunk of parts and serializes them as stream writer does
+    :param tasks: build functions with their arguments
+    :return: serialized parts
+    """
+    parent = etree.Element('Part')
+    for build, args in tasks:
+        build(parent, *args)
+    return b''.join(etree.tostring(child, pretty_print=True) for child in parent)
+
+
+# parts of document being built, forked workers get them without pickling
+shared_tasks: List[Task] = list()
+
+
+def build_shared_parts(bounds: Tuple[int, int]) -> bytes:
+    """
+    builds chunk of parts inherited by forked worker
+    :param bounds: start and end indexes of chunk
+    :return: serialized parts
+    """
+    return build_parts(shared_tasks[bounds[0]:bounds[1]])
+
+
+def build_chunks(tasks: List[Task], bounds: List[Tuple[int, int]], workers: int) -> Iterator[bytes]:
+    """
+    builds chunks of parts in process pool, results keep order of chunks
+    :param tasks: build functions with their arguments
+    :param bounds: start and end indexes of chunks
+    :param workers: number of worker processes, parts are built in this process if 1
+    :return: serialized chunks
+    """
+    global shared_tasks
+    if workers <= 1 or len(bounds) <= 1:
+        for start, end in bounds:
+            yield build_parts(tasks[start:end])
+    elif 'fork' in multiprocessing.get_all_start_methods():
+        shared_tasks = tasks
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                yield from executor.map(build_shared_parts, bounds)
+        finally:
+            shared_tasks = list()
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            yield from executor.map(build_parts, [tasks[start:end] for start, end in bounds])
+
+
+def create_topor_parallel(filename: str, pcb: Union[PCB, CompactPCB], settings: Dict[str, Any], output: str,
+                          workers: int = 1, profiler: Optional[Profiler] = None, chunk_size: int = PART_CHUNK):
+    """
+    creates pcb topor file building parts of all sections in process pool, chunks are written in document order,
+    so the file is the same as stream writer gives
+    :param filename: name of file
+    :param pcb: structure with data or compact pcb
+    :param settings: data with config settings
+    :param output: name of fst file
+    :param workers: number of worker processes
+    :param profiler: profiler to record stages
+    :param chunk_size: maximal number of parts in chunk
+    :return:
+    """
+    writer = ParallelWriter(chunk_size)
+    emit_topor(writer, filename, pcb, settings, profiler)
+    bounds = writer.get_bounds()
+    with stage(profiler, 'write', parts=len(writer.tasks), chunks=len(bounds), workers=workers):
+        with open(output, 'wb') as file, etree.xmlfile(file, encoding="UTF-8") as xml_file:
+            xml_file.write_declaration()
+            stream_writer = StreamWriter(xml_file)
+            chunks = build_chunks(writer.tasks, bounds, workers)
+            elements = list()
+            for kind, value in writer.events:
+                if kind == 'start':
+                    elements.append(stream_writer.element(value[0], **value[1]))
+                    elements[-1].__enter__()
+                elif kind == 'end':
+                    elements.pop().__exit__(None, None, None)
+                else:
+                    xml_file.flush()
+                    file.write(next(chunks))
+
+
+def emit_topor(writer: Union[TreeWriter, StreamWriter, IncrementalWriter, ParallelWriter, ProfilingWriter],
+               filename: str, pcb: Union[PCB, CompactPCB], settings: Dict[str, Any],
+               profiler: Optional[Profiler] = None):
+    """
+    emits pcb topor document section by section
+    :param writer: tree or stream writer
+    :param filename: name of file
+    :param pcb: structure with data, compact pcb is viewed lazily, so its modules and nets are never kept
+    as dataclasses at once
+    :param settings: data with config settings
+    :param profiler: profiler to record planning stages, sections are recorded by profiling writer
+    :return:
+    """
+    if isinstance(pcb, CompactPCB):
+        pcb = pcb.view(lazy=True)
+    formatter = CoordFormatter(int(settings.get('precision', DEFAULT_PRECISION)))
+    with writer.element('TopoR_PCB_File'):
+        writer.write(create_header, filename)
+        writer.write(create_layers)
+        writer.write(create_textstyles, settings)
+        with writer.element('LocalLibrary', version="1.1"):
+            with stage(profiler, 'describe_modules', modules=len(pcb.modules)):
+                descriptors = describe_modules(pcb, settings)
+            with stage(profiler, 'plan_padstacks') as counts:
+                padstack_plan = plan_padstacks(pcb, descriptors)
+                counts.update(pads=padstack_plan.pads, padstacks=len(padstack_plan.padstacks))
+            with writer.element("Padstacks"):
+                for name, source in padstack_plan.padstacks:
+                    writer.write(create_padstack, name, source, formatter)
+            writer.write(create_viastacks, pcb.net_groups)
+            with stage(profiler, 'plan_footprints') as counts:
+                footprint_plan = plan_footprints(pcb, descriptors, padstack_plan)
+                counts.update(modules=len(footprint_plan.part_refs), footprints=len(footprint_plan.parts))
+            with writer.element("Footprints"):
+                for i in footprint_plan.parts:
+                    writer.write(create_footprint, pcb.modules[i], descriptors[i], footprint_plan.part_refs[i],
+                                 padstack_plan.pad_refs[i], padstack_plan.extra_refs[i], formatter)
+            with writer.element("Components"):
+                for i in footprint_plan.parts:
+                    writer.write(create_component, pcb.modules[i], descriptors[i], footprint_plan.part_refs[i])
+            with writer.element("Packages"):
+                for i in footprint_plan.parts:
+                    writer.write(create_package, pcb.modules[i], descriptors[i], footprint_plan.part_refs[i])
+        writer.write(create_constructive, pcb.edge, pcb.cutouts, pcb.texts, formatter)
+        with writer.element('ComponentsOnBoard', version='1.3'):
+            with writer.element("Components"):
+                for i, module in enumerate(pcb.modules):
+                    writer.write(create_comp_instance, module, descriptors[i], footprint_plan.part_refs[i],
+                                 formatter)
+        with writer.element("NetList", version='2.0'):
+            for net in pcb.nets:
+                writer.write(create_net, net)
+        group_nets = {group: [net.net_name for net in nets] for group, nets in pcb.net_index.by_group().items()}
+        writer.write(create_groups, pcb.net_groups, group_nets)
+        writer.write(generate_rules, pcb.net_groups)
+        with writer.element("Connectivity", version="1.3"):
+            with writer.element("Vias"):
+                for net in pcb.nets:
+                    writer.write(create_vias, net, formatter)
+            with writer.element("Wires"):
+                for net in pcb.nets:
+                    writer.write(create_wires, net, formatter)
+
+
+def create_topor(filename: str, pcb: Union[PCB, CompactPCB], settings: Dict[str, Any], writer: str = 'stream',
+                 output: Optional[str] = None, profiler: Optional[Profiler] = None, workers: int = 1):
+    """
+    creates pcb topor file
+    :param filename: name of file
+    :param settings: data with config settings
+    :param pcb: structure with data or compact pcb
+    :param writer: stream to write sections as they are built, tree to build the whole document first
+    incremental to reuse unchanged parts of previous output or parallel to build parts in process pool
+    :param output: name of fst file, filename with .fst extension if not set
+    :param profiler: profiler to record sections, stages are not recorded if not set
+    :param workers: number of processes for parallel writer
+    :return:
+    """
+    output = output or filename + '.fst'
+    if writer == 'tree':
+        tree_writer = TreeWriter()
+        emit_topor(profiled(tree_writer, profiler), filename, pcb, settings, profiler)
+        with stage(profiler, 'write'):
+            xml_tree = etree.ElementTree(tree_writer.root[0])
+            xml_tree.write(output, xml_declaration=True, encoding="UTF-8", pretty_print=True)
+    elif writer == 'stream':
+        with etree.xmlfile(output, encoding="UTF-8") as xml_file:
+            xml_file.write_declaration()
+            emit_topor(profiled(StreamWriter(xml_file), profiler), filename, pcb, settings, profiler)
+    elif writer == 'incremental':
+        create_topor_incremental(filename, pcb, settings, output, profiler)
+    elif writer == 'parallel':
+        create_topor_parallel(filename, pcb, settings, output, workers, profiler)
+    else:
+        raise ValueError('Unknown writer %s' % writer)
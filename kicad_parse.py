@@ -1,86 +1,159 @@
 from pyparsing import OneOrMore, nestedExpr
-from typing import Dict, Any, List, Union
-import pprint
+from typing import Dict, Any, List, Union, Iterable, Optional, Tuple, TextIO
+import os
+import argparse
+import functools
+import io
 import math
-import sys
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from pcb_structure import *
+from pcb_compact import CompactFigure, CompactModule, CompactNet, CompactPad, CompactPCB, CompactText, NM_PER_MM, \
+    array_to_points, to_nm
 import create_topor
+import pcb_cache
+import sexpr
+import simplify
+from profiler import Profiler, profile_formats, stage
 
+engines = ['sexpr', 'pyparsing', 'mmap']
+# changes of parsing or pcb model have to change version to skip boards cached before
+parser_version = '4'
+# modules are built by chunks of this size in worker processes
+MODULE_CHUNK = 256
+# net id, module reference and pad id
+Contact = Tuple[Union[str, float], str, str]
+BuiltModule = Tuple[CompactModule, List[Contact]]
+CompactContour = List[CompactFigure]
+# point in nanometres
+Point = Tuple[int, int]
+edge_tolerance = 0.5
+# subtrees never emitted to topor, parser skips them when unused subtrees are skipped
+unused_tags = {'zone', 'tstamp', 'path'}
+unused_layers = {'F.Fab', 'B.Fab', 'F.CrtYd', 'B.CrtYd'}
+layer_figures = {'fp_line', 'fp_circle', 'fp_arc', 'fp_poly', 'fp_text'}
 layer_list = ['F.Cu', 'B.Cu', 'Edge.Cuts', 'F.SilkS', 'B.SilkS', 'F.Mask', 'B.Mask', 'Dwgs.User', 'F.Paste', 'B.Paste',
               'B.Fab', 'F.Fab', 'F.CrtYd', 'B.CrtYd', 'F.Adhes', 'B.Adhes']
+# layers shared by all elements, layer tokens of elements are resolved to them
+known_layers: Dict[str, Layer] = {name: Layer(name=name, layer_type="signal" if name in ['F.Cu', 'B.Cu'] else "user")
+                                  for name in layer_list}
 
 
-def get_settings() -> Dict[str, Any]:
+def get_settings(filename: str = "config,ini") -> Dict[str, Any]:
     """
     gets settings from config file
+    :param filename: name of config file
+    :return:
+    """
+    with open(filename) as file_config:
+        return parse_settings(file_config)
+
+
+def parse_settings(lines: Iterable[str]) -> Dict[str, Any]:
+    """
+    parses settings from lines of config
+    :param lines: lines with key and value separated by colon, text stream of config for example
     :return:
     """
     settings = dict()
-    with open("config,ini") as file_config:
-        for line in file_config:
-            try:
-                key = line.split(":")[0]
-                value = line.split(":")[1].strip().split() if key == 'invisible_manes' else line.split(":")[1].strip()
-                settings[key] = value
-            except IndexError:
-                pass
+    for line in lines:
+        try:
+            key = line.split(":")[0]
+            value = line.split(":")[1].strip().split() if key == 'invisible_manes' else line.split(":")[1].strip()
+            settings[key] = value
+        except IndexError:
+            pass
     return settings
 
 
-def get_end_point(arc: FpArc)->Coords:
+def get_end_point(arc: CompactFigure) -> Point:
     """
-    gets end point for arc using center and angle
-    :param arc: arc data
-    :return: end point by x and y
+    gets end point for arc rotating start point around center by angle
+    :param arc: arc data, end point is arc center
+    :return: end point by x and y in nm
     """
-    x: float = float(arc.start[0])
-    y: float = float(arc.start[1])
-    ang: float = float(arc.angle)
-    x_c: float = float(arc.end[0])
-    y_c: float = float(arc.end[1])
-    r: float = math.sqrt((x - x_c) * (x - x_c) + (y - y_c) * (y - y_c))
-    start_angle: float = math.atan2(y - y_c, x - x_c) / math.pi * 180
-    stop_angle: float = start_angle + ang
-    if ang > 0:
-        da: float = 0.1
-        cond = lambda a: a < stop_angle
-    else:
-        da = - 0.1
-        cond = lambda a: a > stop_angle
-    a = start_angle
-    while cond(a):
-        x = x_c + r * math.cos(a / 180 * math.pi)
-        y = y_c + r * math.sin(a / 180 * math.pi)
-        a += da
-    return [str(x), str(y)]
+    x, y, x_c, y_c = arc.points
+    ang: float = math.radians(arc.angle)
+    cos_a: float = math.cos(ang)
+    sin_a: float = math.sin(ang)
+    return round(x_c + (x - x_c) * cos_a - (y - y_c) * sin_a), round(y_c + (x - x_c) * sin_a + (y - y_c) * cos_a)
 
 
-def list_to_dict(pcb_data: List) -> Dict[str, Any]:
+def get_end_points(arcs: List[CompactFigure]) -> List[Point]:
+    """
+    gets end points for list of arcs in one vectorized call if numpy is available
+    :param arcs: arcs data, end points are arc centers
+    :return: end points by x and y in nm
     """
+    if np is None or not arcs:
+        return [get_end_point(arc) for arc in arcs]
+    data = np.array([tuple(arc.points) + (arc.angle,) for arc in arcs], dtype=float)
+    dx = data[:, 0] - data[:, 2]
+    dy = data[:, 1] - data[:, 3]
+    ang = np.radians(data[:, 4])
+    cos_a = np.cos(ang)
+    sin_a = np.sin(ang)
+    xs = np.rint(data[:, 2] + dx * cos_a - dy * sin_a).astype(np.int64).tolist()
+    ys = np.rint(data[:, 3] + dx * sin_a + dy * cos_a).astype(np.int64).tolist()
+    return list(zip(xs, ys))
 
-    :param pcb_data:
+
+def resolve_arcs(arcs: List[CompactFigure]):
+    """
+    replaces arc centers stored as end points with arc end points
+    :param arcs: list of arcs created with create_arc without resolving
     :return:
     """
+    for arc, end in zip(arcs, get_end_points(arcs)):
+        arc.points[2:] = array('q', end)
+
+
+class Node(list):
+    """
+    list of node children with index of dict children by their keys, filled by list_to_dict
+    """
+    __slots__ = ('tags',)
+
+    def __init__(self, children: Iterable[Any] = ()):
+        super().__init__()
+        self.tags: Dict[str, List[Dict[str, Any]]] = dict()
+        for child in children:
+            self.append(child)
+
+    def append(self, child: Any):
+        if isinstance(child, dict):
+            for key in child:
+                self.tags.setdefault(key, []).append(child)
+        super().append(child)
+
+
+def list_to_dict(pcb_data: List) -> Dict[str, Any]:
+    """
+    converts parsed s-expression to dict with its tag as key, children are collected to indexed Node
+    :param pcb_data: s-expression as nested lists
+    :return: dict with tag and its value or children
+    """
     res = {}
     if not pcb_data or len(pcb_data) < 2:
         return res
-    if len(pcb_data) == 2:
-        res[pcb_data[0]] = pcb_data[1]
-        if not isinstance(res[pcb_data[0]], list):
-            try:
-                res[pcb_data[0]] = float(res[pcb_data[0]])
-            except ValueError:
-                pass
-    else:
-        res[pcb_data[0]] = pcb_data[1:]
-    current_data = res[pcb_data[0]]
-    if isinstance(current_data, list):
-        for word in current_data:
-            if isinstance(word, list):
-                i = current_data.index(word)
-                current_data[i] = list_to_dict(word)
-
+    if len(pcb_data) == 2 and not isinstance(pcb_data[1], list):
+        try:
+            res[pcb_data[0]] = float(pcb_data[1])
+        except ValueError:
+            res[pcb_data[0]] = pcb_data[1]
+        return res
+    # single list child is used as a node itself
+    current_data = Node()
+    for word in (pcb_data[1] if len(pcb_data) == 2 else pcb_data[1:]):
+        current_data.append(list_to_dict(word) if isinstance(word, list) else word)
+    res[pcb_data[0]] = current_data
     return res
 
 
@@ -91,6 +164,9 @@ def get_dict_by_key(pcb_data: List[Dict[str, Any]], key: str) -> Dict[str, Any]:
     :param pcb_data: list with dicts
     :return: dict with given key
     """
+    if isinstance(pcb_data, Node):
+        found = pcb_data.tags.get(key)
+        return found[0] if found else {}
     for d in pcb_data:
         if isinstance(d, dict) and key in d.keys():
             return d
@@ -104,6 +180,8 @@ def get_all_dicts_by_key(pcb_data: List[Dict[str, Any]], key: str) -> List[Dict[
     :param pcb_data: list with dicts
     :return: dicts with given key
     """
+    if isinstance(pcb_data, Node):
+        return list(pcb_data.tags.get(key, ()))
     res: List[Dict[str, Any]] = list()
     for d in pcb_data:
         if isinstance(d, dict) and key in d.keys():
@@ -111,58 +189,190 @@ def get_all_dicts_by_key(pcb_data: List[Dict[str, Any]], key: str) -> List[Dict[
     return res
 
 
-def convert_to_layers(layer_data: Union[List[str], str])-> List[Layer]:
+def get_point(data: List[Any]) -> Point:
+    """
+    converts kicad point to nanometres flipping y axis as kicad y goes down and topor y goes up
+    :param data: x and y in mm as parsed
+    :return: x and y in nm
+    """
+    return to_nm(data[0]), -to_nm(data[1])
+
+
+def get_coords(data: List[Dict[str, Any]], key: str) -> Point:
+    """
+    gets point in nanometres with flipped y, parsed data is not changed
+    :param data: element data
+    :param key: key of point (at, start, end, center)
+    :return: x and y of point
+    """
+    return get_point(get_dict_by_key(data, key)[key])
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve_layers(layer_tokens: Tuple[str, ...]) -> Tuple[Tuple[Layer, ...], Tuple[str, ...]]:
+    """
+    resolves layer tokens of element to shared layers, *. tokens give B. and F. layers after other layers,
+    results are memoized as boards use few distinct token lists
+    :param layer_tokens: layer tokens as parsed
+    :return: layers and names of unknown layers
+    """
+    names = [token for token in layer_tokens if "*." not in token]
+    stars = [token for token in layer_tokens if "*." in token]
+    names.extend(token.replace("*", "B") for token in stars)
+    names.extend(token.replace("*", "F") for token in stars)
+    layers: List[Layer] = list()
+    unknown: List[str] = list()
+    for name in names:
+        name = name.replace('"', '')
+        if name in known_layers:
+            layers.append(known_layers[name])
+        else:
+            unknown.append(name)
+    return tuple(layers), tuple(unknown)
+
+
+def convert_to_layers(layer_data: Union[List[str], str],
+                      unknown_layers: Optional[Dict[str, int]] = None) -> Tuple[Layer, ...]:
     """
-    converts str layer data to layer list
+    converts str layer data to layers, layers and their tuples are shared between elements
     :param layer_data: data with layers
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return:
     """
-    if not isinstance(layer_data, List):
-        layer_data = [layer_data]
-    # change *. to F. and B.
-    star_layer = [layer for layer in layer_data if "*." in layer]
-    b_stars = [layer.replace("*", "B") for layer in star_layer]
-    f_stars = [layer.replace("*", "F") for layer in star_layer]
-    layer_data = [layer for layer in layer_data if "*." not in layer]
-    layer_data.extend(b_stars)
-    layer_data.extend(f_stars)
-    result: List[Layer] = list()
-    for layer in layer_data:
-        layer = layer.replace('"', '')
-        if layer in layer_list:
-            layer_type = "signal" if layer in ['F.Cu', 'B.Cu'] else "user"
-            result.append(Layer(name=layer, layer_type=layer_type))
+    layers, unknown = resolve_layers(tuple(layer_data) if isinstance(layer_data, list) else (layer_data,))
+    for name in unknown:
+        if unknown_layers is None:
+            print('Unknown layer %s' % name)
         else:
-            print('Unknown layer %s' % layer)
-    return result
+            unknown_layers[name] = unknown_layers.get(name, 0) + 1
+    return layers
 
 
-def create_module(module_dict: Dict[str, Any], nets: List[Net]) -> Module:
+def report_unknown_layers(unknown_layers: Dict[str, int]):
     """
-    creates PCB Kicad module from data list
-    :param nets: list of nets
-    :param module_dict: list with module fields
+    prints unknown layers once for board
+    :param unknown_layers: numbers of elements by unknown layer names
     :return:
     """
+    if unknown_layers:
+        print('Unknown layers: %s' % ', '.join('%s (%i elements)' % item for item in sorted(unknown_layers.items())))
+
+
+def build_module(module_dict: Dict[str, Any], pending_arcs: Optional[List[CompactFigure]] = None,
+                 unknown_layers: Optional[Dict[str, int]] = None) -> BuiltModule:
+    """
+    creates PCB Kicad module from data list without changing nets, so modules can be built in parallel
+    :param module_dict: list with module fields
+    :param pending_arcs: list to collect arcs for resolving later, arcs are resolved at once if not set
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: module and contacts of its pads to add to nets with add_contacts
+    """
     m_data = module_dict['module']
     footprint = m_data[0].replace('"',  "")
-    layer = convert_to_layers(get_dict_by_key(m_data, 'layer')['layer'])[0]
-    coords = get_dict_by_key(m_data, 'at')['at']
-    if len(coords) == 3 and "B." in layer.name:
-        coords[2] = (float(coords[2]) + 180) % 360
-    coords[1] = str(-1*float(coords[1]))
+    layer = convert_to_layers(get_dict_by_key(m_data, 'layer')['layer'], unknown_layers)[0]
+    at = get_dict_by_key(m_data, 'at')['at']
+    x, y = get_point(at)
+    angle = at[2] if len(at) == 3 else None
+    if angle is not None and "B." in layer.name:
+        angle = (float(angle) + 180) % 360
     attr = get_dict_by_key(m_data, 'attr')
     smd: bool = True if (attr and attr['attr'] == 'smd') else False
-    module_texts: List[FpText] = get_texts(m_data, 'fp_text')
-    figures: List[Union[FpPoly, FpCircle, FpArc, FpLine]] = get_lines(m_data, 'fp_line')
-    figures.extend(get_circles(m_data, 'fp_circle'))
-    pads = get_pads(m_data, nets)
+    module_texts: List[CompactText] = get_texts(m_data, 'fp_text', unknown_layers)
+    figures: List[CompactFigure] = get_lines(m_data, 'fp_line', unknown_layers)
+    figures.extend(get_circles(m_data, 'fp_circle', unknown_layers))
+    pads, pad_coords = get_pads(m_data, unknown_layers)
     ref = [text.text for text in module_texts if text.text_type ==TextType.reference][0]
-    update_nets_with_pads(pads, nets, ref)
-    figures.extend(get_polys(m_data, 'fp_poly'))
-    figures.extend(get_arcs(m_data, 'fp_arc'))
-    return Module(footprint=footprint, layer=layer, coords=coords, smd=smd,
-                  texts=module_texts, pads=pads, figures=figures, extrapads=list())
+    figures.extend(get_polys(m_data, 'fp_poly', unknown_layers))
+    figures.extend(get_arcs(m_data, 'fp_arc', pending_arcs, unknown_layers))
+    module = CompactModule(footprint=footprint, layer=layer, x=x, y=y, angle=angle, smd=smd,
+                           texts=module_texts, figures=figures, pads=pads, pad_coords=pad_coords)
+    return module, get_contacts(pads, ref)
+
+
+def create_module(module_dict: Dict[str, Any], nets: NetIndex,
+                  pending_arcs: Optional[List[CompactFigure]] = None) -> CompactModule:
+    """
+    creates PCB Kicad module from data list and adds its pads to nets
+    :param nets: index of nets
+    :param module_dict: list with module fields
+    :param pending_arcs: list to collect arcs for resolving later, arcs are resolved at once if not set
+    :return:
+    """
+    module, contacts = build_module(module_dict, pending_arcs)
+    add_contacts(contacts, nets)
+    return module
+
+
+def build_module_chunk(module_dicts: List[Dict[str, Any]],
+                       unknown_layers: Optional[Dict[str, int]] = None) -> List[BuiltModule]:
+    """
+    builds modules resolving their arcs at once
+    :param module_dicts: list of module data
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: modules with their contacts in the same order
+    """
+    pending_arcs: List[CompactFigure] = list()
+    result = [build_module(module_dict, pending_arcs, unknown_layers) for module_dict in module_dicts]
+    resolve_arcs(pending_arcs)
+    return result
+
+
+def build_counted_chunk(module_dicts: List[Dict[str, Any]]) -> Tuple[List[BuiltModule], Dict[str, int]]:
+    """
+    builds modules in worker process counting unknown layers to report them in main process
+    :param module_dicts: list of module data
+    :return: modules with their contacts and numbers of elements by unknown layer names
+    """
+    unknown_layers: Dict[str, int] = dict()
+    return build_module_chunk(module_dicts, unknown_layers), unknown_layers
+
+
+# module data of board being built, forked workers get it without pickling
+shared_modules: List[Dict[str, Any]] = list()
+
+
+def build_shared_chunk(bounds: Tuple[int, int]) -> Tuple[List[BuiltModule], Dict[str, int]]:
+    """
+    builds chunk of modules inherited by forked worker
+    :param bounds: start and end indexes of chunk
+    :return: modules with their contacts and numbers of elements by unknown layer names
+    """
+    return build_counted_chunk(shared_modules[bounds[0]:bounds[1]])
+
+
+def build_modules(module_dicts: List[Dict[str, Any]], workers: int = 1, chunk_size: int = MODULE_CHUNK,
+                  unknown_layers: Optional[Dict[str, int]] = None) -> List[BuiltModule]:
+    """
+    builds modules in process pool by chunks, results keep order of modules
+    :param module_dicts: list of module data
+    :param workers: number of worker processes, modules are built in this process if 1
+    :param chunk_size: number of modules in chunk
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: modules with their contacts
+    """
+    global shared_modules
+    bounds = [(start, min(start + chunk_size, len(module_dicts))) for start in range(0, len(module_dicts), chunk_size)]
+    if workers <= 1 or len(bounds) <= 1:
+        return build_module_chunk(module_dicts, unknown_layers)
+    result: List[BuiltModule] = list()
+    if 'fork' in multiprocessing.get_all_start_methods():
+        shared_modules = module_dicts
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                chunks = list(executor.map(build_shared_chunk, bounds))
+        finally:
+            shared_modules = list()
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            chunks = list(executor.map(build_counted_chunk, [module_dicts[start:end] for start, end in bounds]))
+    for chunk, chunk_unknown in chunks:
+        result.extend(chunk)
+        for name, count in chunk_unknown.items():
+            if unknown_layers is None:
+                print('Unknown layer %s' % name)
+            else:
+                unknown_layers[name] = unknown_layers.get(name, 0) + count
+    return result
 
 
 def get_layers(layer_data: Dict[str, Any]) -> List[Layer]:
@@ -185,14 +395,16 @@ def get_layers(layer_data: Dict[str, Any]) -> List[Layer]:
         print("Wrong file structure, unable to get layers")
 
 
-def get_texts(m_data: List[Dict[str, Any]], text_tag: str) -> List[FpText]:
+def get_texts(m_data: List[Dict[str, Any]], text_tag: str,
+              unknown_layers: Optional[Dict[str, int]] = None) -> List[CompactText]:
     """
     gets texts for module
     :param text_tag: tag for find text
     :param m_data: module data
-    :return: list of FpText
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: list of texts
     """
-    fp_texts: List[FpText] = list()
+    fp_texts: List[CompactText] = list()
     for text_data in get_all_dicts_by_key(m_data, text_tag):
         fp_text = text_data[text_tag]
         if text_tag == 'fp_text':
@@ -207,134 +419,143 @@ def get_texts(m_data: List[Dict[str, Any]], text_tag: str) -> List[FpText]:
             text_type = TextType.simple
             caption: str = fp_text[0].replace('"', "")
         coords_data = get_dict_by_key(fp_text, 'at')['at']
-        coords: Coords = [coords_data[0], str(-1*(float(coords_data[1])))]
+        x, y = get_point(coords_data)
         angle = coords_data[2] if len(coords_data) > 2 else '0'
-        layer: Layer = convert_to_layers(get_dict_by_key(fp_text, 'layer')['layer'])[0]
-        fp_texts.append(FpText(text_type=text_type, text=caption, coords=coords, layer=layer, angle=angle))
+        layer: Layer = convert_to_layers(get_dict_by_key(fp_text, 'layer')['layer'], unknown_layers)[0]
+        fp_texts.append(CompactText(text_type=text_type, text=caption, layer=layer, x=x, y=y, angle=angle))
     return fp_texts
 
 
-def create_line(line_data: Dict[str, Any], line_tag: str) -> FpLine:
+def create_line(line_data: Dict[str, Any], line_tag: str,
+                unknown_layers: Optional[Dict[str, int]] = None) -> CompactFigure:
     """
     create line
     :param line_tag: tag for line
     :param line_data: dict with line data
-    :return: FpLine object
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: line figure
     """
     fp_line = line_data[line_tag]
-    start: Coords = [get_dict_by_key(fp_line, 'start')['start'][0], get_dict_by_key(fp_line, 'start')['start'][1]]
-    start[1] = str(-1 * float(start[1]))
-    end: Coords = [get_dict_by_key(fp_line, 'end')['end'][0], get_dict_by_key(fp_line, 'end')['end'][1]]
-    end[1] = str(-1 * float(end[1]))
-    layer: Layer = convert_to_layers(get_dict_by_key(fp_line, 'layer')['layer'])[0]
-    width: float = get_dict_by_key(fp_line, 'width')['width']
-    new_line = FpLine(start=start, end=end, layer=layer, width=width)
+    points = array('q', get_coords(fp_line, 'start') + get_coords(fp_line, 'end'))
+    layer: Layer = convert_to_layers(get_dict_by_key(fp_line, 'layer')['layer'], unknown_layers)[0]
+    width: int = to_nm(get_dict_by_key(fp_line, 'width')['width'])
+    new_line = CompactFigure(FpLine, layer=layer, width=width, points=points)
     return new_line
 
 
-def get_lines(m_data: List[Dict[str, Any]], line_tag: str) -> List[FpLine]:
+def get_lines(m_data: List[Dict[str, Any]], line_tag: str,
+              unknown_layers: Optional[Dict[str, int]] = None) -> List[CompactFigure]:
     """
     get lines data for module
     :param line_tag: fp_line or gr_line
     :param m_data: module data
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return: list of lines
     """
-    lines: List[FpLine] = list()
+    lines: List[CompactFigure] = list()
     for line in get_all_dicts_by_key(m_data, line_tag):
-        lines.append(create_line(line, line_tag))
+        lines.append(create_line(line, line_tag, unknown_layers))
     return lines
 
 
-def get_circles(m_data: List[Dict[str, Any]], circle_tag: str) -> List[FpCircle]:
+def get_circles(m_data: List[Dict[str, Any]], circle_tag: str,
+                unknown_layers: Optional[Dict[str, int]] = None) -> List[CompactFigure]:
     """
     get lines data for module
     :param circle_tag: fp_line or gr_line
     :param m_data: module data
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return: list of lines
     """
-    circles: List[FpCircle] = list()
+    circles: List[CompactFigure] = list()
     for circle in get_all_dicts_by_key(m_data, circle_tag):
         fp_circle = circle[circle_tag]
-        center: Coords = [get_dict_by_key(fp_circle, 'center')['center'][0],
-                          get_dict_by_key(fp_circle, 'center')['center'][1]]
-        center[1] = str(-1 * float(center[1]))
-        end: Coords = [get_dict_by_key(fp_circle, 'end')['end'][0], get_dict_by_key(fp_circle, 'end')['end'][1]]
-        end[1] = str(-1 * float(end[1]))
-        layer: Layer = convert_to_layers(get_dict_by_key(fp_circle, 'layer')['layer'])[0]
-        width: float = get_dict_by_key(fp_circle, 'width')['width']
-        new_circle = FpCircle(center=center, end=end, layer=layer, width=width)
+        points = array('q', get_coords(fp_circle, 'center') + get_coords(fp_circle, 'end'))
+        layer: Layer = convert_to_layers(get_dict_by_key(fp_circle, 'layer')['layer'], unknown_layers)[0]
+        width: int = to_nm(get_dict_by_key(fp_circle, 'width')['width'])
+        new_circle = CompactFigure(FpCircle, layer=layer, width=width, points=points)
         circles.append(new_circle)
     # print(circles)
     return circles
 
 
-def get_polys(m_data: List[Dict[str, Any]], poly_tag: str) -> List[FpPoly]:
+def get_polys(m_data: List[Dict[str, Any]], poly_tag: str,
+              unknown_layers: Optional[Dict[str, int]] = None) -> List[CompactFigure]:
     """
     get data of polygon
     :param m_data: data
     :param poly_tag: tag for poly
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return:
     """
     polys = get_all_dicts_by_key(m_data, poly_tag)
-    res_polys: List[FpPoly] = list()
+    res_polys: List[CompactFigure] = list()
     if polys:
         for poly in polys:
             poly_data = poly[poly_tag]
-            layer: Layer = convert_to_layers(get_dict_by_key(poly_data, 'layer')['layer'])[0]
-            width: str = get_dict_by_key(poly_data, 'width')['width']
+            layer: Layer = convert_to_layers(get_dict_by_key(poly_data, 'layer')['layer'], unknown_layers)[0]
+            width: int = to_nm(get_dict_by_key(poly_data, 'width')['width'])
             pts_data: List[Dict[str, Any]] = get_dict_by_key(poly_data, 'pts')['pts']
-            points: List[Coords] = list()
+            points = array('q')
             for p in pts_data:
-                point = [p['xy'][0], str(-1*float(p['xy'][1]))]
-                points.append(point)
-            res_polys.append(FpPoly(layer=layer, width=width, points=points))
+                points.extend(get_point(p['xy']))
+            res_polys.append(CompactFigure(FpPoly, layer=layer, width=width, points=points))
     return res_polys
 
 
-def create_arc(arc_data: Dict[str, Any], arc_tag: str) -> FpArc:
+def create_arc(arc_data: Dict[str, Any], arc_tag: str, resolve: bool = True,
+               unknown_layers: Optional[Dict[str, int]] = None) -> CompactFigure:
     """
-    create FpArc object from dict with arc data
+    create arc figure from dict with arc data
     :param arc_data: dict with arc data
     :param arc_tag: arc tag
-    :return: FpArc object
+    :param resolve: if not set end point keeps arc center to find end points with resolve_arcs
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: arc figure
     """
     fp_arc = arc_data[arc_tag]
-    # end in kicad is start point
-    start: Coords = [get_dict_by_key(fp_arc, 'end')['end'][0], get_dict_by_key(fp_arc, 'end')['end'][1]]
-    start[1] = str(-1 * float(start[1]))
-    end: Coords = [get_dict_by_key(fp_arc, 'start')['start'][0],
-                   get_dict_by_key(fp_arc, 'start')['start'][1]]  # start in kicad is center point
-    end[1] = str(-1 * float(end[1]))
+    # end in kicad is start point, start in kicad is center point
+    points = array('q', get_coords(fp_arc, 'end') + get_coords(fp_arc, 'start'))
     angle: float = -1 * float(get_dict_by_key(fp_arc, 'angle')['angle'])
-    layer: Layer = convert_to_layers(get_dict_by_key(fp_arc, 'layer')['layer'])[0]
-    width: float = get_dict_by_key(fp_arc, 'width')['width']
-    new_arc = FpArc(start=start, end=end, angle=angle, layer=layer, width=width)
-    new_arc.end = get_end_point(new_arc)
+    layer: Layer = convert_to_layers(get_dict_by_key(fp_arc, 'layer')['layer'], unknown_layers)[0]
+    width: int = to_nm(get_dict_by_key(fp_arc, 'width')['width'])
+    new_arc = CompactFigure(FpArc, layer=layer, width=width, points=points, angle=angle)
+    if resolve:
+        new_arc.points[2:] = array('q', get_end_point(new_arc))
     return new_arc
 
 
-def get_arcs(m_data: List[Dict[str, Any]], arc_tag: str) -> List[FpArc]:
+def get_arcs(m_data: List[Dict[str, Any]], arc_tag: str, pending_arcs: Optional[List[CompactFigure]] = None,
+             unknown_layers: Optional[Dict[str, int]] = None) -> List[CompactFigure]:
     """
     get lines data for module
     :param arc_tag: tag with arc key (gr_arc for example)
     :param m_data: module data
+    :param pending_arcs: list to collect arcs for resolving later, arcs are resolved at once if not set
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return: list of lines
     """
-    arcs: List[FpArc] = list()
+    arcs: List[CompactFigure] = list()
     for arc in get_all_dicts_by_key(m_data, arc_tag):
-        arcs.append(create_arc(arc, arc_tag))
+        arcs.append(create_arc(arc, arc_tag, resolve=False, unknown_layers=unknown_layers))
+    if pending_arcs is None:
+        resolve_arcs(arcs)
+    else:
+        pending_arcs.extend(arcs)
     return arcs
 
 
-def get_pads(m_data: List[Dict[str, Any]], nets: List[Net]) -> List[FpPad]:
+def get_pads(m_data: List[Dict[str, Any]],
+             unknown_layers: Optional[Dict[str, int]] = None) -> Tuple[List[CompactPad], array]:
     """
     gets list of pads for module
-    :param nets:
     :param m_data: dict with module
-    :return: list of pads
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return: list of pads and their x, y, width and height in nm packed by 4 values per pad
     """
     layer = get_dict_by_key(m_data, 'layer')['layer']
-    pads: List[FpPad] = list()
+    pads: List[CompactPad] = list()
+    pad_coords = array('q')
     used_pads = [""]
     for pad in get_all_dicts_by_key(m_data, 'pad'):
         fp_pad = pad['pad']
@@ -356,18 +577,22 @@ def get_pads(m_data: List[Dict[str, Any]], nets: List[Net]) -> List[FpPad]:
         else:
             pad_type = PadType.custom
         pos_data = get_dict_by_key(fp_pad, 'at')['at']
-        pos = FpPos(pos=[pos_data[0], -1.0*float(pos_data[1])], rot=(pos_data[2]) if len(pos_data) == 3 else 0)
+        pos_x, pos_y = get_point(pos_data)
+        # bottom side pads keep kicad y as footprint is mirrored
         if 'B.' in layer:
-            pos.pos[1] = -1*pos.pos[1]
+            pos_y = -pos_y
+        rot = pos_data[2] if len(pos_data) == 3 else 0
         size_data = get_dict_by_key(fp_pad, 'size')
-        size = [size_data['size'][0], size_data['size'][1]] if size_data else [0, 0]
-        pad_layers: List[Layer] = convert_to_layers(get_dict_by_key(fp_pad, 'layers')['layers'])
+        size = (to_nm(size_data['size'][0]), to_nm(size_data['size'][1])) if size_data else (0, 0)
+        pad_coords.extend((pos_x, pos_y) + size)
+        pad_layers = convert_to_layers(get_dict_by_key(fp_pad, 'layers')['layers'], unknown_layers)
         net_data = get_dict_by_key(fp_pad, 'net')
         net_id = get_dict_by_key(fp_pad, 'net')['net'][0] if net_data else ""
         net_name = get_dict_by_key(fp_pad, 'net')['net'][1] if net_data else ""
-        new_pad = FpPad(pad_id=pad_id, smd=smd, drill=drill, pad_type=pad_type, center=pos, size=size,
-                        layers=pad_layers, net_id=net_id, net_name=net_name, extra_points=list())
+        new_pad = CompactPad(pad_id=pad_id, smd=smd, drill=drill, pad_type=pad_type, rot=rot, layers=pad_layers,
+                             net_id=net_id, net_name=net_name)
         if pad_type == PadType.custom:
+            new_pad.extra_points = array('q')
             pad_data = get_dict_by_key(fp_pad, 'primitives')['primitives']
             for extra_pad in pad_data:
                 if isinstance(extra_pad, dict):
@@ -379,61 +604,136 @@ def get_pads(m_data: List[Dict[str, Any]], nets: List[Net]) -> List[FpPad]:
                     else:
                         continue
                     for point in points:
-                        new_pad.extra_points.append([point['xy'][0], str(-1*float(point['xy'][1]))])
-            print(new_pad.extra_points)
+                        new_pad.extra_points.extend(get_point(point['xy']))
+            print(array_to_points(new_pad.extra_points))
         pads.append(new_pad)
-    return pads
+    return pads, pad_coords
+
+
+def reverse_edge(edge: CompactFigure):
+    """
+    swaps start and end of edge, arc goes back with opposite angle
+    :param edge: line or arc with resolved end
+    :return:
+    """
+    edge.points = edge.points[2:] + edge.points[:2]
+    if edge.kind is FpArc:
+        edge.angle = -edge.angle
+
+
+def chain_edges(edges: List[CompactFigure], tolerance: float = edge_tolerance) -> List[CompactContour]:
+    """
+    chains edges to contours matching end points with spatial hash, edges are reversed if necessary
+    :param edges: lines and arcs with resolved ends
+    :param tolerance: max sum of x and y distances between matched end points in mm
+    :return: contours in order of their first edges, unclosed chains are reported and kept as contours
+    """
+    tolerance *= NM_PER_MM
+    points: List[Tuple[int, int, int, int]] = [tuple(edge.points) for edge in edges]
+    cells: Dict[Tuple[int, int], List[Tuple[int, bool]]] = dict()
+    for i, (x1, y1, x2, y2) in enumerate(points):
+        cells.setdefault((math.floor(x1 / tolerance), math.floor(y1 / tolerance)), []).append((i, False))
+        cells.setdefault((math.floor(x2 / tolerance), math.floor(y2 / tolerance)), []).append((i, True))
+    used = [False] * len(edges)
+
+    def find_next(x: int, y: int) -> Optional[Tuple[int, bool, int]]:
+        # nearest end point wins, edge starting at point goes first, edge ending at point has to be reversed
+        cx = math.floor(x / tolerance)
+        cy = math.floor(y / tolerance)
+        found: Optional[Tuple[int, bool, int]] = None
+        for key in ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+            for i, is_end in cells.get(key, ()):
+                if used[i]:
+                    continue
+                px, py = points[i][2:] if is_end else points[i][:2]
+                candidate = (abs(px - x) + abs(py - y), is_end, i)
+                if candidate[0] < tolerance and (found is None or candidate < found):
+                    found = candidate
+        return found
+
+    contours: List[CompactContour] = list()
+    for first in range(len(edges)):
+        if used[first]:
+            continue
+        used[first] = True
+        contour: CompactContour = [edges[first]]
+        start_x, start_y, x, y = points[first]
+        while True:
+            next_edge = find_next(x, y)
+            closing = abs(x - start_x) + abs(y - start_y)
+            if closing < tolerance and (next_edge is None or closing <= next_edge[0]):
+                break
+            if next_edge is None:
+                print('Board outline is not closed, gap between %.3f %.3f and %.3f %.3f'
+                      % (x / NM_PER_MM, y / NM_PER_MM, start_x / NM_PER_MM, start_y / NM_PER_MM))
+                break
+            _, is_end, i = next_edge
+            used[i] = True
+            if is_end:
+                reverse_edge(edges[i])
+                x, y = points[i][:2]
+            else:
+                x, y = points[i][2:]
+            contour.append(edges[i])
+        contours.append(contour)
+    return contours
+
+
+def contour_area(contour: CompactContour) -> int:
+    """
+    gets area of contour bounding box
+    :param contour: list of lines and arcs
+    :return: area in square nm
+    """
+    xs = [edge.points[i] for edge in contour for i in (0, 2)]
+    ys = [edge.points[i] for edge in contour for i in (1, 3)]
+    return (max(xs) - min(xs)) * (max(ys) - min(ys))
 
 
-def get_edges(pcb_data: List[Dict[str, Any]]) -> List[Union[FpLine, FpArc]]:
+def get_edges(pcb_data: List[Dict[str, Any]]) -> List[CompactContour]:
     """
     get edge data
     :param pcb_data: list with arcs
-    :return: FpLine and FpArc list
+    :return: contours of lines and arcs, the outer one goes first and cutouts follow it
     """
-    pcb_edges: List[Union[FpLine, FpArc]] = list()
+    pcb_edges: List[CompactFigure] = list()
+    arcs: List[CompactFigure] = list()
     for elem in pcb_data:
         if isinstance(elem, dict) and 'gr_line' in elem.keys():
             pcb_edges.append(create_line(elem, 'gr_line'))
         if isinstance(elem, dict) and 'gr_arc' in elem.keys():
-            pcb_edges.append(create_arc(elem, 'gr_arc'))
+            arcs.append(create_arc(elem, 'gr_arc', resolve=False))
+            pcb_edges.append(arcs[-1])
+    resolve_arcs(arcs)
 
     new_edges = [edge for edge in pcb_edges if edge.layer.name == 'Edge.Cuts']
+    contours = chain_edges(new_edges)
+    if contours:
+        outline = max(contours, key=contour_area)
+        contours.remove(outline)
+        contours.insert(0, outline)
+    return contours
 
-    sorted_edges = [new_edges[0]]
-    new_edges.pop(0)
-    current = sorted_edges[0]
-    while new_edges:
-        for edge in new_edges:
-            dx = abs(float(edge.start[0]) - float(current.end[0]))
-            dy = abs(float(edge.start[1]) - float(current.end[1]))
-            if dx + dy < 0.5:
-                sorted_edges.append(edge)
-                new_edges.remove(edge)
-                current = edge
-    return sorted_edges
 
-
-def get_nets(data: List[Dict[str, Any]]) -> List[Net]:
+def get_nets(data: List[Dict[str, Any]]) -> List[CompactNet]:
     """
     get jusy list of nets with their id and name
     :param data: data of pcb
     :return: list of nets
     """
     nets_data = get_all_dicts_by_key(data, 'net')
-    nets: List[Net] = list()
+    nets: List[CompactNet] = list()
     for net in nets_data:
-        new_net = Net(net_name=net['net'][1].replace('"', ''), net_id=net['net'][0], contacts=list(),
-                      segments=list(), vias=list())
+        new_net = CompactNet(net_name=net['net'][1].replace('"', ''), net_id=net['net'][0])
         nets.append(new_net)
     return nets
 
 
-def get_net_groups(data: List[Dict[str, Any]], nets: List[Net]) -> List[NetGroup]:
+def get_net_groups(data: List[Dict[str, Any]], nets: NetIndex) -> List[NetGroup]:
     """
     get net groups data and assigns net groups to nets
     :param data: pcb data
-    :param nets: list of nets
+    :param nets: index of nets
     :return: list of netgroups
     """
     group_data = get_all_dicts_by_key(data, 'net_class')
@@ -448,103 +748,365 @@ def get_net_groups(data: List[Dict[str, Any]], nets: List[Net]) -> List[NetGroup
         groups.append(new_group)
         nets_data = get_all_dicts_by_key(group['net_class'], 'add_net')
         for add_net in nets_data:
-            for net in nets:
-                if net.net_name == add_net['add_net'].replace('"',''):
-                    net.group = name
+            net = nets.get_by_name(add_net['add_net'].replace('"', ''))
+            if net:
+                net.group = name
     return groups
 
 
-def update_nets_with_pads(pads: List[FpPad], nets: List[Net], ref: str):
+def get_contacts(pads: List[CompactPad], ref: str) -> List[Contact]:
     """
-    update net structure
+    gets contacts of pads connected to nets
     :param pads: list of module pads
-    :param net: pcb nets
     :param ref: reference of module to find pad
+    :return: net id, module reference and pad id for every connected pad
+    """
+    return [(pad.net_id, ref, pad.pad_id) for pad in pads if pad.net_name]
+
+
+def add_contacts(contacts: List[Contact], nets: NetIndex):
+    """
+    update net structure with contacts of module pads
+    :param contacts: contacts made by get_contacts
+    :param nets: index of pcb nets
     :return:
     """
-    for pad in pads:
-        if pad.net_name:
-            net: Net = [net for net in nets if float(net.net_id) == float(pad.net_id)][0]
-            net.contacts.append((ref, pad.pad_id))
+    for net_id, ref, pad_id in contacts:
+        net: CompactNet = nets.get_by_id(net_id)
+        if net:
+            net.contacts.append((ref, pad_id))
 
 
-def update_nets_with_segments(pcb_data: List[Dict[str, Any]], nets: List[Net]):
+def update_nets_with_segments(pcb_data: List[Dict[str, Any]], nets: NetIndex,
+                                unknown_layers: Optional[Dict[str, int]] = None):
     """
     get segments of nets
     :param pcb_data: data of pcb to get nets
-    :param nets: list of nets to update
-    :return: 
+    :param nets: index of nets to update
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
+    :return:
     """
     segments = get_all_dicts_by_key(pcb_data, 'segment')
     for segment in segments:
-        start: Coords = get_dict_by_key(segment['segment'], 'start')['start']
-        start[1] = str(-1*float(start[1]))
-        end: Coords = get_dict_by_key(segment['segment'], 'end')['end']
-        end[1] = str(-1 * float(end[1]))
-        width: str = get_dict_by_key(segment['segment'], 'width')['width']
+        start: Point = get_coords(segment['segment'], 'start')
+        end: Point = get_coords(segment['segment'], 'end')
+        width: int = to_nm(get_dict_by_key(segment['segment'], 'width')['width'])
         layer_data: str = get_dict_by_key(segment['segment'], 'layer')['layer']
-        layers: List[Layer] = convert_to_layers(layer_data)
-        new_segment: Segment = Segment(start=start, end=end, width=width, layers=layers)
-        net_id: str = get_dict_by_key(segment['segment'], 'net')['net']
-        for net in nets:
-            if float(net.net_id) == float(net_id):
-                net.segments.append(new_segment)
+        layers: Tuple[Layer, ...] = convert_to_layers(layer_data, unknown_layers)
+        net: CompactNet = nets.get_by_id(get_dict_by_key(segment['segment'], 'net')['net'])
+        if net:
+            net.add_segment(start, end, width, layers)
 
 
-def update_nets_with_vias(pcb_data: List[Dict[str, Any]], nets: List[Net]):
+def update_nets_with_vias(pcb_data: List[Dict[str, Any]], nets: NetIndex,
+                            unknown_layers: Optional[Dict[str, int]] = None):
     """
     get segments of nets
     :param pcb_data: data of pcb to get nets
-    :param nets: list of nets to update
+    :param nets: index of nets to update
+    :param unknown_layers: numbers of elements by unknown layer names to update, unknown layers are printed if not set
     :return:
     """
     vias = get_all_dicts_by_key(pcb_data, 'via')
     for via in vias:
-        at: Coords = get_dict_by_key(via['via'], 'at')['at']
-        at[1] = str(-1*float(at[1]))
-        size: str = get_dict_by_key(via['via'], 'size')['size']
+        at: Point = get_coords(via['via'], 'at')
+        size: int = to_nm(get_dict_by_key(via['via'], 'size')['size'])
         layer_data: str  = get_dict_by_key(via['via'], 'layers')['layers']
-        layers: List[Layer] = convert_to_layers(layer_data)
-        new_via: Via = Via(center=at, size=size, layers=layers)
-        net_id: str = get_dict_by_key(via['via'], 'net')['net']
-        for net in nets:
-            if float(net.net_id) == float(net_id):
-                net.vias.append(new_via)
-
-
-def main(filename):
-    inputdata = open(filename).read()
-    data_parse = OneOrMore(nestedExpr()).parseString(inputdata)
-    data_list = data_parse.asList()
-    data = list_to_dict(data_list[0])
-    text: str = pprint.pformat(data, indent=0)
-    with open("dump.txt", "w") as f:
-        f.write(text)
-    layers = get_layers(data)
-    edges: List[Union[FpArc, FpLine]] = get_edges(data['kicad_pcb'])
-    texts = get_texts(data['kicad_pcb'], 'gr_text')
-    nets = get_nets(data['kicad_pcb'])
-    net_groups = get_net_groups(data['kicad_pcb'], nets)
-    update_nets_with_segments(data['kicad_pcb'], nets)
-    update_nets_with_vias(data['kicad_pcb'], nets)
-    extra_figures: List[Union[FpLine, FpCircle, FpPoly, FpArc]] = get_arcs(data['kicad_pcb'], 'gr_arc')
-    extra_figures.extend((get_polys(data['kicad_pcb'], 'gr_poly')))
-    extra_figures.extend(get_lines(data['kicad_pcb'], 'gr_line'))
-    extra_figures.extend(get_circles(data['kicad_pcb'], 'gr_circle'))
-    pcb = PCB(layers=layers, modules=list(), edge=edges, texts=texts, nets=nets, net_groups=net_groups  )
-    for module in get_all_dicts_by_key(data['kicad_pcb'], 'module'):
-        pcb.modules.append(create_module(module, nets))
+        layers: Tuple[Layer, ...] = convert_to_layers(layer_data, unknown_layers)
+        net: CompactNet = nets.get_by_id(get_dict_by_key(via['via'], 'net')['net'])
+        if net:
+            net.add_via(at, size, layers)
+
+
+def is_unused(expr: sexpr.SExpr) -> bool:
+    """
+    checks if module figure or user text is on fabrication or courtyard layer, they are never emitted,
+    reference and value texts are always kept as labels need them
+    :param expr: parsed expression
+    :return: True if expression can be dropped
+    """
+    if expr[0] not in layer_figures or (expr[0] == 'fp_text' and expr[1] in ('reference', 'value')):
+        return False
+    for child in expr:
+        if isinstance(child, list) and len(child) == 2 and child[0] == 'layer':
+            return isinstance(child[1], str) and child[1].replace('"', '') in unused_layers
+    return False
+
+
+unused_checks: sexpr.SkipChecks = {tag: is_unused for tag in layer_figures}
+
+
+def read_board(filename: str, engine: str = 'sexpr', skip_unused: bool = False) -> List:
+    """
+    reads kicad pcb file to nested lists
+    :param filename: name of file
+    :param engine: sexpr for streaming tokenizer, mmap for tokenizer over memory mapped file
+    or pyparsing for nestedExpr
+    :param skip_unused: skip zones, time stamps and fabrication and courtyard figures, sexpr and mmap engines only
+    :return: list of top level expressions
+    """
+    if engine == 'pyparsing':
+        if skip_unused:
+            raise ValueError('Unused subtrees are skipped by sexpr and mmap engines only')
+        with sexpr.open_board(filename) as file:
+            return OneOrMore(nestedExpr()).parseString(file.read()).asList()
+    if engine in ('sexpr', 'mmap'):
+        if skip_unused:
+            return sexpr.parse_file(filename, unused_tags, unused_checks, memory_map=engine == 'mmap')
+        return sexpr.parse_file(filename, memory_map=engine == 'mmap')
+    raise ValueError('Unknown parser engine %s' % engine)
+
+
+def create_pcb(data: Dict[str, Any], profiler: Optional[Profiler] = None, workers: int = 1,
+               modules: Optional[List[BuiltModule]] = None) -> CompactPCB:
+    """
+    creates compact pcb model from kicad pcb data, coordinates are converted to nm with flipped y once here
+    :param data: pcb data converted with list_to_dict
+    :param profiler: profiler to record stages, stages are not recorded if not set
+    :param workers: number of processes to build modules
+    :param modules: modules built before with their contacts, modules of data are built if not set
+    :return: compact pcb, its view gives pcb structure
+    """
+    unknown_layers: Dict[str, int] = dict()
+    with stage(profiler, 'get_layers') as counts:
+        layers = get_layers(data)
+        counts['layers'] = len(layers)
+    with stage(profiler, 'get_edges') as counts:
+        contours: List[CompactContour] = get_edges(data['kicad_pcb'])
+        counts['contours'] = len(contours)
+        counts['edges'] = sum(len(contour) for contour in contours)
+    with stage(profiler, 'get_texts') as counts:
+        texts = get_texts(data['kicad_pcb'], 'gr_text', unknown_layers)
+        counts['texts'] = len(texts)
+    with stage(profiler, 'get_nets') as counts:
+        nets = get_nets(data['kicad_pcb'])
+        net_index = NetIndex(nets)
+        net_groups = get_net_groups(data['kicad_pcb'], net_index)
+        counts['nets'] = len(nets)
+        counts['net_groups'] = len(net_groups)
+    with stage(profiler, 'update_nets_with_segments') as counts:
+        update_nets_with_segments(data['kicad_pcb'], net_index, unknown_layers)
+        counts['segments'] = sum(len(net.segment_widths) for net in nets)
+    with stage(profiler, 'update_nets_with_vias') as counts:
+        update_nets_with_vias(data['kicad_pcb'], net_index, unknown_layers)
+        counts['vias'] = sum(len(net.via_sizes) for net in nets)
+    with stage(profiler, 'get_figures') as counts:
+        pending_arcs: List[CompactFigure] = list()
+        extra_figures: List[CompactFigure] = get_arcs(data['kicad_pcb'], 'gr_arc', pending_arcs, unknown_layers)
+        extra_figures.extend((get_polys(data['kicad_pcb'], 'gr_poly', unknown_layers)))
+        extra_figures.extend(get_lines(data['kicad_pcb'], 'gr_line', unknown_layers))
+        extra_figures.extend(get_circles(data['kicad_pcb'], 'gr_circle', unknown_layers))
+        counts['figures'] = len(extra_figures)
+    pcb = CompactPCB(layers=layers, modules=list(), outline=contours[0] if contours else list(),
+                     cutouts=contours[1:], texts=texts, nets=nets, net_groups=net_groups)
+    with stage(profiler, 'create_module', workers=workers) as counts:
+        if modules is None:
+            modules = build_modules(get_all_dicts_by_key(data['kicad_pcb'], 'module'), workers,
+                                    unknown_layers=unknown_layers)
+        for module, contacts in modules:
+            pcb.modules.append(module)
+            add_contacts(contacts, net_index)
+        counts['modules'] = len(pcb.modules)
+        counts['pads'] = sum(len(module.pads) for module in pcb.modules)
+        counts['figures'] = sum(len(module.figures) for module in pcb.modules)
+    with stage(profiler, 'resolve_arcs', arcs=len(pending_arcs)):
+        resolve_arcs(pending_arcs)
+    report_unknown_layers(unknown_layers)
     if extra_figures:
-        extra_ref: FpText = FpText(TextType.reference, "ExtraSilks", Layer("F.SilkS", "user"), [0, 0], 0)
-        extra_value: FpText = FpText(TextType.value, "ExtraSilks", Layer("F.SilkS", "user"), [0, 0], 0)
-        extra_module: Module = Module("ExtraSilks", Layer("F.Silks", "user"), [0, 0], False, [extra_ref, extra_value],
-                                      extra_figures, list(), list())
+        extra_ref = CompactText(TextType.reference, "ExtraSilks", known_layers["F.SilkS"], 0, 0, 0)
+        extra_value = CompactText(TextType.value, "ExtraSilks", known_layers["F.SilkS"], 0, 0, 0)
+        extra_module = CompactModule("ExtraSilks", known_layers["F.SilkS"], 0, 0, None, False,
+                                     [extra_ref, extra_value], extra_figures, list(), array('q'))
         pcb.modules.append(extra_module)
-    create_topor.create_topor(filename, pcb, get_settings())
+    return pcb
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("No PCB filename")
+def load_pcb_reusing(filename: str, cache: Dict[str, Any],
+                     skip_unused: bool = False) -> Tuple[CompactPCB, Dict[str, Any]]:
+    """
+    reads pcb parsing only top level expressions with text not found in cache, modules are kept built
+    and other expressions are kept converted with list_to_dict, cached items are shared with previous pcb
+    :param filename: name of kicad pcb file
+    :param cache: modules with their contacts and other expressions by their text from previous read
+    :param skip_unused: skip subtrees never emitted to topor while parsing
+    :return: compact pcb and cache of its expressions
+    """
+    with sexpr.open_board(filename) as file:
+        text = file.read()
+    spans = sexpr.split_children(text)
+    items = [text[start:end] for start, end in spans]
+    skeleton = ''.join(text[start:end] for start, end in zip([0] + [end for _, end in spans],
+                                                             [start for start, _ in spans] + [len(text)]))
+    missing = list(dict.fromkeys(item for item in items if item not in cache))
+    if missing:
+        skip_tags, skip_checks = (unused_tags, unused_checks) if skip_unused else ((), None)
+        # every item gets own holder, so holders of skipped items are left empty and keep positions of others
+        holders = sexpr.parse(io.StringIO('(items %s)' % '\n'.join('(item %s)' % item for item in missing)),
+                              skip_tags=skip_tags, skip_checks=skip_checks)[0][1:]
+        parsed = [list_to_dict(holder[1]) if len(holder) > 1 else None for holder in holders]
+        module_dicts = [data for data in parsed if data and 'module' in data]
+        # modules are built at once, so their arcs are resolved in one call
+        unknown_layers: Dict[str, int] = dict()
+        modules = iter(build_module_chunk(module_dicts, unknown_layers))
+        report_unknown_layers(unknown_layers)
+        cache = {**cache, **{item: next(modules) if data and 'module' in data else data
+                             for item, data in zip(missing, parsed)}}
+    root = sexpr.parse(io.StringIO(skeleton))[0]
+    modules: List[BuiltModule] = list()
+    children = Node(root[1:])
+    for item in items:
+        if isinstance(cache[item], tuple):
+            modules.append(cache[item])
+        elif cache[item] is not None:
+            children.append(cache[item])
+    pcb = create_pcb({root[0]: children}, modules=modules)
+    print('Expressions: %i reused, %i parsed' % (len(items) - len(missing), len(missing)))
+    return pcb, {item: cache[item] for item in items}
+
+
+def write_dump(data: Any, file: TextIO, depth: int = 0):
+    """
+    writes parsed data as indented tree node by node, nodes with words only take one line
+    :param data: data converted with list_to_dict or its part
+    :param file: text file to write
+    :param depth: depth of data in tree
+    :return:
+    """
+    indent = '  ' * depth
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if not isinstance(value, list):
+                file.write('%s%s: %s\n' % (indent, key, value))
+            elif any(isinstance(child, (dict, list)) for child in value):
+                file.write('%s%s\n' % (indent, key))
+                write_dump(value, file, depth + 1)
+            else:
+                file.write('%s%s: %s\n' % (indent, key, ' '.join(str(child) for child in value)))
+    elif isinstance(data, list):
+        for child in data:
+            write_dump(child, file, depth)
     else:
-        main(sys.argv[1])
+        file.write('%s%s\n' % (indent, data))
+
+
+def load_pcb(filename: str, engine: str = 'sexpr', cache: Optional[pcb_cache.PcbCache] = None,
+             dump: Optional[str] = None, profiler: Optional[Profiler] = None, workers: int = 1,
+             skip_unused: bool = False) -> CompactPCB:
+    """
+    reads pcb from kicad file or from cache, boards read from file are saved to cache
+    :param filename: name of kicad pcb file
+    :param engine: s-expression parser
+    :param cache: cache of parsed boards, board is always parsed if not set
+    :param dump: name of file for parsed data dump, not written if not set or board is found in cache
+    :param profiler: profiler to record stages
+    :param workers: number of processes to build modules
+    :param skip_unused: skip subtrees never emitted to topor while parsing
+    :return: compact pcb
+    """
+    if cache:
+        with stage(profiler, 'cache_get') as counts:
+            # boards parsed without unused subtrees have less data, so they are cached separately
+            key = pcb_cache.file_key(filename, parser_version + ('-skip' if skip_unused else ''))
+            pcb = cache.get(key)
+            counts['hit'] = int(pcb is not None)
+            if pcb is not None:
+                return pcb
+    with stage(profiler, 'read_board', bytes=os.path.getsize(filename)) as counts:
+        data_list = read_board(filename, engine, skip_unused)
+        counts['expressions'] = len(data_list[0])
+    with stage(profiler, 'list_to_dict'):
+        data = list_to_dict(data_list[0])
+        del data_list
+    if dump:
+        with stage(profiler, 'dump'), open(dump, "w") as f:
+            write_dump(data, f)
+    with stage(profiler, 'create_pcb'):
+        pcb = create_pcb(data, profiler, workers)
+    if cache:
+        with stage(profiler, 'cache_put'):
+            cache.put(key, pcb)
+    return pcb
+
+
+def get_output_name(filename: str) -> str:
+    """
+    gets default fst file name, compressed boards get the same name as plain ones
+    :param filename: name of kicad pcb file
+    :return: name of fst file
+    """
+    base, extension = os.path.splitext(filename)
+    return (base if extension.lower() in sexpr.compressed_openers else filename) + '.fst'
+
+
+def main(filename: str, engine: str = 'sexpr', writer: str = 'stream', output: Optional[str] = None,
+         config: str = "config,ini", dump: Optional[str] = None, cache_dir: Optional[str] = None,
+         cache_size: int = pcb_cache.CACHE_SIZE, profile: Optional[str] = None, profile_format: str = 'json',
+         workers: int = 1, skip_unused: bool = False, simplify_tolerance: Optional[float] = None,
+         copper_tolerance: Optional[float] = None):
+    """
+    converts kicad pcb file to topor fst file
+    :param filename: name of kicad pcb file
+    :param engine: s-expression parser
+    :param writer: xml output engine
+    :param output: name of fst file, filename with .fst extension instead of .gz or .xz if not set
+    :param config: name of config file
+    :param dump: name of file for parsed data dump, not written if not set
+    :param cache_dir: directory for cache of parsed boards, boards are not cached if not set
+    :param cache_size: max size of cache directory in bytes
+    :param profile: name of file to write time, memory and element counts of every stage, not profiled if not set
+    :param profile_format: json for list of stages or chrome for chrome trace
+    :param workers: number of processes to build modules and, with parallel writer, document parts
+    :param skip_unused: skip zones, time stamps and fabrication and courtyard figures while parsing
+    :param simplify_tolerance: tolerance in mm to simplify silkscreen and other non copper polygons,
+    they are kept exact if not set
+    :param copper_tolerance: tolerance in mm to simplify copper polygons and custom pads, they are kept exact if not set
+    :return:
+    """
+    profiler = Profiler() if profile else None
+    try:
+        cache = pcb_cache.PcbCache(cache_dir, cache_size) if cache_dir else None
+        with stage(profiler, 'load_pcb'):
+            pcb = load_pcb(filename, engine, cache, dump, profiler, workers, skip_unused)
+        if simplify_tolerance is not None or copper_tolerance is not None:
+            with stage(profiler, 'simplify') as counts:
+                tolerances = {'copper': copper_tolerance, 'silk': simplify_tolerance, 'other': simplify_tolerance}
+                report = simplify.simplify_pcb(pcb, tolerances)
+                counts.update(points=sum(report.before.values()), simplified=sum(report.after.values()))
+            print(report.report())
+        with stage(profiler, 'get_settings'):
+            settings = get_settings(config)
+        with stage(profiler, 'create_topor'):
+            create_topor.create_topor(filename, pcb, settings, writer, output or get_output_name(filename), profiler,
+                                      workers)
+    finally:
+        if profiler:
+            profiler.close()
+            profiler.save(profile, profile_format, board=filename, engine=engine, writer=writer)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts KiCad pcb file to TopoR fst file')
+    parser.add_argument('filename', help='KiCad pcb filename, .gz and .xz files are decompressed while reading')
+    parser.add_argument('--engine', choices=engines, default='sexpr', help='s-expression parser')
+    parser.add_argument('--writer', choices=create_topor.writers, default='stream', help='xml output engine')
+    parser.add_argument('--output', help='fst filename, pcb filename with .fst extension by default')
+    parser.add_argument('--config', default='config,ini', help='config filename')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to build modules and document parts')
+    parser.add_argument('--skip-unused', action='store_true',
+                        help='skip zones, time stamps and fabrication and courtyard figures while parsing')
+    parser.add_argument('--simplify', type=float,
+                        help='tolerance in mm to simplify silkscreen and other non copper polygons')
+    parser.add_argument('--simplify-copper', type=float,
+                        help='tolerance in mm to simplify copper polygons and custom pads, kept exact by default')
+    parser.add_argument('--dump', help='file to write parsed data tree for debugging')
+    parser.add_argument('--profile', help='file to write time, memory and element counts of conversion stages')
+    parser.add_argument('--profile-format', choices=profile_formats, default='json',
+                        help='json list of stages or chrome trace')
+    parser.add_argument('--cache-dir', help='directory to cache parsed boards')
+    parser.add_argument('--cache-size', type=int, default=pcb_cache.CACHE_SIZE // (1024 * 1024),
+                        help='max size of cache in MB')
+    args = parser.parse_args()
+    main(args.filename, args.engine, args.writer, args.output, args.config, args.dump, args.cache_dir,
+         args.cache_size * 1024 * 1024, args.profile, args.profile_format, args.workers, args.skip_unused,
+         args.simplify, args.simplify_copper)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Optional
+
+from pcb_compact import CompactPCB
+
+CACHE_SIZE = 512 * 1024 * 1024
+SUFFIX = '.pcb'
+
+
+def file_key(filename: str, version: str) -> str:
+    """
+    gets cache key of board file from its content and parser version
+    :param filename: name of board file
+    :param version: version of parser and pcb model
+    :return: hex sha256 digest
+    """
+    digest = hashlib.sha256(version.encode() + b'\0')
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PcbCache:
+    """
+    directory of pickled compact pcbs named by their keys, least recently used files are removed
+    when directory gets larger than max_size
+    """
+
+    def __init__(self, folder: str, max_size: int = CACHE_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[CompactPCB]:
+        """
+        loads pcb from cache and marks it as recently used
+        :param key: cache key
+        :return: compact pcb or None if there is no such pcb or file is damaged
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                pcb = pickle.load(file)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+            print('Damaged cache file %s is removed' % path)
+            self.remove(path)
+            return None
+        return pcb if isinstance(pcb, CompactPCB) else None
+
+    def put(self, key: str, pcb: CompactPCB):
+        """
+        saves pcb to cache, file is written to temporary file and renamed so other processes never read a part of it
+        :param key: cache key
+        :param pcb: compact pcb
+        :return:
+        """
+        handle, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump(pcb, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            self.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        removes least recently used files until cache fits max_size
+        :return:
+        """
+        entries = list()
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
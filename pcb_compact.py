@@ -0,0 +1,249 @@
+import functools
+from array import array
+from collections.abc import Sequence
+from sys import intern
+from typing import List, Tuple, Optional, Any, Union, Type, Iterator
+
+from pcb_structure import *
+
+NM_PER_MM = 1000000
+CompactFigureType = Union[Type[FpLine], Type[FpCircle], Type[FpArc], Type[FpPoly]]
+
+
+def to_nm(value: Union[str, float]) -> int:
+    """
+    converts mm value to integer nanometres as kicad keeps them
+    :param value: value in mm
+    :return: value in nm
+    """
+    return int(round(float(value) * NM_PER_MM))
+
+
+@functools.lru_cache(maxsize=4096)
+def from_nm(value: int) -> str:
+    """
+    converts integer nanometres to mm string as kicad writes it, without trailing zeros, results are memoized
+    as boards use few distinct sizes
+    :param value: value in nm
+    :return: value in mm
+    """
+    mm, nm = divmod(abs(value), NM_PER_MM)
+    sign = '-' if value < 0 else ''
+    return '%s%i.%s' % (sign, mm, ('%06i' % nm).rstrip('0')) if nm else '%s%i' % (sign, mm)
+
+
+def array_to_points(data: array) -> List[Coords]:
+    """
+    unpacks points from int64 array of nanometres x and y
+    :param data: array of x, y pairs
+    :return: list of points in mm
+    """
+    return [[x / NM_PER_MM, y / NM_PER_MM] for x, y in zip(data[::2], data[1::2])]
+
+
+def intern_value(value: Any) -> Any:
+    """
+    interns strings, other values are returned as is
+    :param value: value to intern
+    :return: interned value
+    """
+    return intern(value) if isinstance(value, str) else value
+
+
+class CompactText:
+    __slots__ = ('text_type', 'text', 'layer', 'x', 'y', 'angle')
+
+    def __init__(self, text_type: TextType, text: str, layer: Layer, x: int, y: int, angle: Any):
+        self.text_type: TextType = text_type
+        self.text: str = intern(text)
+        self.layer: Layer = layer
+        self.x: int = x
+        self.y: int = y
+        self.angle = intern_value(angle)
+
+    def view(self) -> FpText:
+        return FpText(text_type=self.text_type, text=self.text, layer=self.layer,
+                      coords=[self.x / NM_PER_MM, self.y / NM_PER_MM], angle=self.angle)
+
+
+class CompactFigure:
+    """
+    line, circle, arc or polygon, points keep start and end, center and end or polygon points
+    """
+    __slots__ = ('kind', 'layer', 'width', 'angle', 'points')
+
+    def __init__(self, kind: CompactFigureType, layer: Layer, width: int, points: array,
+                 angle: Optional[float] = None):
+        self.kind: CompactFigureType = kind
+        self.layer: Layer = layer
+        self.width: int = width
+        self.angle: Optional[float] = angle
+        self.points: array = points
+
+    def view(self) -> FpFigure:
+        width = self.width / NM_PER_MM
+        points = array_to_points(self.points)
+        if self.kind is FpPoly:
+            return FpPoly(layer=self.layer, width=width, points=points)
+        if self.kind is FpCircle:
+            return FpCircle(center=points[0], end=points[1], layer=self.layer, width=width)
+        if self.kind is FpArc:
+            return FpArc(start=points[0], end=points[1], angle=self.angle, layer=self.layer, width=width)
+        return FpLine(start=points[0], end=points[1], layer=self.layer, width=width)
+
+
+class CompactPad:
+    """
+    pad without coordinates, they are kept in module pad_coords array
+    """
+    __slots__ = ('pad_id', 'smd', 'drill', 'pad_type', 'rot', 'layers', 'net_id', 'net_name', 'extra_points')
+
+    def __init__(self, pad_id: str, smd: bool, drill: Any, pad_type: PadType, rot: Any, layers: Tuple[Layer, ...],
+                 net_id: Any, net_name: str, extra_points: Optional[array] = None):
+        self.pad_id: str = intern(pad_id)
+        self.smd: bool = smd
+        self.drill = drill
+        self.pad_type: PadType = pad_type
+        self.rot = intern_value(rot)
+        self.layers: Tuple[Layer, ...] = layers
+        self.net_id = intern_value(net_id)
+        self.net_name: str = intern_value(net_name)
+        self.extra_points: Optional[array] = extra_points
+
+    def view(self, coords: array, i: int) -> FpPad:
+        x, y, width, height = coords[4 * i: 4 * i + 4]
+        return FpPad(pad_id=self.pad_id, smd=self.smd, drill=self.drill, pad_type=self.pad_type,
+                     center=FpPos(pos=[x / NM_PER_MM, y / NM_PER_MM], rot=self.rot),
+                     size=[from_nm(width), from_nm(height)], layers=list(self.layers), net_id=self.net_id,
+                     net_name=self.net_name,
+                     extra_points=array_to_points(self.extra_points) if self.extra_points else list())
+
+
+class CompactModule:
+    """
+    module with pad positions and sizes packed to pad_coords array by 4 values per pad
+    """
+    __slots__ = ('footprint', 'layer', 'x', 'y', 'angle', 'smd', 'texts', 'figures', 'pads', 'pad_coords',
+                 'extrapads')
+
+    def __init__(self, footprint: str, layer: Layer, x: int, y: int, angle: Any, smd: bool,
+                 texts: List[CompactText], figures: List[CompactFigure], pads: List[CompactPad], pad_coords: array):
+        self.footprint: str = intern(footprint)
+        self.layer: Layer = layer
+        self.x: int = x
+        self.y: int = y
+        self.angle = intern_value(angle)
+        self.smd: bool = smd
+        self.texts: List[CompactText] = texts
+        self.figures: List[CompactFigure] = figures
+        self.pads: List[CompactPad] = pads
+        self.pad_coords: array = pad_coords
+        self.extrapads: Tuple[str, ...] = ()
+
+    def view(self) -> Module:
+        coords = [self.x / NM_PER_MM, self.y / NM_PER_MM]
+        if self.angle is not None:
+            coords.append(self.angle)
+        return Module(footprint=self.footprint, layer=self.layer, coords=coords, smd=self.smd,
+                      texts=[text.view() for text in self.texts], figures=[figure.view() for figure in self.figures],
+                      pads=[pad.view(self.pad_coords, i) for i, pad in enumerate(self.pads)],
+                      extrapads=list(self.extrapads))
+
+
+class CompactNet:
+    """
+    net with segments packed by start and end (4 values) and vias packed by center (2 values) to arrays
+    """
+    __slots__ = ('net_id', 'net_name', 'group', 'contacts', 'segment_coords', 'segment_widths', 'segment_layers',
+                 'via_coords', 'via_sizes', 'via_layers')
+
+    def __init__(self, net_id: Any, net_name: str, group: str = ""):
+        self.net_id = intern_value(net_id)
+        self.net_name: str = intern(net_name)
+        self.group: str = group
+        self.contacts: List[Tuple[str, str]] = list()
+        self.segment_coords = array('q')
+        self.segment_widths = array('q')
+        self.segment_layers: List[Tuple[Layer, ...]] = list()
+        self.via_coords = array('q')
+        self.via_sizes = array('q')
+        self.via_layers: List[Tuple[Layer, ...]] = list()
+
+    def add_segment(self, start: Tuple[int, int], end: Tuple[int, int], width: int, layers: Tuple[Layer, ...]):
+        self.segment_coords.extend(start + end)
+        self.segment_widths.append(width)
+        self.segment_layers.append(layers)
+
+    def add_via(self, center: Tuple[int, int], size: int, layers: Tuple[Layer, ...]):
+        self.via_coords.extend(center)
+        self.via_sizes.append(size)
+        self.via_layers.append(layers)
+
+    def view(self) -> Net:
+        segments = list()
+        for i, layers in enumerate(self.segment_layers):
+            start, end = array_to_points(self.segment_coords[4 * i: 4 * i + 4])
+            segments.append(Segment(start=start, end=end, layers=list(layers),
+                                    width=self.segment_widths[i] / NM_PER_MM))
+        vias = list()
+        for i, layers in enumerate(self.via_layers):
+            center = array_to_points(self.via_coords[2 * i: 2 * i + 2])[0]
+            vias.append(Via(center=center, layers=list(layers), size=self.via_sizes[i] / NM_PER_MM))
+        return Net(net_id=self.net_id, net_name=self.net_name, contacts=list(self.contacts), segments=segments,
+                   vias=vias, group=self.group)
+
+
+class ViewList(Sequence):
+    """
+    read only list of compact elements, views of elements are made on every read and are not kept
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items: List[Union[CompactModule, CompactNet]]):
+        self.items = items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [item.view() for item in self.items[index]]
+        return self.items[index].view()
+
+    def __iter__(self) -> Iterator[Any]:
+        return (item.view() for item in self.items)
+
+
+class CompactPCB:
+    """
+    pcb with coordinates kept as int64 nanometres in arrays and shared layers and names,
+    view gives the pcb_structure dataclasses
+    """
+    __slots__ = ('layers', 'modules', 'outline', 'cutouts', 'texts', 'nets', 'net_groups')
+
+    def __init__(self, layers: List[Layer], modules: List[CompactModule], outline: List[CompactFigure],
+                 cutouts: List[List[CompactFigure]], texts: List[CompactText], nets: List[CompactNet],
+                 net_groups: List[NetGroup]):
+        self.layers: List[Layer] = layers
+        self.modules: List[CompactModule] = modules
+        self.outline: List[CompactFigure] = outline
+        self.cutouts: List[List[CompactFigure]] = cutouts
+        self.texts: List[CompactText] = texts
+        self.nets: List[CompactNet] = nets
+        self.net_groups: List[NetGroup] = net_groups
+
+    def view(self, lazy: bool = False) -> PCB:
+        """
+        gives pcb_structure dataclasses of board
+        :param lazy: modules and nets are viewed one by one while they are read and net index keeps compact nets,
+        so the whole board is never kept as dataclasses, lazy view is read only
+        :return: pcb structure
+        """
+        if lazy:
+            modules, nets, net_index = ViewList(self.modules), ViewList(self.nets), NetIndex(self.nets)
+        else:
+            modules, nets = [module.view() for module in self.modules], [net.view() for net in self.nets]
+            net_index = None
+        return PCB(layers=list(self.layers), modules=modules, edge=[edge.view() for edge in self.outline],
+                   texts=[text.view() for text in self.texts], nets=nets, net_groups=list(self.net_groups),
+                   net_index=net_index, cutouts=[[edge.view() for edge in cutout] for cutout in self.cutouts])
@@ -1,10 +1,11 @@
-from dataclasses import dataclass
-from typing import Tuple, List, Union
+from dataclasses import dataclass, field
+from typing import Tuple, List, Union, Dict, Optional
 from enum import Enum
 
 
 Coords = List[str]
 FpFigure = Union['FpArc', 'FpPoly', 'FpLine', 'FpCircle']
+Contour = List[Union['FpLine', 'FpArc']]
 
 
 class TextType(Enum):
@@ -21,7 +22,7 @@ class PadType(Enum):
     custom = 3
 
 
-@dataclass
+@dataclass(frozen=True)
 class Layer:
     name: str
     layer_type: str
@@ -134,12 +135,43 @@ class Net:
     group: str = ""
 
 
+@dataclass
+class NetIndex:
+    nets: List[Net]
+    by_id: Dict[float, Net] = field(default_factory=dict, repr=False)
+    by_name: Dict[str, Net] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        for net in self.nets:
+            # the first net wins when ids or names repeat, as lookups by list scan did
+            self.by_id.setdefault(float(net.net_id), net)
+            self.by_name.setdefault(net.net_name, net)
+
+    def get_by_id(self, net_id: Union[str, float]) -> Optional[Net]:
+        return self.by_id.get(float(net_id))
+
+    def get_by_name(self, net_name: str) -> Optional[Net]:
+        return self.by_name.get(net_name)
+
+    def by_group(self) -> Dict[str, List[Net]]:
+        groups: Dict[str, List[Net]] = dict()
+        for net in self.nets:
+            groups.setdefault(net.group, []).append(net)
+        return groups
+
+
 @dataclass
 class PCB:
     layers: List[Layer]
     modules: List[Module]
-    edge: List[Union[FpLine, FpArc]]
+    edge: Contour
     texts: List[FpText]
     nets: List[Net]
     net_groups: List[NetGroup]
+    net_index: Optional[NetIndex] = None
+    cutouts: List[Contour] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.net_index is None:
+            self.net_index = NetIndex(self.nets)
 
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Any, ContextManager
+
+
+profile_formats = ['json', 'chrome']
+
+
+@dataclass
+class Stage:
+    name: str
+    depth: int
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak: int = 0
+    allocated: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+class Profiler:
+    """
+    records wall time, cpu time, traced memory peak and element counts of nested stages,
+    peak of stage includes peaks of its nested stages
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.stages: List[Stage] = list()
+        self.origin = time.perf_counter()
+        self.stack: List[Stage] = list()
+        self.child_peaks: List[int] = list()
+        self.started_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def close(self):
+        """
+        stops memory tracing if it was started by profiler
+        :return:
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str, **counts: int):
+        record = Stage(name=name, depth=len(self.stack), start=time.perf_counter() - self.origin, counts=counts)
+        self.stages.append(record)
+        current = 0
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.child_peaks:
+                self.child_peaks[-1] = max(self.child_peaks[-1], peak)
+            tracemalloc.reset_peak()
+        self.stack.append(record)
+        self.child_peaks.append(0)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record.counts
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            self.stack.pop()
+            child_peak = self.child_peaks.pop()
+            if self.memory:
+                end, peak = tracemalloc.get_traced_memory()
+                record.peak = max(peak, child_peak)
+                record.allocated = end - current
+
+    def get_stage(self, name: str) -> Optional[Stage]:
+        return next((stage for stage in self.stages if stage.name == name), None)
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [asdict(stage) for stage in self.stages]
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        gets stages as complete events of chrome trace format, memory and counts go to event args
+        :return: trace data
+        """
+        events = list()
+        for stage in self.stages:
+            args: Dict[str, Any] = dict(cpu=stage.cpu, **stage.counts)
+            if self.memory:
+                args.update(peak=stage.peak, allocated=stage.allocated)
+            events.append({'name': stage.name, 'ph': 'X', 'ts': stage.start * 1e6, 'dur': stage.wall * 1e6,
+                           'pid': os.getpid(), 'tid': 0, 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename: str, trace_format: str = 'json', **info: Any):
+        """
+        writes stages to file
+        :param filename: name of file
+        :param trace_format: json for list of stages or chrome for chrome trace events
+        :param info: values to add to json results
+        :return:
+        """
+        if trace_format == 'chrome':
+            data = self.to_chrome_trace()
+        elif trace_format == 'json':
+            data = dict(info, memory=self.memory, stages=self.to_json())
+        else:
+            raise ValueError('Unknown profile format %s' % trace_format)
+        with open(filename, 'w') as file:
+            json.dump(data, file, indent=1)
+
+
+def stage(profiler: Optional[Profiler], name: str, **counts: int) -> ContextManager[Dict[str, int]]:
+    """
+    opens stage of profiler, does nothing if profiler is not set
+    :param profiler: profiler or None
+    :param name: name of stage
+    :param counts: element counts known before stage
+    :return: context manager giving dict to add element counts
+    """
+    if profiler is None:
+        return nullcontext(counts)
+    return profiler.stage(name, **counts)
@@ -0,0 +1,363 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import statistics
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import converter
+import kicad_parse
+
+# latencies of last requests kept for percentiles
+LATENCY_WINDOW = 1000
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ConversionTimeout(Exception):
+    pass
+
+
+class ConversionFailed(Exception):
+    pass
+
+
+def get_peak_memory() -> int:
+    """
+    gets peak resident memory of this process
+    :return: size in bytes, 0 if not known
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_worker(connection: Connection, settings: Dict[str, Any], skip_unused: bool, memory_limit: Optional[int]):
+    """
+    converts boards received from connection until it is closed, sends back result with peak memory of worker,
+    memory is None if conversion failed with MemoryError
+    :param connection: worker end of pipe
+    :param settings: config settings
+    :param skip_unused: skip subtrees never emitted to topor while parsing
+    :param memory_limit: max size of heap in bytes, allocations above it fail with MemoryError, not limited if not set
+    :return:
+    """
+    if memory_limit and resource is not None and hasattr(resource, 'RLIMIT_DATA'):
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+    # converter messages are not needed by clients
+    sys.stdout = open(os.devnull, 'w')
+    fst = converter.Converter(settings, skip_unused)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        content, name = request
+        del request
+        try:
+            result = True, fst.convert(content, name)
+        except MemoryError:
+            result = False, None
+        except Exception as e:
+            result = False, '%s: %s' % (type(e).__name__, e)
+        # sent after traceback with frames of failed conversion is released
+        del content
+        if result[1] is None:
+            # worker is replaced as its heap may be left fragmented
+            connection.send((False, 'MemoryError: board needs more memory than worker limit', None))
+        else:
+            connection.send((*result, get_peak_memory()))
+        del result
+
+
+@dataclass
+class Worker:
+    process: multiprocessing.Process
+    connection: Connection
+    requests: int = 0
+
+
+@dataclass
+class Metrics:
+    requests: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    timeouts: int = 0
+    recycled: int = 0
+    latencies: Deque[float] = field(default_factory=lambda: collections.deque(maxlen=LATENCY_WINDOW))
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, status: int, bytes_in: int, bytes_out: int, latency: float):
+        with self.lock:
+            self.requests += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.latencies.append(latency)
+
+    def get_percentiles(self) -> Dict[str, float]:
+        """
+        gets latency percentiles of last requests
+        :return: p50, p90 and p99 in seconds, empty if there were no requests
+        """
+        with self.lock:
+            latencies = list(self.latencies)
+        if not latencies:
+            return dict()
+        if len(latencies) == 1:
+            return {'p50': latencies[0], 'p90': latencies[0], 'p99': latencies[0]}
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {'p50': cuts[49], 'p90': cuts[89], 'p99': cuts[98]}
+
+
+class WorkerPool:
+    """
+    keeps pre-forked worker processes with converter imported, every worker converts one board at a time,
+    requests wait for idle worker in bounded queue and are rejected when it is full,
+    worker running longer than timeout is killed and worker exceeding memory limit is replaced after request
+    """
+
+    def __init__(self, workers: int = 2, settings: Optional[Dict[str, Any]] = None, skip_unused: bool = False,
+                 timeout: float = 30, memory_limit: Optional[int] = None, max_queue: int = 16,
+                 queue_timeout: float = 10):
+        self.size = workers
+        self.settings = dict(settings or {})
+        self.skip_unused = skip_unused
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.metrics = Metrics()
+        self.waiting = 0
+        self.lock = threading.Lock()
+        # workers are forked from server process started before request threads with converter imported
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self.context = multiprocessing.get_context('forkserver')
+            self.context.set_forkserver_preload(['converter'])
+        else:
+            self.context = multiprocessing.get_context('spawn')
+        self.idle: 'queue.Queue[Worker]' = queue.Queue()
+        for _ in range(workers):
+            self.idle.put(self.start_worker())
+
+    def start_worker(self) -> Worker:
+        parent, child = self.context.Pipe()
+        process = self.context.Process(target=run_worker, args=(child, self.settings, self.skip_unused,
+                                                                self.memory_limit), daemon=True)
+        process.start()
+        child.close()
+        return Worker(process=process, connection=parent)
+
+    def replace_worker(self, worker: Worker) -> Worker:
+        worker.process.kill()
+        worker.process.join()
+        worker.connection.close()
+        with self.metrics.lock:
+            self.metrics.recycled += 1
+        return self.start_worker()
+
+    def convert(self, content: bytes, name: str = 'board.kicad_pcb') -> bytes:
+        """
+        converts board in idle worker
+        :param content: content of kicad pcb file, plain, gzip or xz
+        :param name: board name written to document header
+        :return: fst document
+        """
+        with self.lock:
+            if self.waiting >= self.max_queue and self.idle.empty():
+                raise ServiceBusy('%i requests are waiting for workers' % self.waiting)
+            self.waiting += 1
+        try:
+            worker = self.idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise ServiceBusy('no worker got idle in %.1f s' % self.queue_timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        try:
+            try:
+                worker.connection.send((content, name))
+            except OSError:
+                worker = self.replace_worker(worker)
+                raise ConversionFailed('worker exited before conversion')
+            worker.requests += 1
+            if not worker.connection.poll(self.timeout):
+                with self.metrics.lock:
+                    self.metrics.timeouts += 1
+                worker = self.replace_worker(worker)
+                raise ConversionTimeout('conversion took longer than %.1f s' % self.timeout)
+            try:
+                ok, result, memory = worker.connection.recv()
+            except (EOFError, OSError):
+                worker = self.replace_worker(worker)
+                raise ConversionFailed('worker exited during conversion')
+            if memory is None or self.memory_limit and memory > self.memory_limit:
+                worker = self.replace_worker(worker)
+            if not ok:
+                raise ConversionFailed(result)
+            return result
+        finally:
+            self.idle.put(worker)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.metrics.lock:
+            metrics = {'workers': self.size, 'busy': self.size - self.idle.qsize(), 'queue_depth': self.waiting,
+                       'requests': self.metrics.requests,
+                       'statuses': {str(status): count for status, count in sorted(self.metrics.statuses.items())},
+                       'bytes_in': self.metrics.bytes_in, 'bytes_out': self.metrics.bytes_out,
+                       'timeouts': self.metrics.timeouts, 'recycled': self.metrics.recycled}
+        metrics['latency'] = self.metrics.get_percentiles()
+        return metrics
+
+    def close(self):
+        for _ in range(self.size):
+            worker = self.idle.get()
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.connection.close()
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """
+    POST /convert with board as body returns fst document, GET /metrics returns pool metrics as json
+    """
+    server: 'ConversionServer'
+    # time to wait for request body
+    timeout = 30
+
+    def send_body(self, status: int, body: bytes, content_type: str = 'text/plain; charset=utf-8',
+                  headers: Tuple[Tuple[str, str], ...] = ()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            self.send_body(200, json.dumps(self.server.pool.get_metrics(), indent=1).encode(), 'application/json')
+        elif path == '/health':
+            self.send_body(200, b'ok')
+        else:
+            self.send_body(404, b'not found')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self.send_body(404, b'not found')
+            return
+        start = time.perf_counter()
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            status, body, headers = 411, b'Content-Length is required', ()
+            length = 0
+        elif int(length) > self.server.max_body:
+            status, body, headers = 413, b'board is larger than %i bytes' % self.server.max_body, ()
+            self.close_connection = True
+        else:
+            content = self.rfile.read(int(length))
+            name = parse_qs(url.query).get('name', ['board.kicad_pcb'])[0]
+            headers = ()
+            try:
+                status, body = 200, self.server.pool.convert(content, name)
+            except ServiceBusy as e:
+                status, body, headers = 503, str(e).encode(), (('Retry-After', '1'),)
+            except ConversionTimeout as e:
+                status, body = 504, str(e).encode()
+            except ConversionFailed as e:
+                status, body = 422, str(e).encode()
+        # recorded before reply, so clients see their requests in metrics right after response
+        self.server.pool.metrics.add(status, int(length), len(body), time.perf_counter() - start)
+        self.send_body(status, body, 'application/xml' if status == 200 else 'text/plain; charset=utf-8', headers)
+
+    def log_message(self, format: str, *args: Any):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ConversionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Any, pool: WorkerPool, max_body: int = 256 * 1024 * 1024, verbose: bool = False):
+        self.pool = pool
+        self.max_body = max_body
+        self.verbose = verbose
+        super().__init__(address, ConversionHandler)
+
+
+class UnixConversionServer(ConversionServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name, self.server_port = 'localhost', 0
+
+    def get_request(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        request, _ = self.socket.accept()
+        return request, ('local', 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves conversion of KiCad pcb files to TopoR fst files over http, '
+                                                 'POST board to /convert, GET /metrics for pool metrics')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen')
+    parser.add_argument('--socket', help='unix socket to listen instead of port')
+    parser.add_argument('--workers', type=int, default=max(1, os.cpu_count() or 1), help='number of worker processes')
+    parser.add_argument('--timeout', type=float, default=30, help='max seconds of conversion')
+    parser.add_argument('--memory-limit', type=int, help='max memory of worker in MB')
+    parser.add_argument('--max-queue', type=int, default=16, help='max number of requests waiting for worker')
+    parser.add_argument('--queue-timeout', type=float, default=10, help='max seconds to wait for worker')
+    parser.add_argument('--max-body', type=int, default=256, help='max size of board in MB')
+    parser.add_argument('--config', help='config filename, defaults are used if not set')
+    parser.add_argument('--skip-unused', action='store_true',
+                        help='skip zones, time stamps and fabrication and courtyard figures while parsing')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log requests')
+    args = parser.parse_args()
+    worker_pool = WorkerPool(args.workers, kicad_parse.get_settings(args.config) if args.config else None,
+                             args.skip_unused, args.timeout,
+                             args.memory_limit * 1024 * 1024 if args.memory_limit else None, args.max_queue,
+                             args.queue_timeout)
+    if args.socket:
+        server = UnixConversionServer(args.socket, worker_pool, args.max_body * 1024 * 1024, args.verbose)
+    else:
+        server = ConversionServer((args.host, args.port), worker_pool, args.max_body * 1024 * 1024, args.verbose)
+    print('Serving on %s with %i workers' % (args.socket or '%s:%i' % server.server_address[:2], args.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker_pool.close()
@@ -0,0 +1,222 @@
+import gzip
+import io
+import lzma
+import mmap
+import os
+import re
+from typing import List, Iterator, TextIO, BinaryIO, Union, Container, Callable, Dict, Optional, Tuple
+
+# quoted strings use the same rules as pyparsing quotedString, so the results are the same as nestedExpr gives
+QUOTED = r'''"(?:[^"\n\r\\]|""|\\(?:[^x]|x[0-9a-fA-F]+))*"|'(?:[^'\n\r\\]|''|\\(?:[^x]|x[0-9a-fA-F]+))*\''''
+TOKEN = re.compile(r'[ \t\r\n]*(?:(\()|(\))|(%s)|((?:(?!%s)[^() \t\r\n])+))' % (QUOTED, QUOTED))
+SPACES = re.compile(r'[ \t\r\n]*')
+# skipped expressions are scanned for brackets only, quoted strings are matched to skip brackets in them
+NESTING = re.compile(r'(\()|(\))|%s' % QUOTED)
+# binary streams and memory mapped files are tokenized as bytes, only tokens are decoded
+BINARY_PATTERNS = tuple(re.compile(pattern.pattern.encode()) for pattern in (TOKEN, NESTING, SPACES))
+TEXT_PATTERNS = (TOKEN, NESTING, SPACES)
+
+OPEN = '('
+CLOSE = ')'
+CHUNK_SIZE = 1 << 16
+
+SExpr = List[Union[str, 'SExpr']]
+SkipChecks = Dict[str, Callable[[SExpr], bool]]
+# compressed files are decompressed by chunks while tokenizing
+compressed_openers = {'.gz': gzip.open, '.xz': lzma.open}
+compressed_magics = {b'\x1f\x8b': gzip.GzipFile, b'\xfd7zXZ\x00': lzma.LZMAFile}
+
+
+class BufferStream:
+    """
+    gives the whole buffer as one chunk, so memory mapped file is tokenized in place without copying it
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap]):
+        self.buffer = buffer
+
+    def read(self, size: int = -1) -> Union[bytes, mmap.mmap]:
+        buffer, self.buffer = self.buffer, b''
+        return buffer
+
+
+def tokenize(stream: Union[TextIO, BinaryIO, BufferStream], chunk_size: int = CHUNK_SIZE,
+             skip_tags: Container[str] = ()) -> Iterator[str]:
+    """
+    splits s-expression text to tokens reading stream by chunks
+    :param stream: text or utf-8 binary stream with s-expressions
+    :param chunk_size: size of chunk to read
+    :param skip_tags: tags of expressions to skip, their text is scanned for brackets only
+    :return: tokens: '(', ')', quoted strings with quotes and escapes kept as is, and words
+    """
+    tail = None
+    # open bracket is held back until its tag shows if expression is skipped
+    opened = False
+    skipped = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if tail is None:
+            binary = not isinstance(chunk, str)
+            token_pattern, nesting_pattern, spaces_pattern = BINARY_PATTERNS if binary else TEXT_PATTERNS
+            newline, escape = (b'\n', b'\\') if binary else ('\n', '\\')
+            tail = chunk[:0]
+        buffer = tail + chunk if tail else chunk
+        if not chunk:
+            limit = len(buffer)
+        else:
+            # tokens never cross unescaped line breaks, so text up to the last one can be tokenized safely
+            limit = buffer.rfind(newline) + 1
+            while limit > 1 and buffer[limit - 2:limit - 1] == escape:
+                limit = buffer.rfind(newline, 0, limit - 1) + 1
+            if limit <= 0:
+                tail = buffer
+                continue
+        pos = 0
+        while pos < limit:
+            if skipped:
+                match = nesting_pattern.search(buffer, pos, limit)
+                if not match:
+                    break
+                if match.group(1):
+                    skipped += 1
+                elif match.group(2):
+                    skipped -= 1
+                pos = match.end()
+                continue
+            match = token_pattern.match(buffer, pos, limit)
+            if not match:
+                if spaces_pattern.match(buffer, pos, limit).end() == limit:
+                    break
+                raise ValueError('Unexpected symbol %r in s-expression' % buffer[pos:pos + 1])
+            pos = match.end()
+            if match.group(1):
+                token = OPEN
+            elif match.group(2):
+                token = CLOSE
+            else:
+                token = match.group(3) or match.group(4)
+                if binary:
+                    token = token.decode()
+            if opened:
+                opened = False
+                if token in skip_tags:
+                    skipped = 1
+                    continue
+                yield OPEN
+            if token == OPEN and skip_tags:
+                opened = True
+                continue
+            yield token
+        tail = buffer[limit:]
+        if not chunk:
+            if opened:
+                yield OPEN
+            if skipped:
+                raise ValueError("Unbalanced '(' in s-expression")
+            return
+
+
+def parse(stream: Union[TextIO, BinaryIO, BufferStream], chunk_size: int = CHUNK_SIZE, skip_tags: Container[str] = (),
+          skip_checks: Optional[SkipChecks] = None) -> List[SExpr]:
+    """
+    parses s-expressions from stream to nested lists in the same form as pyparsing nestedExpr().asList()
+    :param stream: text or utf-8 binary stream with s-expressions
+    :param chunk_size: size of chunk to read
+    :param skip_tags: tags of expressions to skip without building them
+    :param skip_checks: functions by tags to check built expressions, expression is dropped if function returns True
+    :return: list of top level expressions
+    """
+    result: List[SExpr] = list()
+    stack: List[SExpr] = list()
+    current: SExpr = result
+    # depths of open expressions with checked tags
+    checked: List[int] = list()
+    for token in tokenize(stream, chunk_size, skip_tags):
+        if token == OPEN:
+            stack.append(current)
+            new_list: SExpr = list()
+            current.append(new_list)
+            current = new_list
+        elif token == CLOSE:
+            if not stack:
+                raise ValueError("Unbalanced ')' in s-expression")
+            closed = current
+            current = stack.pop()
+            if checked and checked[-1] == len(stack):
+                checked.pop()
+                if skip_checks[closed[0]](closed):
+                    current.pop()
+        elif stack:
+            if skip_checks and not current and token in skip_checks:
+                checked.append(len(stack) - 1)
+            current.append(token)
+        else:
+            raise ValueError('Unexpected word %s outside of s-expression' % token)
+    if stack:
+        raise ValueError("Unbalanced '(' in s-expression")
+    return result
+
+
+def split_children(text: str) -> List[Tuple[int, int]]:
+    """
+    finds child expressions of top level expression without parsing them
+    :param text: text with one top level expression
+    :return: start and end positions of child expressions
+    """
+    spans: List[Tuple[int, int]] = list()
+    depth = 0
+    start = 0
+    for match in NESTING.finditer(text):
+        if match.group(1):
+            depth += 1
+            if depth == 2:
+                start = match.start()
+        elif match.group(2):
+            depth -= 1
+            if depth == 1:
+                spans.append((start, match.end()))
+            elif depth < 0:
+                raise ValueError("Unbalanced ')' in s-expression")
+    if depth:
+        raise ValueError("Unbalanced '(' in s-expression")
+    return spans
+
+
+def open_board(filename: str) -> TextIO:
+    """
+    opens text file, .gz and .xz files are decompressed by chunks while reading
+    :param filename: name of file
+    :return: text stream
+    """
+    opener = compressed_openers.get(os.path.splitext(filename)[1].lower(), open)
+    return opener(filename, 'rt')
+
+
+def open_bytes(data: bytes) -> BinaryIO:
+    """
+    opens board content kept in memory, gzip and xz content is found by its magic bytes and decompressed while reading
+    :param data: content of plain or compressed file
+    :return: binary stream
+    """
+    stream = io.BytesIO(data)
+    for magic, opener in compressed_magics.items():
+        if data[:len(magic)] == magic:
+            return opener(fileobj=stream)
+    return stream
+
+
+def parse_file(filename: str, skip_tags: Container[str] = (), skip_checks: Optional[SkipChecks] = None,
+               memory_map: bool = False) -> List[SExpr]:
+    """
+    parses s-expression file reading it by chunks, compressed files are decompressed while reading
+    :param filename: name of file
+    :param skip_tags: tags of expressions to skip without building them
+    :param skip_checks: functions by tags to check built expressions, expression is dropped if function returns True
+    :param memory_map: tokenize memory mapped plain file in place as bytes instead of reading it by chunks
+    :return: list of top level expressions
+    """
+    if memory_map and os.path.splitext(filename)[1].lower() not in compressed_openers and os.path.getsize(filename):
+        with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return parse(BufferStream(buffer), skip_tags=skip_tags, skip_checks=skip_checks)
+    with open_board(filename) as file:
+        return parse(file, skip_tags=skip_tags, skip_checks=skip_checks)
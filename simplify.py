@@ -0,0 +1,156 @@
+import math
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pcb_structure import *
+from pcb_compact import CompactPCB, NM_PER_MM
+
+layer_classes = ['copper', 'silk', 'other']
+
+
+def get_layer_class(layer_name: str) -> str:
+    """
+    gets class of layer to choose simplification tolerance
+    :param layer_name: name of kicad layer
+    :return: copper, silk or other
+    """
+    if 'Cu' in layer_name:
+        return 'copper'
+    if 'SilkS' in layer_name:
+        return 'silk'
+    return 'other'
+
+
+def find_farthest(xs: List[float], ys: List[float], start: int, end: int) -> Tuple[int, float]:
+    """
+    finds point between start and end farthest from line through them
+    :param xs: x coordinates of points
+    :param ys: y coordinates of points
+    :param start: index of first point of segment
+    :param end: index of last point of segment
+    :return: index of farthest point and its distance
+    """
+    x0, y0 = xs[start], ys[start]
+    dx, dy = xs[end] - x0, ys[end] - y0
+    length = math.hypot(dx, dy)
+    index, distance = start, -1.0
+    for i in range(start + 1, end):
+        px, py = xs[i] - x0, ys[i] - y0
+        current = abs(dx * py - dy * px) / length if length else math.hypot(px, py)
+        if current > distance:
+            index, distance = i, current
+    return index, distance
+
+
+def find_farthest_vectorized(xs: 'np.ndarray', ys: 'np.ndarray', start: int, end: int) -> Tuple[int, float]:
+    """
+    finds point between start and end farthest from line through them in one numpy call
+    :param xs: x coordinates of points
+    :param ys: y coordinates of points
+    :param start: index of first point of segment
+    :param end: index of last point of segment
+    :return: index of farthest point and its distance
+    """
+    x0, y0 = xs[start], ys[start]
+    dx, dy = xs[end] - x0, ys[end] - y0
+    length = math.hypot(dx, dy)
+    px = xs[start + 1:end] - x0
+    py = ys[start + 1:end] - y0
+    distances = np.abs(dx * py - dy * px) / length if length else np.hypot(px, py)
+    i = int(np.argmax(distances))
+    return start + 1 + i, float(distances[i])
+
+
+def simplify_points(points: List[Coords], tolerance: float) -> List[Coords]:
+    """
+    simplifies closed polygon with Douglas-Peucker algorithm, kept points are the same objects as given,
+    polygon is kept as is if less than 3 points are left
+    :param points: polygon points, the first point is not repeated at the end
+    :param tolerance: max distance of removed points from simplified outline in mm, 0 removes collinear points only
+    :return: points of simplified polygon
+    """
+    if len(points) <= 3:
+        return points
+    xs = [float(point[0]) for point in points] + [float(points[0][0])]
+    ys = [float(point[1]) for point in points] + [float(points[0][1])]
+    farthest = find_farthest
+    if np is not None:
+        xs, ys = np.array(xs), np.array(ys)
+        farthest = find_farthest_vectorized
+    keep = [False] * len(points)
+    keep[0] = True
+    segments = [(0, len(points))]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        index, distance = farthest(xs, ys, start, end)
+        if distance > tolerance:
+            keep[index] = True
+            segments.append((start, index))
+            segments.append((index, end))
+    result = [point for point, kept in zip(points, keep) if kept]
+    return result if len(result) >= 3 else points
+
+
+def simplify_array(points: array, tolerance: float) -> array:
+    """
+    simplifies closed polygon packed to array with simplify_points
+    :param points: x and y of polygon points in nm
+    :param tolerance: max distance of removed points from simplified outline in mm
+    :return: x and y of points of simplified polygon in nm
+    """
+    kept = simplify_points([points[i:i + 2] for i in range(0, len(points), 2)], tolerance * NM_PER_MM)
+    return array('q', [value for point in kept for value in point])
+
+
+@dataclass
+class SimplifyReport:
+    polygons: Dict[str, int] = field(default_factory=dict)
+    before: Dict[str, int] = field(default_factory=dict)
+    after: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, layer_class: str, before: int, after: int):
+        self.polygons[layer_class] = self.polygons.get(layer_class, 0) + 1
+        self.before[layer_class] = self.before.get(layer_class, 0) + before
+        self.after[layer_class] = self.after.get(layer_class, 0) + after
+
+    def report(self) -> str:
+        classes = ', '.join('%s %i polygons %i -> %i points' % (name, self.polygons[name], self.before[name],
+                                                                 self.after[name])
+                            for name in layer_classes if name in self.polygons)
+        return 'Simplify: %s' % (classes or 'no polygons')
+
+
+def simplify_pcb(pcb: CompactPCB, tolerances: Dict[str, Optional[float]]) -> SimplifyReport:
+    """
+    simplifies polygons of module figures and custom pads in place, layer classes without tolerance are kept exact
+    :param pcb: compact pcb
+    :param tolerances: tolerances in mm by layer class, copper, silk or other
+    :return: points before and after simplification by layer class
+    """
+    report = SimplifyReport()
+    for module in pcb.modules:
+        for figure in module.figures:
+            if figure.kind is FpPoly:
+                layer_class = get_layer_class(figure.layer.name)
+                tolerance = tolerances.get(layer_class)
+                if tolerance is not None:
+                    before = len(figure.points) // 2
+                    figure.points = simplify_array(figure.points, tolerance)
+                    report.add(layer_class, before, len(figure.points) // 2)
+        tolerance = tolerances.get('copper')
+        if tolerance is None:
+            continue
+        for pad in module.pads:
+            if pad.extra_points:
+                before = len(pad.extra_points) // 2
+                pad.extra_points = simplify_array(pad.extra_points, tolerance)
+                report.add('copper', before, len(pad.extra_points) // 2)
+    return report
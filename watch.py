@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import batch
+import create_topor
+import kicad_parse
+import pcb_cache
+
+
+@dataclass
+class BoardState:
+    # modification time in ns and size of board when it was checked last time
+    stat: Tuple[int, int]
+    # monotonic time of last change not converted yet
+    changed: Optional[float] = None
+    # content hash of last converted board and config
+    key: str = ''
+    # last written document with offsets of its parts
+    document: Optional[Tuple[bytes, Dict[str, List[int]]]] = None
+    # built modules and other parsed expressions of last converted board by their text
+    items: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class WatchResult:
+    filename: str
+    output: str
+    duration: float
+    latency: float
+    error: Optional[str] = None
+    log: str = ''
+
+
+class Watcher:
+    """
+    polls directories for changed boards and converts them in this process, so imports are paid once,
+    burst of saves is converted once after board stays unchanged for debounce time, last modules and documents
+    are kept in memory, unchanged expressions are not parsed again and unchanged parts are copied instead of building
+    """
+
+    def __init__(self, folders: List[str], output_dir: Optional[str] = None, config: str = 'config,ini',
+                 debounce: float = 0.5, skip_unused: bool = False, verbose: bool = False):
+        self.folders = folders
+        self.output_dir = output_dir
+        self.config = os.path.abspath(config)
+        self.debounce = debounce
+        self.skip_unused = skip_unused
+        self.verbose = verbose
+        self.boards: Dict[str, BoardState] = dict()
+        self.outputs: Dict[str, str] = dict()
+        self.config_stat: Optional[Tuple[int, int]] = None
+        self.results: List[WatchResult] = list()
+
+    def get_config_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_config_key(self) -> str:
+        try:
+            with open(self.config, 'rb') as file:
+                return hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return ''
+
+    def poll(self) -> List[str]:
+        """
+        checks boards and config for changes, boards found first time are converted if their fst files are older,
+        change of config marks all boards as changed
+        :return: boards not changed for debounce time since their last change
+        """
+        now = time.monotonic()
+        found = batch.find_boards(self.folders)
+        # outputs of the whole set in name order, so boards with equal names keep their suffixes
+        boards = sorted(found)
+        self.outputs = dict(zip(boards, batch.get_outputs(boards, self.output_dir)))
+        config_stat = self.get_config_stat()
+        if config_stat != self.config_stat:
+            if self.config_stat is not None:
+                for state in self.boards.values():
+                    state.changed = now
+            self.config_stat = config_stat
+        for filename in found:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            current = (stat.st_mtime_ns, stat.st_size)
+            state = self.boards.get(filename)
+            if state is None:
+                output = self.outputs[filename]
+                stale = not os.path.exists(output) or os.stat(output).st_mtime_ns < stat.st_mtime_ns
+                self.boards[filename] = BoardState(stat=current, changed=now if stale else None)
+            elif state.stat != current:
+                state.stat = current
+                state.changed = now
+        for filename in set(self.boards) - set(found):
+            del self.boards[filename]
+        return [filename for filename, state in self.boards.items()
+                if state.changed is not None and now - state.changed >= self.debounce]
+
+    def convert(self, filename: str) -> Optional[WatchResult]:
+        """
+        converts changed board reusing its previous expressions and parts of its previous document
+        :param filename: kicad pcb file name
+        :return: result with time from save to written fst, None if board content is the same as converted before
+        """
+        state = self.boards[filename]
+        state.changed = None
+        output = self.outputs[filename]
+        start = time.perf_counter()
+        key = pcb_cache.file_key(filename, kicad_parse.parser_version) + self.get_config_key()
+        if key == state.key and os.path.exists(output):
+            return None
+        log = io.StringIO()
+        error = None
+        with contextlib.redirect_stdout(log):
+            try:
+                pcb, state.items = kicad_parse.load_pcb_reusing(filename, state.items, self.skip_unused)
+                settings = kicad_parse.get_settings(self.config)
+                state.document = create_topor.create_topor_incremental(filename, pcb, settings, output,
+                                                                       previous_document=state.document)
+                state.key = key
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+        return WatchResult(filename=filename, output=output, duration=time.perf_counter() - start,
+                           latency=time.time() - max(state.stat[0], (self.config_stat or (0,))[0]) / 1e9,
+                           error=error, log=log.getvalue())
+
+    def report(self) -> str:
+        latencies = [result.latency for result in self.results if not result.error]
+        if not latencies:
+            return 'Converted 0 boards'
+        return 'Converted %i boards, latency from save to fst median %.2f s, max %.2f s' % \
+               (len(latencies), statistics.median(latencies), max(latencies))
+
+    def run(self, interval: float = 0.2, cycles: Optional[int] = None):
+        """
+        polls and converts boards until interrupted
+        :param interval: time between polls in seconds
+        :param cycles: number of polls, runs until interrupted if not set
+        :return:
+        """
+        try:
+            while cycles is None or cycles > 0:
+                for filename in self.poll():
+                    result = self.convert(filename)
+                    if not result:
+                        continue
+                    self.results.append(result)
+                    status = 'FAILED %s' % result.error if result.error else 'ok'
+                    print('%8.2f s  %s -> %s  latency %.2f s  %s' % (result.duration, result.filename, result.output,
+                                                                    result.latency, status))
+                    if self.verbose and result.log:
+                        print(result.log, end='')
+                if cycles is not None:
+                    cycles -= 1
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        print(self.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watches directories and converts saved KiCad pcb files to TopoR '
+                                                 'fst files')
+    parser.add_argument('folders', nargs='+', help='directories with KiCad pcb files')
+    parser.add_argument('-o', '--output-dir', help='directory for fst files, files are written next to boards '
+                                                   'by default')
+    parser.add_argument('--config', default='config,ini', help='config filename')
+    parser.add_argument('--debounce', type=float, default=0.5, help='seconds board has to stay unchanged after save')
+    parser.add_argument('--interval', type=float, default=0.2, help='seconds between checks of boards')
+    parser.add_argument('--skip-unused', action='store_true',
+                        help='skip zones, time stamps and fabrication and courtyard figures while parsing')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print converter messages for every board')
+    args = parser.parse_args()
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    watcher = Watcher(args.folders, args.output_dir, args.config, args.debounce, args.skip_unused, args.verbose)
+    watcher.run(args.interval)